@@ -15,13 +15,40 @@ early_logger = logging.getLogger("main")
 early_logger.setLevel(logging.INFO)
 
 try:
-    from api import load_new_kbtopics_api, status, webhook, database_admin, dashboard, dashboard_html
+    from api import load_new_kbtopics_api, status, webhook, database_admin, dashboard, dashboard_html, metrics
     early_logger.info("Successfully imported all API modules")
 except ImportError as e:
     early_logger.error(f"Failed to import API modules: {e}")
     raise
 import models  # noqa
 from config import Settings
+from handler.admission import admission_controller
+from handler.reactions import reactions
+from handler.rephrase_gate import rephrase_gate
+from handler.retrieval import hybrid_retrieval, speculative_retrieval
+from handler.topic_index import topic_index
+from handler.sender_registry import sender_registry
+from handler.chat_history import chat_history
+from utils.agents import agent_registry
+from utils.answer_cache import answer_cache
+from utils.context_packer import context_packer
+from utils.deadline import answer_deadline
+from utils.latency import pipeline_latency
+from utils.rate_limit import gemini_limiter, voyage_limiter, whatsapp_limiter
+from utils.embedding_cache import embedding_cache
+from ingest import (
+    BroadcastRule,
+    ChatTypeRule,
+    ChatWorkerPool,
+    IngestJournal,
+    MessageTypeRule,
+    MessageWriteBehind,
+    PayloadFilter,
+    PayloadProcessor,
+    RecentMessageIds,
+    SenderRule,
+    WebhookIngestor,
+)
 from whatsapp import WhatsAppClient
 from voyageai.client_async import AsyncClient
 
@@ -46,10 +73,29 @@ async def lifespan(app: FastAPI):
 
     app.state.settings = settings
 
+    gemini_limiter.configure(
+        settings.gemini_requests_per_minute,
+        settings.gemini_tokens_per_minute,
+        settings.gemini_max_concurrent,
+        settings.rate_limit_default_retry_after,
+    )
+    voyage_limiter.configure(
+        settings.voyage_requests_per_minute,
+        settings.voyage_tokens_per_minute,
+        settings.voyage_max_concurrent,
+        settings.rate_limit_default_retry_after,
+    )
+    whatsapp_limiter.configure(
+        settings.whatsapp_requests_per_minute,
+        0,
+        settings.whatsapp_max_concurrent,
+        settings.rate_limit_default_retry_after,
+    )
     app.state.whatsapp = WhatsAppClient(
         settings.whatsapp_host,
         settings.whatsapp_basic_auth_user,
         settings.whatsapp_basic_auth_password,
+        rate_limiter=whatsapp_limiter,
     )
 
     if settings.db_uri.startswith("postgresql://"):
@@ -74,9 +120,135 @@ async def lifespan(app: FastAPI):
     app.state.embedding_client = AsyncClient(
         api_key=settings.voyage_api_key, max_retries=settings.voyage_max_retries
     )
+
+    pipeline_latency.configure(settings.latency_window, settings.latency_history)
+    admission_controller.configure(
+        settings.answer_max_concurrent,
+        settings.answer_max_waiting,
+        settings.answer_wait_timeout,
+        settings.answer_busy_reply,
+    )
+    reactions.configure(
+        settings.reaction_mode, settings.reaction_max_concurrent, settings.reaction_max_pending
+    )
+    answer_deadline.configure(
+        settings.answer_deadline_seconds,
+        settings.answer_deadline_snippet_intro,
+        settings.answer_deadline_reply,
+        settings.answer_deadline_snippet_tokens,
+    )
+
+    embedding_cache.configure(
+        settings.embedding_cache_size,
+        settings.embedding_cache_ttl_seconds,
+        settings.embedding_cache_persist,
+    )
+    rephrase_gate.configure(
+        settings.rephrase_skip_enabled,
+        settings.rephrase_skip_min_words,
+        settings.rephrase_skip_max_words,
+    )
+    hybrid_retrieval.configure(settings.retrieval_mode == "hybrid")
+    speculative_retrieval.configure(
+        settings.speculative_retrieval_enabled,
+        settings.speculative_retrieval_min_similarity,
+    )
+    # Resolve the models and providers now rather than on the first messages
+    agent_registry.build_all()
+
+    context_packer.configure(settings.context_token_budget, settings.context_max_passage_tokens)
+    answer_cache.configure(
+        settings.answer_cache_size,
+        settings.answer_cache_max_distance,
+        settings.answer_cache_ttl_seconds,
+        settings.answer_cache_kb_check_seconds,
+    )
+    answer_cache.start(async_session)
+    topic_index.configure(
+        settings.topic_index_enabled,
+        settings.topic_index_max_topics,
+        settings.topic_index_refresh_seconds,
+    )
+    topic_index.start(async_session)
+    sender_registry.configure(settings.sender_registry_size, sender_registry.batch_size)
+    sender_registry.start(async_session, settings.sender_registry_flush_interval)
+    chat_history.configure(
+        settings.chat_history_messages,
+        settings.chat_history_max_chats,
+        settings.chat_history_ttl_seconds,
+    )
+
+    journal = None
+    if settings.ingest_journal_enabled:
+        journal = IngestJournal(
+            async_session,
+            lease_seconds=settings.ingest_journal_lease_seconds,
+            retention_hours=settings.ingest_journal_retention_hours,
+            max_attempts=settings.ingest_journal_max_attempts,
+            sweep_interval=settings.ingest_journal_sweep_interval,
+        )
+    filter_rules = [
+        BroadcastRule(settings.webhook_filter_broadcast_action),
+        SenderRule(
+            settings.webhook_filter_sender_denylist_action,
+            settings.webhook_filter_sender_denylist,
+        ),
+        MessageTypeRule(
+            settings.webhook_filter_message_types_action,
+            settings.webhook_filter_message_types,
+        ),
+        ChatTypeRule(settings.webhook_filter_group_action, groups=True),
+    ]
+    if settings.webhook_filter_sender_allowlist:
+        filter_rules.append(
+            SenderRule(
+                settings.webhook_filter_sender_allowlist_action,
+                settings.webhook_filter_sender_allowlist,
+                allow=True,
+            )
+        )
+
+    app.state.write_behind = None
+    if settings.message_write_behind_ms > 0:
+        app.state.write_behind = MessageWriteBehind(
+            async_session,
+            app.state.whatsapp,
+            app.state.embedding_client,
+            flush_interval=settings.message_write_behind_ms / 1000,
+            max_rows=settings.message_write_behind_max_rows,
+        )
+        app.state.write_behind.start()
+
+    app.state.ingestor = WebhookIngestor(
+        ChatWorkerPool(
+            PayloadProcessor(
+                async_session,
+                app.state.whatsapp,
+                app.state.embedding_client,
+                app.state.write_behind,
+            ),
+            workers=settings.webhook_workers,
+            max_queue_size=settings.webhook_queue_size,
+            coalesce_window=settings.webhook_coalesce_window,
+            coalesce_max_wait=settings.webhook_coalesce_max_wait,
+        ),
+        journal,
+        RecentMessageIds(
+            settings.webhook_dedup_cache_size, settings.webhook_dedup_ttl_seconds
+        ),
+        PayloadFilter(filter_rules),
+    )
+    app.state.ingestor.start()
     try:
         yield
     finally:
+        await app.state.ingestor.stop(settings.webhook_drain_timeout)
+        if app.state.write_behind is not None:
+            await app.state.write_behind.stop()
+        await reactions.drain()
+        await sender_registry.stop(async_session)
+        await topic_index.stop()
+        await answer_cache.stop()
         await engine.dispose()
 
 
@@ -112,6 +284,9 @@ app.include_router(dashboard.router)
 logging.info(f"Dashboard HTML router has {len(dashboard_html.router.routes)} routes")
 app.include_router(dashboard_html.router)
 
+logging.info(f"Metrics router has {len(metrics.router.routes)} routes")
+app.include_router(metrics.router)
+
 logging.info("All API routes registered successfully")
 
 # Add simple root endpoint for debugging
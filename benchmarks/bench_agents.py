@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Per-request overhead of building pydantic-ai agents.
+
+Compares building a new Agent for every call, as the handlers used to, with
+getting the shared agent from the registry. Runs use pydantic-ai's TestModel,
+so no request leaves the machine and only the local overhead is measured.
+
+Usage: python benchmarks/bench_agents.py [--number N] [--model MODEL]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+# Providers want a key at construction time, it is never used
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from pydantic_ai import Agent  # noqa: E402
+from pydantic_ai.models.test import TestModel  # noqa: E402
+
+from handler import knowledge_base_answers  # noqa: E402
+from utils.agents import MODEL_NAME, AgentRegistry  # noqa: E402
+
+PROMPTS = {
+    "rephrasing": knowledge_base_answers.REPHRASING_PROMPT,
+    "generation_with_docs": knowledge_base_answers.GENERATION_WITH_DOCS_PROMPT,
+    "generation_without_docs": knowledge_base_answers.GENERATION_WITHOUT_DOCS_PROMPT,
+}
+
+
+async def per_call(model: str, number: int) -> float:
+    test_model = TestModel()
+    started = time.perf_counter()
+    for _ in range(number):
+        # One message: a rephrase and a generation, each with a fresh agent
+        for name in ("rephrasing", "generation_with_docs"):
+            agent = Agent(model=model, system_prompt=PROMPTS[name])
+            await agent.run("How do I create an agent?", model=test_model)
+    return (time.perf_counter() - started) / number
+
+
+async def registry(model: str, number: int) -> float:
+    test_model = TestModel()
+    agents = AgentRegistry()
+    for name, prompt in PROMPTS.items():
+        agents.register(name, lambda prompt=prompt: Agent(model=model, system_prompt=prompt))
+    agents.build_all()
+
+    started = time.perf_counter()
+    for _ in range(number):
+        for name in ("rephrasing", "generation_with_docs"):
+            await agents.get(name).run("How do I create an agent?", model=test_model)
+    return (time.perf_counter() - started) / number
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument(
+        "--model",
+        default=MODEL_NAME,
+        help="Model name, newer pydantic-ai releases want a provider prefix, e.g. google:gemini-2.5-flash",
+    )
+    args = parser.parse_args()
+
+    before = await per_call(args.model, args.number)
+    after = await registry(args.model, args.number)
+    print(f"{'path':<24} {'per message':>12}")
+    print(f"{'agent per call':<24} {before * 1e3:>9.2f} ms")
+    print(f"{'agent registry':<24} {after * 1e3:>9.2f} ms")
+    print(f"saved {(before - after) * 1e3:.2f} ms per message ({before / after:.2f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Top-k latency of the in-memory topic index against the pgvector query.
+
+Random unit embeddings stand in for the knowledge base. The in-memory index is
+always measured; with --db-uri the same topics are also written to a scratch table
+with an HNSW index, queried the way `handler.retrieval` does, and dropped again.
+
+Usage: python benchmarks/bench_topic_index.py [--db-uri URI] [--sizes 1000 10000 100000] [--number N]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import numpy as np  # noqa: E402
+from pgvector.sqlalchemy import Vector  # noqa: E402
+from sqlalchemy import Column, Index, MetaData, String, Table, select, text  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine  # noqa: E402
+
+from handler.topic_index import TopicIndex  # noqa: E402
+from models import KBTopic  # noqa: E402
+
+DIMENSIONS = 1024
+LIMIT = 10
+
+
+def random_embeddings(rng: np.random.Generator, n: int) -> np.ndarray:
+    vectors = rng.standard_normal((n, DIMENSIONS), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def bench_memory(embeddings: np.ndarray, queries: np.ndarray) -> float:
+    index = TopicIndex(enabled=True, max_topics=len(embeddings))
+    index.upsert(
+        KBTopic(id=str(i), subject="", content="", source="bench", embedding=e)
+        for i, e in enumerate(embeddings)
+    )
+    index._loaded_at = time.monotonic()
+    started = time.perf_counter()
+    for query in queries:
+        index.search(query, LIMIT, max_distance=2.0)
+    return (time.perf_counter() - started) / len(queries)
+
+
+async def bench_pgvector(db_uri: str, embeddings: np.ndarray, queries: np.ndarray) -> float:
+    engine = create_async_engine(db_uri)
+    metadata = MetaData()
+    table = Table(
+        f"bench_topic_index_{len(embeddings)}",
+        metadata,
+        Column("id", String, primary_key=True),
+        Column("subject", String),
+        Column("content", String),
+        Column("source", String),
+        Column("embedding", Vector(DIMENSIONS)),
+        Index(
+            f"bench_topic_index_{len(embeddings)}_idx",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+    )
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+            await conn.run_sync(metadata.create_all)
+            for start in range(0, len(embeddings), 1000):
+                await conn.execute(
+                    table.insert(),
+                    [
+                        {"id": str(i), "subject": "", "content": "", "source": "bench", "embedding": e}
+                        for i, e in enumerate(embeddings[start : start + 1000], start)
+                    ],
+                )
+
+        async with engine.connect() as conn:
+            started = time.perf_counter()
+            for query in queries:
+                distance = table.c.embedding.cosine_distance(query)
+                nearest = (
+                    select(table.c.id, table.c.subject, table.c.content, table.c.source, distance.label("distance"))
+                    .order_by(text("distance"))
+                    .limit(LIMIT)
+                    .subquery()
+                )
+                result = await conn.execute(select(nearest).where(nearest.c.distance < 2.0))
+                result.all()
+            return (time.perf_counter() - started) / len(queries)
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.drop_all)
+        await engine.dispose()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-uri", default=os.environ.get("DB_URI"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = random_embeddings(rng, args.number)
+    print(f"{'topics':>8} {'in-memory':>12} {'pgvector':>12} {'index memory':>14}")
+    for size in args.sizes:
+        embeddings = random_embeddings(rng, size)
+        memory = bench_memory(embeddings, queries)
+        database = "-"
+        if args.db_uri:
+            database = f"{await bench_pgvector(args.db_uri, embeddings, queries) * 1e3:9.3f} ms"
+        print(
+            f"{size:>8} {memory * 1e3:9.3f} ms {database:>12} {embeddings.nbytes / 2**20:11.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
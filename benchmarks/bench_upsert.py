@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Rows/sec benchmark of message writes against a real Postgres database.
+
+Compares the previous upsert (INSERT ... ON CONFLICT DO UPDATE, then a re-SELECT)
+with the RETURNING upsert, the "changed" conflict mode on redelivered rows, and
+multi-row batches as written by the write-behind buffer.
+Rows are written under a unique prefix and deleted afterwards.
+
+Usage: python benchmarks/bench_upsert.py [--db-uri URI] [--number N] [--batch-size M]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from sqlalchemy import delete  # noqa: E402
+from sqlalchemy.dialects.postgresql import insert  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+from sqlmodel import select  # noqa: E402
+from sqlmodel.ext.asyncio.session import AsyncSession  # noqa: E402
+
+from models import Message, Sender, bulk_upsert, upsert  # noqa: E402
+
+SENDER_JID = "972500000000@s.whatsapp.net"
+
+
+async def legacy_upsert(session: AsyncSession, entity: Message):
+    # The upsert before RETURNING: write every column, then read the row back
+    values = {f.name: getattr(entity, f.name) for f in Message.__table__.columns}
+    stmt = insert(Message).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["message_id"],
+        set_={k: stmt.excluded[k] for k in values if k != "message_id"},
+    )
+    await session.exec(stmt)
+    result = await session.exec(
+        select(Message).where(Message.message_id == entity.message_id)
+    )
+    return result.first()
+
+
+def make_messages(prefix: str, n: int):
+    return [
+        Message(
+            message_id=f"{prefix}-{i}",
+            text=f"Benchmark message {i}",
+            chat_jid="120363000000000000@g.us",
+            sender_jid=SENDER_JID,
+        )
+        for i in range(n)
+    ]
+
+
+async def timed(async_session, messages, write) -> float:
+    started = time.perf_counter()
+    async with async_session() as session:
+        await write(session, messages)
+        await session.commit()
+    return len(messages) / (time.perf_counter() - started)
+
+
+def one_by_one(upsert_fn, **kwargs):
+    async def write(session, messages):
+        for message in messages:
+            await upsert_fn(session, message, **kwargs)
+
+    return write
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-uri", default=os.environ.get("DB_URI"))
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    if not args.db_uri:
+        parser.error("--db-uri or the DB_URI environment variable is required")
+
+    engine = create_async_engine(args.db_uri)
+    async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    prefix = f"bench-{uuid.uuid4().hex[:8]}"
+
+    async with async_session() as session:
+        await session.exec(
+            insert(Sender).values(jid=SENDER_JID).on_conflict_do_nothing(index_elements=["jid"])
+        )
+        await session.commit()
+
+    async def batched(session, messages):
+        for i in range(0, len(messages), args.batch_size):
+            await bulk_upsert(session, messages[i : i + args.batch_size], on_conflict="changed")
+
+    scenarios = [
+        ("legacy upsert + select", "legacy", one_by_one(legacy_upsert)),
+        ("RETURNING upsert", "returning", one_by_one(upsert)),
+        (f"write-behind batches of {args.batch_size}", "batched", batched),
+    ]
+    redeliveries = [
+        ("legacy upsert + select", "legacy", one_by_one(legacy_upsert)),
+        ("RETURNING, changed", "returning", one_by_one(upsert, on_conflict="changed")),
+        ("RETURNING, nothing", "returning", one_by_one(upsert, on_conflict="nothing")),
+    ]
+
+    try:
+        print(f"{'new rows':<34} {'rows/sec':>10}")
+        for name, key, write in scenarios:
+            rate = await timed(async_session, make_messages(f"{prefix}-{key}", args.number), write)
+            print(f"{name:<34} {rate:>10.0f}")
+
+        print(f"\n{'redelivered rows':<34} {'rows/sec':>10}")
+        for name, key, write in redeliveries:
+            rate = await timed(async_session, make_messages(f"{prefix}-{key}", args.number), write)
+            print(f"{name:<34} {rate:>10.0f}")
+    finally:
+        async with async_session() as session:
+            await session.exec(delete(Message).where(Message.message_id.startswith(prefix)))
+            await session.commit()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
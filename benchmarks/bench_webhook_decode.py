@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of webhook body decoding.
+
+Compares the previous path (decode the body for logging, json.loads, model_validate)
+with the single-pass model_validate_json path used by the webhook today.
+
+Usage: python benchmarks/bench_webhook_decode.py [--number N]
+"""
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from models.webhook import WhatsAppWebhookPayload  # noqa: E402
+
+try:
+    import orjson
+
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+TIMESTAMP = "2025-02-16T12:03:48Z"
+CONTEXT_INFO = {
+    "stanzaID": "3EB0C767D71D5F4B3C2A",
+    "participant": "972500000000@s.whatsapp.net",
+    "mentionedJID": [f"97250000{i:04d}@s.whatsapp.net" for i in range(20)],
+    "forwardingScore": 3,
+    "isForwarded": True,
+    "expiration": 604800,
+}
+
+
+def text_payload() -> dict:
+    return {
+        "from": "972500000000@s.whatsapp.net",
+        "timestamp": TIMESTAMP,
+        "pushname": "Test User",
+        "message": {"id": "3EB0C767D71D5F4B3C2A", "text": "How do I create an agent?"},
+    }
+
+
+def media_payload() -> dict:
+    return {
+        "from": "972500000000:33@s.whatsapp.net in 120363000000000000@g.us",
+        "timestamp": TIMESTAMP,
+        "pushname": "Test User",
+        "message": {"id": "3EB0C767D71D5F4B3C2B", "text": ""},
+        "image": {
+            "media_path": "statics/media/1739707428-82e94149-f7bf-4300-9621-70af93bda5a4.jpeg",
+            "mime_type": "image/jpeg",
+            "caption": "שלום " * 400,
+        },
+    }
+
+
+def list_payload() -> dict:
+    return {
+        "from": "972500000000@s.whatsapp.net",
+        "timestamp": TIMESTAMP,
+        "message": {"id": "3EB0C767D71D5F4B3C2C"},
+        "list": {
+            "title": "Choose a guide",
+            "description": "Jeen.ai documentation",
+            "buttonText": "Open",
+            "listType": 1,
+            "sections": [
+                {
+                    "title": f"Section {s}",
+                    "rows": [
+                        {
+                            "title": f"Row {s}.{r}",
+                            "description": "Interactive 2 - Extended Agent " * 4,
+                            "rowID": f"row-{s}-{r}",
+                        }
+                        for r in range(10)
+                    ],
+                }
+                for s in range(10)
+            ],
+            "contextInfo": CONTEXT_INFO,
+        },
+    }
+
+
+def order_payload() -> dict:
+    return {
+        "from": "972500000000@s.whatsapp.net",
+        "timestamp": TIMESTAMP,
+        "message": {"id": "3EB0C767D71D5F4B3C2D"},
+        "order": {
+            "orderID": "1234567890",
+            # Thumbnails arrive inline and make up most of the body
+            "thumbnail": "A" * 60_000,
+            "itemCount": 3,
+            "status": "INQUIRY",
+            "surface": "CATALOG",
+            "message": "Order for 3 items",
+            "orderTitle": "Jeen.ai seats",
+            "sellerJID": "972500000001@s.whatsapp.net",
+            "token": "AR4" * 40,
+            "totalAmount1000": 1_000_000,
+            "totalCurrencyCode": "ILS",
+            "contextInfo": CONTEXT_INFO,
+        },
+    }
+
+
+def old_path(raw_body: bytes) -> WhatsAppWebhookPayload:
+    # Mirrors the webhook before the fast path: every body decoded for the log line
+    _ = f"Raw webhook received: {raw_body.decode()[:500]}..."
+    raw_json = json.loads(raw_body)
+    _ = f"Parsed JSON keys: {list(raw_json.keys())}"
+    return WhatsAppWebhookPayload.model_validate(raw_json)
+
+
+def orjson_path(raw_body: bytes) -> WhatsAppWebhookPayload:
+    return WhatsAppWebhookPayload.model_validate(orjson.loads(raw_body))
+
+
+def new_path(raw_body: bytes) -> WhatsAppWebhookPayload:
+    return WhatsAppWebhookPayload.model_validate_json(raw_body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    payloads = {
+        "text": text_payload(),
+        "media": media_payload(),
+        "list": list_payload(),
+        "order": order_payload(),
+    }
+    paths = {"old": old_path, "model_validate_json": new_path}
+    if ORJSON_AVAILABLE:
+        paths["orjson+model_validate"] = orjson_path
+
+    print(f"{'payload':<8} {'bytes':>8} " + " ".join(f"{p:>22}" for p in paths) + f" {'speedup':>8}")
+    for name, payload in payloads.items():
+        raw_body = json.dumps(payload, ensure_ascii=False).encode()
+        # Both paths must agree before we time them
+        assert old_path(raw_body) == new_path(raw_body)
+
+        timings = {}
+        for path_name, path in paths.items():
+            best = min(
+                timeit.repeat(lambda: path(raw_body), number=args.number, repeat=5)
+            )
+            timings[path_name] = best / args.number * 1e6
+
+        print(
+            f"{name:<8} {len(raw_body):>8} "
+            + " ".join(f"{t:>19.1f} us" for t in timings.values())
+            + f" {timings['old'] / timings['model_validate_json']:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
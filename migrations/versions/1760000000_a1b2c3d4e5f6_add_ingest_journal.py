@@ -0,0 +1,45 @@
+"""Add ingest journal table for accepted webhooks
+
+Revision ID: a1b2c3d4e5f6
+Revises: def456ghi789
+Create Date: 2025-10-09 09:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a1b2c3d4e5f6"
+down_revision: Union[str, None] = "def456ghi789"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ingestentry",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("payload", sa.Text(), nullable=False),
+        sa.Column("received_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("claimed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("processed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="1"),
+    )
+
+    # Partial index so the replay sweep only ever scans unfinished entries
+    op.create_index(
+        "ingest_entry_unprocessed_idx",
+        "ingestentry",
+        ["id"],
+        unique=False,
+        postgresql_where=sa.text("processed_at IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ingest_entry_unprocessed_idx", table_name="ingestentry")
+    op.drop_table("ingestentry")
@@ -0,0 +1,37 @@
+"""Add unique message_id to the ingest journal for cross-replica dedup
+
+Revision ID: b2c3d4e5f6a7
+Revises: a1b2c3d4e5f6
+Create Date: 2025-10-09 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b2c3d4e5f6a7"
+down_revision: Union[str, None] = "a1b2c3d4e5f6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "ingestentry",
+        sa.Column("message_id", sa.String(length=255), nullable=True),
+    )
+    op.create_index(
+        "ingest_entry_message_id_idx",
+        "ingestentry",
+        ["message_id"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ingest_entry_message_id_idx", table_name="ingestentry")
+    op.drop_column("ingestentry", "message_id")
@@ -0,0 +1,31 @@
+"""Link knowledge base chunks to their parent document
+
+Revision ID: e5f6a7b8c9d0
+Revises: d4e5f6a7b8c9
+Create Date: 2025-10-09 13:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e5f6a7b8c9d0"
+down_revision: Union[str, None] = "d4e5f6a7b8c9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("kbtopic", sa.Column("document_id", sa.String(), nullable=True))
+    op.add_column("kbtopic", sa.Column("chunk_index", sa.Integer(), nullable=True))
+    op.create_index("ix_kbtopic_document_id", "kbtopic", ["document_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_kbtopic_document_id", table_name="kbtopic")
+    op.drop_column("kbtopic", "chunk_index")
+    op.drop_column("kbtopic", "document_id")
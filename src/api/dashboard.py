@@ -3,13 +3,16 @@
 Dashboard API for visualizing company documentation and topics
 """
 import logging
-from typing import Annotated, Dict, Any, List
+from typing import Annotated, Dict, Any, List, Literal
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel import select, desc, func
+from voyageai.client_async import AsyncClient
 
+from handler.retrieval import search_topics
 from models import KBTopic
-from .deps import get_db_async_session
+from utils.embedding_cache import embedding_cache
+from .deps import get_db_async_session, get_text_embebedding
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -137,13 +140,35 @@ async def get_dashboard_stats(
         raise HTTPException(status_code=500, detail=f"Stats query failed: {str(e)}")
 
 @router.get("/dashboard/search")
-async def search_topics(
+async def search_dashboard_topics(
     session: Annotated[AsyncSession, Depends(get_db_async_session)],
+    embedding_client: Annotated[AsyncClient, Depends(get_text_embebedding)],
     q: str = Query(..., description="Search query"),
-    limit: int = Query(default=10, le=50)
+    limit: int = Query(default=10, le=50),
+    mode: Literal["text", "semantic"] = Query(default="text", description="Substring or embedding search"),
 ) -> Dict[str, Any]:
     """Search through topics/documents for dashboard."""
     try:
+        if mode == "semantic":
+            # Same retrieval as the answering pipeline, without a relevance threshold
+            embedding = await embedding_cache.embed(embedding_client, q, session)
+            hits = await search_topics(session, embedding, limit, max_distance=2.0)
+            return {
+                "query": q,
+                "results": [
+                    {
+                        "id": hit.id,
+                        "subject": hit.subject,
+                        "content": hit.content[:200] + "..." if len(hit.content) > 200 else hit.content,
+                        "source": hit.source,
+                        "relevance": round(1.0 - hit.distance, 4),
+                    }
+                    for hit in hits
+                ],
+                "total_results": len(hits),
+                "has_more": len(hits) == limit,
+            }
+
         # Simple text search (can be enhanced with full-text search later)
         query = select(KBTopic).where(
             (KBTopic.subject.ilike(f"%{q}%")) | 
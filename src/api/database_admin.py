@@ -11,6 +11,10 @@ from sqlalchemy.ext.asyncio import AsyncEngine
 import models  # Import models to ensure metadata is populated
 from models import KBTopic, Message, Sender  # Explicit imports to ensure all models are registered
 
+from handler.chat_history import chat_history
+from handler.sender_registry import sender_registry
+from handler.topic_index import topic_index
+from utils.answer_cache import answer_cache
 from .deps import get_db_async_session
 
 router = APIRouter()
@@ -154,6 +158,10 @@ async def fix_database_schema(
             raise HTTPException(status_code=500, detail=f"Schema creation failed: {str(schema_error)}")
             
         logger.info("Database schema fixed successfully")
+        topic_index.clear()
+        chat_history.clear()
+        sender_registry.clear()
+        answer_cache.bump_kb_version()
         
         return {
             "status": "success",
@@ -189,6 +197,10 @@ async def clear_database_data(
                 logger.warning(f"Could not clear {table}: {e}")
         
         await session.commit()
+        topic_index.clear()
+        chat_history.clear()
+        sender_registry.clear()
+        answer_cache.bump_kb_version()
         
         return {
             "status": "success", 
@@ -4,6 +4,7 @@ from fastapi import Depends, Request
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from handler import MessageHandler
+from ingest import WebhookIngestor
 from whatsapp import WhatsAppClient
 from voyageai.client_async import AsyncClient
 
@@ -29,6 +30,11 @@ def get_text_embebedding(request: Request) -> AsyncClient:
     return request.app.state.embedding_client
 
 
+def get_ingestor(request: Request) -> WebhookIngestor:
+    assert request.app.state.ingestor, "Webhook ingestor not initialized"
+    return request.app.state.ingestor
+
+
 async def get_handler(
     session: Annotated[AsyncSession, Depends(get_db_async_session)],
     whatsapp: Annotated[WhatsAppClient, Depends(get_whatsapp)],
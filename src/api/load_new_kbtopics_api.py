@@ -1,6 +1,6 @@
 import logging
 from typing import Annotated, Dict, Any
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from load_new_kbtopics import topicsLoader
@@ -57,6 +57,7 @@ async def load_company_documentation_api(
 
 @router.post("/process_all_documentation")
 async def process_all_documentation_api(
+    request: Request,
     session: Annotated[AsyncSession, Depends(get_db_async_session)],
     embedding_client: Annotated[AsyncClient, Depends(get_text_embebedding)],
 ) -> Dict[str, Any]:
@@ -70,8 +71,13 @@ async def process_all_documentation_api(
         from document_processor import process_and_upload_documents
         
         # Process and upload all documents
+        settings = request.app.state.settings
         loaded_count = await process_and_upload_documents(
-            embedding_client, session, "documentation"
+            embedding_client,
+            session,
+            "documentation",
+            settings.document_chunk_tokens,
+            settings.document_chunk_overlap_tokens,
         )
 
         logger.info(f"Documentation processing completed. Loaded {loaded_count} documents.")
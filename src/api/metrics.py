@@ -0,0 +1,62 @@
+from typing import Annotated, Any, Dict, List
+
+from fastapi import APIRouter, Depends, Query, Request
+
+from handler.admission import admission_controller
+from handler.chat_history import chat_history
+from handler.reactions import reactions
+from handler.rephrase_gate import rephrase_gate
+from handler.retrieval import hybrid_retrieval, speculative_retrieval
+from handler.sender_registry import sender_registry
+from handler.topic_index import topic_index
+from ingest import WebhookIngestor
+from utils.answer_cache import answer_cache
+from utils.context_packer import context_packer
+from utils.deadline import answer_deadline
+from utils.embedding_cache import embedding_cache
+from utils.latency import pipeline_latency
+from utils.rate_limit import gemini_limiter, voyage_limiter, whatsapp_limiter
+
+from .deps import get_ingestor
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def metrics(
+    request: Request,
+    ingestor: Annotated[WebhookIngestor, Depends(get_ingestor)],
+) -> Dict[str, Any]:
+    """Runtime counters of the message processing pipeline."""
+    write_behind = getattr(request.app.state, "write_behind", None)
+    return {
+        "ingest": ingestor.stats(),
+        "admission": admission_controller.stats(),
+        "deadline": answer_deadline.stats(),
+        "reactions": reactions.stats(),
+        "senders": sender_registry.stats(),
+        "chat_history": chat_history.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "context": context_packer.stats(),
+        "rephrase_gate": rephrase_gate.stats(),
+        "speculative_retrieval": speculative_retrieval.stats(),
+        "hybrid_retrieval": hybrid_retrieval.stats(),
+        "topic_index": topic_index.stats(),
+        "write_behind": write_behind.stats() if write_behind is not None else None,
+        "rate_limits": {
+            limiter.name: limiter.stats()
+            for limiter in (gemini_limiter, voyage_limiter, whatsapp_limiter)
+        },
+        "latency": pipeline_latency.stats(),
+    }
+
+
+@router.get("/metrics/requests")
+async def recent_requests(
+    stage: str | None = Query(default=None, description="Only requests where this stage was slow"),
+    min_seconds: float = Query(default=0.0, ge=0.0),
+    limit: int = Query(default=50, le=500),
+) -> List[Dict[str, Any]]:
+    """Stage timings of the latest answered messages, newest first."""
+    return pipeline_latency.recent(stage, min_seconds, limit)
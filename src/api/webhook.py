@@ -1,13 +1,25 @@
-from typing import Annotated
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Annotated, Dict, List
 
 from fastapi import APIRouter, Depends, Request, HTTPException
-from pydantic import ValidationError
+from pydantic import TypeAdapter, ValidationError
+from sqlmodel.ext.asyncio.session import AsyncSession
 from starlette.requests import ClientDisconnect
 
-from api.deps import get_handler
+from api.deps import get_db_async_session, get_handler, get_ingestor
 from handler import MessageHandler
+from ingest import FilterAction, IngestJournal, WebhookIngestor
 from models.webhook import WhatsAppWebhookPayload
 
+try:
+    import orjson  # Faster JSON parsing when available
+
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Create router for webhook endpoints
 router = APIRouter(tags=["webhook"])
 
@@ -22,51 +34,143 @@ async def webhook_health() -> dict:
     logger.info("Webhook health check accessed")
     return {"status": "ok", "message": "Webhook is accessible"}
 
+def _log_raw_body(raw_body: bytes, sample_rate: float):
+    """Log a sample of raw webhook bodies, decoding only the ones that are actually logged"""
+    if random.random() < sample_rate and logger.isEnabledFor(logging.INFO):
+        logger.info(
+            f"Raw webhook received: {raw_body[:500].decode(errors='replace')}..."
+        )
+
+
+def _top_level_keys(raw_body: bytes) -> List[str]:
+    """Best effort list of the top level keys of a body that failed validation"""
+    try:
+        parsed = orjson.loads(raw_body) if ORJSON_AVAILABLE else json.loads(raw_body)
+    except ValueError:
+        return []
+    return list(parsed.keys()) if isinstance(parsed, dict) else []
+
+
 @router.post("/webhook")
 async def webhook(
     request: Request,
-    handler: Annotated[MessageHandler, Depends(get_handler)],
+    ingestor: Annotated[WebhookIngestor, Depends(get_ingestor)],
 ) -> str:
     """
     WhatsApp webhook endpoint for receiving incoming messages.
+    The payload is validated, written to the ingest journal and queued for the background
+    workers, so the gateway gets its acknowledgement without waiting for the answer pipeline.
     Returns:
         Simple "ok" response to acknowledge receipt
     """
     raw_body = None
     try:
-        # Get raw JSON first for logging
         raw_body = await request.body()
-        logger.info(f"Raw webhook received: {raw_body.decode()[:500]}...")
-        
-        # Parse JSON manually first
-        import json
-        raw_json = json.loads(raw_body)
-        logger.info(f"Parsed JSON keys: {list(raw_json.keys())}")
-        
-        # Now try to validate with Pydantic
-        payload = WhatsAppWebhookPayload.model_validate(raw_json)
-        
-        logger.info(f"Webhook validated - From: {payload.from_}, Message ID: {getattr(payload.message, 'id', 'N/A') if payload.message else 'No message'}, Text: {getattr(payload.message, 'text', 'N/A')[:100] if payload.message else 'No message'}...")
-        
+        _log_raw_body(raw_body, request.app.state.settings.webhook_body_log_sample_rate)
+
+        # Parse and validate straight from the raw bytes in a single pass
+        payload = WhatsAppWebhookPayload.model_validate_json(raw_body)
+
+        message_id = payload.message.id if payload.message else None
+        logger.info(f"Webhook validated - From: {payload.from_}, Message ID: {message_id}")
+
         # Only process messages that have a sender (from_ field)
         if payload.from_:
-            logger.info(f"Processing message from {payload.from_}")
-            await handler(payload)
+            if not await ingestor.accept(payload, raw_body):
+                logger.info("Webhook was filtered out or is a redelivery, skipping processing")
         else:
             logger.warning("Webhook payload missing from_ field, skipping processing")
 
         return "ok"
-        
+
     except ClientDisconnect:
         logger.warning("Client disconnected during webhook processing")
         return "ok"  # Still return ok to avoid webhook retries
     except ValidationError as e:
         logger.error(f"Webhook validation error: {e}")
         if raw_body:
-            logger.error(f"Raw body that failed validation: {raw_body.decode()}")
+            logger.error(f"Keys of body that failed validation: {_top_level_keys(raw_body)}")
+            logger.error(f"Raw body that failed validation: {raw_body.decode(errors='replace')}")
         return "ok"  # Still return ok to avoid webhook retries
     except Exception as e:
         logger.error(f"Webhook processing error: {e}")
         if raw_body:
-            logger.error(f"Raw body: {raw_body.decode()}")
+            logger.error(f"Raw body: {raw_body.decode(errors='replace')}")
         return "ok"  # Still return ok to avoid webhook retries
+
+
+_batch_adapter = TypeAdapter(List[WhatsAppWebhookPayload])
+
+
+@router.post("/webhook/batch")
+async def webhook_batch(
+    request: Request,
+    session: Annotated[AsyncSession, Depends(get_db_async_session)],
+    handler: Annotated[MessageHandler, Depends(get_handler)],
+    ingestor: Annotated[WebhookIngestor, Depends(get_ingestor)],
+    backfill: bool = False,
+) -> Dict[str, int]:
+    """
+    Ingest an array of webhook payloads at once, for backfills and gateway catch-up.
+    The payload filter, redelivery checks and ingest journal apply as for single
+    webhooks. All senders and messages are written with a few multi-row statements,
+    then only recent private text messages are queued to be answered: with `backfill`,
+    or once older than `webhook_batch_answer_max_age_seconds`, messages are only stored.
+    """
+    raw_body = await request.body()
+    try:
+        payloads = _batch_adapter.validate_json(raw_body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_input=False))
+
+    max_age = timedelta(seconds=request.app.state.settings.webhook_batch_answer_max_age_seconds)
+    answer_after = datetime.now(timezone.utc) - max_age
+    kept, store_only_ids = [], set()
+    for payload in payloads:
+        if not payload.from_:
+            continue
+        action = ingestor.classify(payload)
+        if action == FilterAction.DROP:
+            continue
+        if payload.message and (
+            action == FilterAction.STORE_ONLY
+            or backfill
+            or _aware(payload.timestamp) < answer_after
+        ):
+            store_only_ids.add(payload.message.id)
+        kept.append(payload)
+
+    accepted = await ingestor.journal_batch(kept)
+    messages = await handler.store_messages([payload for payload, _ in accepted])
+    to_answer = [
+        message
+        for message in messages
+        if message.message_id not in store_only_ids and MessageHandler.should_answer(message)
+    ]
+    # Entries that won't be answered are done once their messages are stored
+    answered_ids = {message.message_id for message in to_answer}
+    done = [
+        journal_id
+        for payload, journal_id in accepted
+        if journal_id is not None and payload.message.id not in answered_ids
+    ]
+    if done:
+        await IngestJournal.mark_processed(session, done)
+    # Make the messages visible before the workers look up the chat history
+    await session.commit()
+
+    journal_ids = {
+        payload.message.id: journal_id for payload, journal_id in accepted if journal_id is not None
+    }
+    for message in to_answer:
+        await ingestor.submit_stored(message, journal_ids.get(message.message_id))
+
+    logger.info(
+        f"Batch webhook: {len(payloads)} payloads, {len(messages)} stored, {len(to_answer)} queued"
+    )
+    return {"received": len(payloads), "stored": len(messages), "queued": len(to_answer)}
+
+
+def _aware(timestamp: datetime) -> datetime:
+    # Gateway timestamps without an offset are UTC
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
@@ -1,5 +1,5 @@
 from os import environ
-from typing import Optional, Self
+from typing import List, Literal, Optional, Self
 
 from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -24,6 +24,127 @@ class Settings(BaseSettings):
     voyage_api_key: str
     voyage_max_retries: int = 5
 
+    # Client-side rate limits per provider, shared by the whole process; 0 disables a limit
+    gemini_requests_per_minute: int = 1000
+    gemini_tokens_per_minute: int = 1_000_000
+    gemini_max_concurrent: int = 20
+    voyage_requests_per_minute: int = 2000
+    voyage_tokens_per_minute: int = 3_000_000
+    voyage_max_concurrent: int = 10
+    whatsapp_requests_per_minute: int = 600
+    whatsapp_max_concurrent: int = 10
+    # Pause after a 429 that didn't say for how long
+    rate_limit_default_retry_after: float = 5.0
+
+    # Webhook processing settings
+    webhook_workers: int = 32
+    webhook_queue_size: int = 1000
+    webhook_drain_timeout: float = 30.0
+    # Quiet time to wait for before answering a chat, so a question split over
+    # several quick messages is answered once. Every answer waits at least the
+    # window, so coalescing is opt-in: 0 disables it.
+    webhook_coalesce_window: float = 0.0
+    webhook_coalesce_max_wait: float = 5.0
+    # Older messages of a /webhook/batch are only stored, not answered
+    webhook_batch_answer_max_age_seconds: float = 300.0
+    webhook_dedup_cache_size: int = 10000
+    webhook_dedup_ttl_seconds: float = 3600.0
+    # Fraction of raw webhook bodies written to the log
+    webhook_body_log_sample_rate: float = 0.01
+
+    # Filters applied to webhooks before they reach the database. Each action is
+    # "drop" (never stored), "store_only" (stored but not answered) or "pass".
+    webhook_filter_group_action: Literal["pass", "store_only", "drop"] = "store_only"
+    webhook_filter_broadcast_action: Literal["pass", "store_only", "drop"] = "drop"
+    webhook_filter_sender_denylist: List[str] = []
+    webhook_filter_sender_denylist_action: Literal["pass", "store_only", "drop"] = "drop"
+    # When set, messages of any other sender get the allowlist action
+    webhook_filter_sender_allowlist: List[str] = []
+    webhook_filter_sender_allowlist_action: Literal["pass", "store_only", "drop"] = "store_only"
+    webhook_filter_message_types: List[str] = ["reaction"]
+    webhook_filter_message_types_action: Literal["pass", "store_only", "drop"] = "drop"
+
+    # Group commit of store-only messages every N ms or M rows, 0 ms writes them inline
+    message_write_behind_ms: int = 0
+    message_write_behind_max_rows: int = 500
+
+    # Process-local cache of known senders, push name changes are written in the background
+    sender_registry_size: int = 10000
+    sender_registry_flush_interval: float = 5.0
+
+    # Latest messages kept in memory per chat, for the most recently active chats
+    chat_history_messages: int = 7
+    chat_history_max_chats: int = 1000
+    # Buffered chats are read again after this long, to see other replicas' messages; 0 never
+    chat_history_ttl_seconds: float = 10.0
+
+    # Query embedding cache, optionally persisted in Postgres to survive restarts
+    embedding_cache_size: int = 2048
+    embedding_cache_ttl_seconds: float = 7 * 24 * 3600
+    embedding_cache_persist: bool = True
+
+    # Skip the rephrasing agent for short, self-contained English questions
+    rephrase_skip_enabled: bool = True
+    rephrase_skip_min_words: int = 3
+    rephrase_skip_max_words: int = 20
+
+    # Search with the raw message while rephrasing, its results are reused when the
+    # rephrased query embeds at least this close to it
+    speculative_retrieval_enabled: bool = True
+    speculative_retrieval_min_similarity: float = 0.9
+
+    # "vector", or "hybrid" to fuse vector and full-text search results
+    retrieval_mode: Literal["vector", "hybrid"] = "vector"
+
+    # In-memory vector index of the knowledge base, pgvector answers when it is
+    # disabled, stale or the knowledge base has more than max_topics topics
+    topic_index_enabled: bool = False
+    topic_index_max_topics: int = 20000
+    topic_index_refresh_seconds: float = 300.0
+
+    # Size of the chunks documentation files are split into, in estimated tokens
+    document_chunk_tokens: int = 400
+    document_chunk_overlap_tokens: int = 50
+
+    # Estimated tokens of documentation in the generation prompt, 0 sends whole topics
+    context_token_budget: int = 3000
+    context_max_passage_tokens: int = 150
+
+    # Semantic answer cache, 0 entries disables it
+    answer_cache_size: int = 1000
+    answer_cache_max_distance: float = 0.05
+    answer_cache_ttl_seconds: float = 24 * 3600
+    # How often the knowledge base is checked for changes made by other replicas
+    answer_cache_kb_check_seconds: float = 30.0
+
+    # Latency percentiles cover the last N samples per stage, the last M requests are kept
+    latency_window: int = 2048
+    latency_history: int = 200
+
+    # Answer pipeline admission control
+    answer_max_concurrent: int = 10
+    answer_max_waiting: int = 20
+    answer_wait_timeout: float = 45.0
+    answer_busy_reply: str = "We're handling a lot of questions right now. Please try again in a few minutes 🙏"
+
+    # Acknowledgement reactions, sent in the background: "none", "start" (💬) or "start_finish" (💬 then ✅)
+    reaction_mode: Literal["none", "start", "start_finish"] = "start_finish"
+    reaction_max_concurrent: int = 4
+    reaction_max_pending: int = 200
+
+    # Time budget of one answer, LLM retries stop when it runs out and a fallback is sent
+    answer_deadline_seconds: float = 60.0
+    answer_deadline_snippet_intro: str = "I couldn't put an answer together in time, but this from the documentation should help:"
+    answer_deadline_reply: str = "Sorry, I couldn't answer in time. Please try asking again in a moment 🙏"
+    answer_deadline_snippet_tokens: int = 200
+
+    # Ingest journal settings
+    ingest_journal_enabled: bool = True
+    ingest_journal_lease_seconds: float = 300.0
+    ingest_journal_retention_hours: float = 24.0
+    ingest_journal_max_attempts: int = 5
+    ingest_journal_sweep_interval: float = 60.0
+
     # Optional settings
     debug: bool = False
     log_level: str = "INFO"
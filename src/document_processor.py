@@ -11,6 +11,8 @@ from pathlib import Path
 from typing import List, Dict, Any, Optional
 import asyncio
 
+from utils.chunking import PAGE_BREAK, chunk_document
+
 # Document processing libraries
 try:
     import docx  # python-docx for .docx files
@@ -41,12 +43,27 @@ class DocumentProcessor:
             
         try:
             doc = docx.Document(file_path)
-            paragraphs = [paragraph.text for paragraph in doc.paragraphs if paragraph.text.strip()]
+            paragraphs = [
+                self._docx_heading_prefix(paragraph) + paragraph.text
+                for paragraph in doc.paragraphs
+                if paragraph.text.strip()
+            ]
             return "\n".join(paragraphs)
         except Exception as e:
             logger.error(f"Error reading DOCX {file_path}: {e}")
             return ""
     
+    @staticmethod
+    def _docx_heading_prefix(paragraph) -> str:
+        """Markdown prefix of heading paragraphs, so the chunker can split on them."""
+        style = paragraph.style.name if paragraph.style is not None else ""
+        if style == "Title":
+            return "# "
+        if style.startswith("Heading"):
+            level = style.removeprefix("Heading").strip()
+            return "#" * min(int(level) if level.isdigit() else 1, 6) + " "
+        return ""
+
     def extract_text_from_pdf(self, file_path: Path) -> str:
         """Extract text from PDF files."""
         if not PDF_AVAILABLE:
@@ -58,7 +75,8 @@ class DocumentProcessor:
                 text_parts = []
                 for page in pdf_reader.pages:
                     text_parts.append(page.extract_text())
-                return "\n".join(text_parts)
+                # Keep the page boundaries for chunking
+                return PAGE_BREAK.join(text_parts)
         except Exception as e:
             logger.error(f"Error reading PDF {file_path}: {e}")
             return ""
@@ -136,33 +154,55 @@ class DocumentProcessor:
 
 class JeenDocumentProcessor(DocumentProcessor):
     """Specialized document processor for Jeen.ai documentation."""
+
+    def __init__(
+        self,
+        docs_directory: str = "documentation",
+        chunk_tokens: int = 400,
+        chunk_overlap_tokens: int = 50,
+    ):
+        super().__init__(docs_directory)
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap_tokens = chunk_overlap_tokens
     
     def clean_jeen_content(self, content: str) -> str:
         """Clean and normalize Jeen.ai specific content."""
-        # Remove excessive whitespace
-        lines = [line.strip() for line in content.split('\n')]
-        lines = [line for line in lines if line]  # Remove empty lines
-        
-        # Join with single newlines
-        cleaned = '\n'.join(lines)
-        
-        # Replace multiple spaces with single spaces
         import re
-        cleaned = re.sub(r' +', ' ', cleaned)
+
+        pages = []
+        for page in content.split(PAGE_BREAK):
+            # Remove excessive whitespace
+            lines = [line.strip() for line in page.split('\n')]
+            lines = [line for line in lines if line]  # Remove empty lines
+            
+            # Join with single newlines
+            cleaned = '\n'.join(lines)
+            
+            # Replace multiple spaces with single spaces
+            pages.append(re.sub(r' +', ' ', cleaned))
         
-        return cleaned
+        return PAGE_BREAK.join(pages)
     
     def extract_jeen_sections(self, content: str, title: str) -> List[Dict[str, Any]]:
-        """Extract logical sections from Jeen.ai documentation."""
-        # For now, treat each document as one section
-        # This can be enhanced to split documents into logical sections
-        
-        return [{
-            "title": f"Jeen.ai Guide: {title}",
-            "content": self.clean_jeen_content(content),
-            "source": "jeen_documentation",
-            "category": self.categorize_jeen_document(title)
-        }]
+        """
+        Split Jeen.ai documentation into chunks on headings, paragraphs and pages.
+        Every chunk is embedded on its own and keeps the ID of its parent document.
+        """
+        category = self.categorize_jeen_document(title)
+        chunks = chunk_document(
+            self.clean_jeen_content(content), self.chunk_tokens, self.chunk_overlap_tokens
+        )
+        return [
+            {
+                "title": f"Jeen.ai Guide: {title}" + (f" – {chunk.heading}" if chunk.heading else ""),
+                "content": chunk.content,
+                "source": "jeen_documentation",
+                "category": category,
+                "chunk_index": chunk.index,
+                "page": chunk.page,
+            }
+            for chunk in chunks
+        ]
     
     def categorize_jeen_document(self, title: str) -> str:
         """Categorize Jeen.ai documents based on title."""
@@ -201,12 +241,16 @@ class JeenDocumentProcessor(DocumentProcessor):
                 if content and content.strip():
                     # Extract sections from this document
                     sections = self.extract_jeen_sections(content, file_path.stem)
+                    source = f"jeen_docs/{file_path.relative_to(self.docs_directory)}"
                     
                     for section in sections:
                         doc = {
                             "title": section["title"],
                             "content": section["content"],
-                            "source": f"jeen_docs/{file_path.relative_to(self.docs_directory)}",
+                            "source": source,
+                            # Links the chunks of one file, stable across edits of its content
+                            "document_id": hashlib.sha256(source.encode()).hexdigest(),
+                            "chunk_index": section["chunk_index"],
                             "category": section["category"],
                             "file_type": file_path.suffix.lower(),
                             "original_file": str(file_path.relative_to(self.docs_directory)),
@@ -224,13 +268,15 @@ class JeenDocumentProcessor(DocumentProcessor):
 async def process_and_upload_documents(
     embedding_client, 
     session, 
-    docs_directory: str = "documentation"
+    docs_directory: str = "documentation",
+    chunk_tokens: int = 400,
+    chunk_overlap_tokens: int = 50,
 ) -> int:
     """Process all documents and upload them to the knowledge base."""
     from load_new_kbtopics import CompanyDocumentLoader
     
     # Process documents
-    processor = JeenDocumentProcessor(docs_directory)
+    processor = JeenDocumentProcessor(docs_directory, chunk_tokens, chunk_overlap_tokens)
     documents = processor.process_all_documents()
     
     if not documents:
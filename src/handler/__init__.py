@@ -1,4 +1,6 @@
 import logging
+from typing import List
+
 import httpx
 
 from sqlmodel.ext.asyncio.session import AsyncSession
@@ -6,9 +8,13 @@ from voyageai.client_async import AsyncClient
 
 from handler.router import Router
 from models import (
+    Message,
     WhatsAppWebhookPayload,
 )
 from whatsapp import WhatsAppClient
+from utils.deadline import answer_deadline
+from utils.latency import RequestTrace, pipeline_latency
+from whatsapp.jid import parse_jid
 from .base_handler import BaseHandler
 
 logger = logging.getLogger(__name__)
@@ -25,21 +31,65 @@ class MessageHandler(BaseHandler):
         super().__init__(session, whatsapp, embedding_client)
 
     async def __call__(self, payload: WhatsAppWebhookPayload):
-        message = await self.store_message(payload)
+        await self.handle_burst([payload])
 
+    @staticmethod
+    def should_answer(message: Message | None) -> bool:
         # Only process private messages with text content
         if not message or not message.text:
             logger.info("Ignoring message without text content")
-            return
+            return False
 
         # Check if message is from a group - we only handle private messages now
-        from whatsapp.jid import parse_jid
         chat_jid = parse_jid(message.chat_jid)
         if chat_jid.is_group():
             logger.info(f"Ignoring group message from {message.chat_jid}")
+            return False
+
+        return True
+
+    async def handle_burst(self, payloads: List[WhatsAppWebhookPayload | Message]):
+        """
+        Store a burst of consecutive payloads of one chat and answer them once.
+        Users often split a question over a few quick messages, so the texts of all
+        answerable messages are merged into a single query.
+        :param payloads: Webhook payloads, or messages that were already stored
+        """
+        # Every stage and LLM retry of the answer shares one time budget
+        with pipeline_latency.trace() as trace, answer_deadline.budget():
+            await self._handle_burst(payloads, trace)
+
+    async def _handle_burst(
+        self, payloads: List[WhatsAppWebhookPayload | Message], trace: RequestTrace
+    ):
+        messages = []
+        for payload in payloads:
+            if isinstance(payload, Message):
+                message = payload
+            else:
+                with pipeline_latency.stage("store_message"):
+                    message = await self.store_message(payload)
+            if self.should_answer(message):
+                messages.append(message)
+
+        if not messages:
             return
 
+        message = messages[-1]
+        if len(messages) > 1:
+            logger.info(f"Coalesced {len(messages)} messages from {message.chat_jid}")
+            # Answer (and react to) the last message of the burst, with the full question
+            message = Message(
+                **{
+                    **message.model_dump(),
+                    "text": "\n".join(m.text for m in messages),
+                }
+            )
+
         logger.info(f"Processing private message from {message.sender_jid}: {message.text[:100]}...")
+        trace.message_id = message.message_id
+        trace.chat_jid = message.chat_jid
+        trace.fields["coalesced"] = len(messages)
 
         # Process all private messages - no need to check for mentions since it's a private chat
         await self.router(message)
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when the answer pipeline is overloaded and the request is shed."""
+
+    pass
+
+
+class AdmissionController:
+    """
+    Limits how many answer pipeline runs happen at once.
+
+    Up to `max_concurrent` runs are admitted right away. Further requests wait in a
+    FIFO queue of at most `max_waiting` entries, for up to `wait_timeout` seconds.
+    Requests beyond that high-water mark, or that waited too long, are shed with
+    `AdmissionRejected` so the caller can send a quick canned reply instead.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 10,
+        max_waiting: int = 20,
+        wait_timeout: float = 45.0,
+        busy_reply: str = "We're handling a lot of questions right now. Please try again in a few minutes 🙏",
+    ):
+        self.configure(max_concurrent, max_waiting, wait_timeout, busy_reply)
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.timed_out = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def configure(
+        self,
+        max_concurrent: int,
+        max_waiting: int,
+        wait_timeout: float,
+        busy_reply: str,
+    ):
+        assert max_concurrent > 0, "max_concurrent must be positive"
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.busy_reply = busy_reply
+
+    def would_wait(self) -> bool:
+        """Whether a request arriving now would have to wait (or be shed)"""
+        return self._in_flight >= self.max_concurrent or bool(self._waiters)
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """
+        Hold one pipeline slot for the duration of the block
+        :raises AdmissionRejected: If the pipeline is overloaded
+        """
+        if not self.would_wait():
+            self._in_flight += 1
+        else:
+            await self._wait()
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _wait(self):
+        if len(self._waiters) >= self.max_waiting:
+            self.shed += 1
+            raise AdmissionRejected(
+                f"{self._in_flight} running and {len(self._waiters)} waiting"
+            )
+
+        self.queued += 1
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # `_release` hands its slot over by resolving the future
+            await asyncio.wait_for(waiter, self.wait_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot arrived at the last moment, pass it on
+                self._release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.shed += 1
+            self.timed_out += 1
+            raise AdmissionRejected(f"waited {self.wait_timeout}s for a slot") from e
+        finally:
+            waited = time.monotonic() - started
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+
+    def _release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_waiting": self.max_waiting,
+            "in_flight": self._in_flight,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+            "average_wait_seconds": self._total_wait / self.queued if self.queued else 0.0,
+            "max_wait_seconds": self._max_wait,
+        }
+
+
+# Shared by every handler in the process, configured from the settings at startup
+admission_controller = AdmissionController()
@@ -1,17 +1,21 @@
 import logging
+from typing import List
+
 from sqlmodel.ext.asyncio.session import AsyncSession
 from voyageai.client_async import AsyncClient
 
 from models import (
     WhatsAppWebhookPayload,
-    BaseSender,
     Message,
-    Sender,
     BaseMessage,
     upsert,
+    bulk_upsert,
 )
+from models.upsert import OnConflict
 from whatsapp.jid import normalize_jid
 from whatsapp import WhatsAppClient, SendMessageRequest
+from .chat_history import chat_history
+from .sender_registry import is_foreign_key_violation, sender_registry
 
 logger = logging.getLogger(__name__)
 
@@ -47,24 +51,71 @@ class BaseHandler:
         if not message.text:
             return message  # Don't store messages without text
 
-        async with self.session.begin_nested():
-            # Ensure sender exists and is committed
-            sender = await self.session.get(Sender, message.sender_jid)
-            if sender is None:
-                sender = Sender(
-                    **BaseSender(
-                        jid=message.sender_jid,  # Use normalized JID from message
-                        push_name=sender_pushname,
-                    ).model_dump()
+        async def write() -> Message | None:
+            async with self.session.begin_nested():
+                # Ensure sender exists, known senders don't cost a query
+                await sender_registry.ensure(
+                    self.session, message.sender_jid, sender_pushname
                 )
-                await self.upsert(sender)
-                await (
-                    self.session.flush()
-                )  # Ensure sender is visible in this transaction
 
+                # Finally add the message, redeliveries of an unchanged message don't rewrite the row
+                return await self.upsert(message, on_conflict="changed")
+
+        try:
+            stored = await write()
+        except Exception as e:
+            if not is_foreign_key_violation(e):
+                raise
+            # The sender was deleted behind the registry's back, e.g. by another replica clearing the data
+            logger.warning(f"Sender {message.sender_jid} is gone from the database, writing it again")
+            sender_registry.forget(message.sender_jid)
+            stored = await write()
+        # Answers read the chat's history from memory
+        chat_history.add(self.session, [message])
+        return stored
+
+    async def store_messages(
+        self, payloads: List[WhatsAppWebhookPayload]
+    ) -> List[Message]:
+        """
+        Store many webhook payloads at once, with a few multi-row statements
+        instead of a lookup, an upsert and a re-select per message
+        :param payloads: Payloads to store, in delivery order
+        :return: The stored messages, one per message ID
+        """
+        messages: dict[str, Message] = {}
+        senders: dict[str, str | None] = {}
+        for payload in payloads:
+            if not payload.from_:
+                continue
+            message = Message.from_webhook(payload)
+            if not message.text:
+                continue  # Don't store messages without text
+            messages[message.message_id] = message
+            if message.sender_jid not in senders or payload.pushname:
+                senders[message.sender_jid] = payload.pushname
+
+        if not messages:
+            return []
+
+        async def write():
+            async with self.session.begin_nested():
+                await sender_registry.ensure_many(self.session, senders)
+                await bulk_upsert(self.session, list(messages.values()), on_conflict="changed")
+
+        try:
+            await write()
+        except Exception as e:
+            if not is_foreign_key_violation(e):
+                raise
+            # Some sender was deleted behind the registry's back, write them all again
+            logger.warning(f"Senders of {len(messages)} messages are gone from the database, writing them again")
+            for jid in senders:
+                sender_registry.forget(jid)
+            await write()
+        chat_history.add(self.session, messages.values())
 
-            # Finally add the message
-            return await self.upsert(message)
+        return list(messages.values())
 
     async def send_message(
         self, to_jid: str, message: str, in_reply_to: str | None = None
@@ -98,5 +149,5 @@ class BaseHandler:
         )
         return await self.store_message(Message(**new_message.model_dump()))
 
-    async def upsert(self, model):
-        return await upsert(self.session, model)
+    async def upsert(self, model, on_conflict: OnConflict = "update"):
+        return await upsert(self.session, model, on_conflict)
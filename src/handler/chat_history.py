@@ -0,0 +1,240 @@
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlmodel import desc, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import BaseMessage, Message
+from utils.chat_text import chat2line
+
+logger = logging.getLogger(__name__)
+
+# Key of the messages written by a session but not committed yet, in `Session.info`
+_STAGED_KEY = "chat_history_staged"
+
+
+class HistoryEntry(NamedTuple):
+    message_id: str
+    timestamp: datetime
+    sender_jid: str
+    text: str | None
+    # The message as rendered by `chat2text`
+    line: str
+
+    @classmethod
+    def from_message(cls, message: BaseMessage) -> "HistoryEntry":
+        # Timestamps come back from the database in UTC, render buffered ones the same way
+        timestamp = message.timestamp
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        message = BaseMessage.model_construct(
+            **{**message.model_dump(), "timestamp": timestamp.astimezone(timezone.utc)}
+        )
+        return cls(
+            message.message_id,
+            message.timestamp,
+            message.sender_jid,
+            message.text,
+            chat2line(message),
+        )
+
+
+def history2text(history: Iterable[HistoryEntry]) -> str:
+    """Same as `chat2text`, from the pre-rendered lines"""
+    return "\n".join(entry.line for entry in history)
+
+
+class ChatHistory:
+    """
+    Bounded, process-local ring buffer of the latest messages of each chat.
+
+    A chat is loaded from the database the first time its history is needed, then kept
+    up to date from the messages the handlers store and send, so answering follow-up
+    messages costs no query. Like the sender registry, written messages only enter the
+    buffer once their transaction commits, though a session sees its own uncommitted
+    messages. At most `max_chats` chats are kept, the least recently used are evicted.
+    Other replicas write to the same chats, so a chat is read again from the database
+    once it was loaded `ttl` seconds ago; 0 keeps it until it is evicted.
+    """
+
+    def __init__(self, messages_per_chat: int = 7, max_chats: int = 1000, ttl: float = 10.0):
+        self._chats: OrderedDict[str, List[HistoryEntry]] = OrderedDict()
+        # When each buffered chat was last read from the database
+        self._loaded_at: Dict[str, float] = {}
+        self.configure(messages_per_chat, max_chats, ttl)
+        # Messages committed while their chat was being loaded
+        self._loading: Dict[str, List[HistoryEntry]] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def configure(self, messages_per_chat: int, max_chats: int, ttl: float = 10.0):
+        assert messages_per_chat > 0, "messages_per_chat must be positive"
+        assert max_chats > 0, "max_chats must be positive"
+        self.messages_per_chat = messages_per_chat
+        self.max_chats = max_chats
+        self.ttl = ttl
+        # Buffers of another size would serve too few or too many messages
+        self._chats.clear()
+        self._loaded_at.clear()
+
+    async def recent(
+        self, session: AsyncSession, chat_jid: str, limit: int | None = None
+    ) -> List[HistoryEntry]:
+        """
+        The latest messages of a chat, newest first
+        :param session: Session of the caller, its uncommitted messages are included
+        :param limit: Number of messages, `messages_per_chat` by default; more are always queried
+        """
+        limit = limit or self.messages_per_chat
+        if limit > self.messages_per_chat:
+            return await self._query(session, chat_jid, limit)
+
+        entries = self._chats.get(chat_jid)
+        if entries is not None and self._expired(chat_jid):
+            # Pick up the messages other replicas wrote meanwhile
+            self.reloads += 1
+            entries = await self._load(session, chat_jid)
+        elif entries is not None:
+            self.hits += 1
+            self._chats.move_to_end(chat_jid)
+        else:
+            self.misses += 1
+            entries = await self._load(session, chat_jid)
+
+        staged = [
+            entry
+            for history, jid, entry in self._staged(session).values()
+            if history is self and jid == chat_jid
+        ]
+        if staged:
+            entries = _merge(entries, staged, self.messages_per_chat)
+        return entries[::-1][:limit]
+
+    def _expired(self, chat_jid: str) -> bool:
+        return self.ttl > 0 and time.monotonic() - self._loaded_at[chat_jid] >= self.ttl
+
+    async def _load(self, session: AsyncSession, chat_jid: str) -> List[HistoryEntry]:
+        committed = self._loading.setdefault(chat_jid, [])
+        try:
+            entries = (await self._query(session, chat_jid, self.messages_per_chat))[::-1]
+        finally:
+            if self._loading.get(chat_jid) is committed:
+                del self._loading[chat_jid]
+        # Also keep what a concurrent load of the chat already buffered
+        entries = _merge(entries, committed + self._chats.get(chat_jid, []), self.messages_per_chat)
+        self._chats[chat_jid] = entries
+        self._chats.move_to_end(chat_jid)
+        self._loaded_at[chat_jid] = time.monotonic()
+        while len(self._chats) > self.max_chats:
+            evicted, _ = self._chats.popitem(last=False)
+            self._loaded_at.pop(evicted, None)
+            self.evictions += 1
+        return entries
+
+    @staticmethod
+    async def _query(session: AsyncSession, chat_jid: str, limit: int) -> List[HistoryEntry]:
+        # Only the rendered columns, loading whole messages would also load their senders
+        stmt = (
+            select(Message.message_id, Message.timestamp, Message.sender_jid, Message.text)
+            .where(Message.chat_jid == chat_jid)
+            .order_by(desc(Message.timestamp))
+            .limit(limit)
+        )
+        res = await session.exec(stmt)
+        return [
+            HistoryEntry.from_message(
+                BaseMessage.model_construct(
+                    message_id=message_id, timestamp=timestamp, sender_jid=sender_jid, text=text
+                )
+            )
+            for message_id, timestamp, sender_jid, text in res.all()
+        ]
+
+    def add(self, session: AsyncSession, messages: Iterable[BaseMessage]):
+        """
+        Record stored messages, they enter the buffer when the session commits
+        :param session: Session of the transaction writing the messages
+        """
+        entries = [(m.chat_jid, HistoryEntry.from_message(m)) for m in messages if m.text]
+        if not isinstance(getattr(session, "sync_session", None), Session):
+            self._remember(entries)
+            return
+        staged = self._staged(session)
+        for chat_jid, entry in entries:
+            # A rewritten message replaces the staged one
+            staged[entry.message_id] = (self, chat_jid, entry)
+
+    @staticmethod
+    def _staged(session: AsyncSession) -> Dict[str, Tuple["ChatHistory", str, HistoryEntry]]:
+        sync_session = getattr(session, "sync_session", None)
+        if not isinstance(sync_session, Session):
+            return {}
+        return sync_session.info.setdefault(_STAGED_KEY, {})
+
+    def _remember(self, entries: Iterable[Tuple[str, HistoryEntry]]):
+        by_chat: Dict[str, List[HistoryEntry]] = {}
+        for chat_jid, entry in entries:
+            by_chat.setdefault(chat_jid, []).append(entry)
+        for chat_jid, new in by_chat.items():
+            if chat_jid in self._loading:
+                self._loading[chat_jid].extend(new)
+            # Chats that were never loaded are loaded from the database when needed
+            if chat_jid in self._chats:
+                self._chats[chat_jid] = _merge(self._chats[chat_jid], new, self.messages_per_chat)
+                self._chats.move_to_end(chat_jid)
+
+    def clear(self):
+        """Forget every chat, e.g. after messages were deleted, and reset the counters"""
+        self._chats.clear()
+        self._loaded_at.clear()
+        self._loading.clear()
+        self.hits = self.misses = self.reloads = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.reloads
+        return {
+            "chats": len(self._chats),
+            "max_chats": self.max_chats,
+            "messages_per_chat": self.messages_per_chat,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "reloads": self.reloads,
+            "evictions": self.evictions,
+        }
+
+
+def _merge(entries: List[HistoryEntry], new: Iterable[HistoryEntry], size: int) -> List[HistoryEntry]:
+    """The latest `size` of both, oldest first, the new entries replace ones with the same ID"""
+    by_id = {entry.message_id: entry for entry in entries}
+    by_id.update((entry.message_id, entry) for entry in new)
+    return sorted(by_id.values(), key=lambda entry: entry.timestamp)[-size:]
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_committed_messages(session: Session):
+    by_history: Dict[ChatHistory, List[Tuple[str, HistoryEntry]]] = {}
+    for history, chat_jid, entry in session.info.pop(_STAGED_KEY, {}).values():
+        by_history.setdefault(history, []).append((chat_jid, entry))
+    for history, entries in by_history.items():
+        history._remember(entries)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_staged_messages(session: Session):
+    session.info.pop(_STAGED_KEY, None)
+
+
+# Shared by every handler in the process, configured from the settings at startup
+chat_history = ChatHistory()
@@ -1,9 +1,10 @@
+import asyncio
 import logging
-from typing import List
+import time
+from typing import Dict, List, Literal, NamedTuple, Tuple
 
 from pydantic_ai import Agent
 from pydantic_ai.agent import AgentRunResult
-from sqlmodel import select, cast, String, desc
 from tenacity import (
     retry,
     wait_random_exponential,
@@ -11,114 +12,39 @@ from tenacity import (
     before_sleep_log,
 )
 
-from models import Message, KBTopic
+from models import Message
 from whatsapp.jid import parse_jid
-from utils.chat_text import chat2text
-from utils.voyage_embed_text import voyage_embed_text
+from utils.context_packer import context_packer, estimate_tokens
+from utils.deadline import (
+    DeadlineExceeded,
+    answer_deadline,
+    reraise_past_deadline,
+    stop_at_deadline,
+    within_deadline,
+)
+from utils.agents import MODEL_NAME, agent_registry
+from utils.answer_cache import answer_cache
+from utils.embedding_cache import embedding_cache
+from utils.language import dominant_script
+from utils.latency import pipeline_latency
 from .base_handler import BaseHandler
+from .chat_history import HistoryEntry, chat_history, history2text
+from .reactions import reactions
+from .rephrase_gate import rephrase_gate
+from .retrieval import (
+    RetrievedTopic,
+    cosine_similarity,
+    fuse_results,
+    hybrid_retrieval,
+    hybrid_search,
+    search_topics,
+    speculative_retrieval,
+)
 
 # Creating an object
 logger = logging.getLogger(__name__)
 
-
-class KnowledgeBaseAnswers(BaseHandler):
-    async def __call__(self, message: Message):
-        # Ensure message.text is not None before passing to generation_agent
-        if message.text is None:
-            logger.warning(f"Received message with no text from {message.sender_jid}")
-            return
-        # get the last 7 messages
-        stmt = (
-            select(Message)
-            .where(Message.chat_jid == message.chat_jid)
-            .order_by(desc(Message.timestamp))
-            .limit(7)
-        )
-        res = await self.session.exec(stmt)
-        history: list[Message] = list(res.all())
-
-        rephrased_response = await self.rephrasing_agent(
-            (await self.whatsapp.get_my_jid()).user, message, history
-        )
-        # Get query embedding
-        embedded_question = (
-            await voyage_embed_text(self.embedding_client, [rephrased_response.output])
-        )[0]
-
-        # Search company documentation for relevant topics
-        limit_topics = 10
-        cosine_distance_threshold = 0.7  # Threshold for considering a topic relevant
-        
-        # query for user query
-        q = (
-            select(
-                KBTopic,
-                KBTopic.embedding.cosine_distance(embedded_question).label(
-                    "cosine_distance"
-                ),
-            )
-            .order_by(KBTopic.embedding.cosine_distance(embedded_question))
-            .where(KBTopic.embedding.cosine_distance(embedded_question) < cosine_distance_threshold)
-            .limit(limit_topics)
-        )
-        retrieved_topics = await self.session.exec(q)
-
-        similar_topics = []
-        similar_topics_distances = []
-        has_relevant_docs = False
-        
-        for kb_topic, topic_distance in retrieved_topics:  # Unpack the tuple
-            similar_topics.append(f"{kb_topic.subject} \n {kb_topic.content}")
-            similar_topics_distances.append(f"topic_distance: {topic_distance}")
-            if topic_distance < 0.5:  # High relevance threshold
-                has_relevant_docs = True
-
-        sender_number = parse_jid(message.sender_jid).user
-        generation_response = await self.generation_agent(
-            message.text, similar_topics, message.sender_jid, history, has_relevant_docs
-        )
-        logger.info(
-            "RAG Query Results:\n"
-            f"Sender: {sender_number}\n"
-            f"Question: {message.text}\n"
-            f"Rephrased Question: {rephrased_response.output}\n"
-            f"Chat JID: {message.chat_jid}\n"
-            f"Retrieved Topics: {len(similar_topics)}\n"
-            f"Similarity Scores: {similar_topics_distances}\n"
-            "Topics:\n"
-            + "\n".join(f"- {topic[:100]}..." for topic in similar_topics)
-            + "\n"
-            f"Generated Response: {generation_response.output}"
-        )
-
-        await self.send_message(
-            message.chat_jid,
-            generation_response.output,
-        )
-        
-        # Send completion emoji reaction to indicate processing is done
-        try:
-            await self.whatsapp.react_to_message(
-                message_id=message.message_id,
-                phone=message.chat_jid,
-                emoji="✅"
-            )
-            logger.info(f"Sent completion reaction ✅ for message {message.message_id}")
-        except Exception as e:
-            logger.warning(f"Failed to send completion reaction: {e}")
-
-    @retry(
-        wait=wait_random_exponential(min=1, max=30),
-        stop=stop_after_attempt(6),
-        before_sleep=before_sleep_log(logger, logging.DEBUG),
-        reraise=True,
-    )
-    async def generation_agent(
-        self, query: str, topics: list[str], sender: str, history: List[Message], has_relevant_docs: bool = False
-    ) -> AgentRunResult[str]:
-        # Create dynamic system prompt based on whether we have relevant documentation
-        if has_relevant_docs and topics:
-            system_prompt = """
+GENERATION_WITH_DOCS_PROMPT = """
             You are a helpful and knowledgeable representative of Jeen.ai, a cutting-edge AI platform company.
             Your role is to assist enterprise employees with questions about how to use the Jeen.ai platform.
             
@@ -143,8 +69,8 @@ class KnowledgeBaseAnswers(BaseHandler):
             
             The documentation provided is highly relevant to the user's question - use it to give a focused, concise answer.
             """
-        else:
-            system_prompt = """
+
+GENERATION_WITHOUT_DOCS_PROMPT = """
             You are a helpful and knowledgeable representative of Jeen.ai, a cutting-edge AI platform company.
             Your role is to assist enterprise employees with general questions about Jeen.ai.
             
@@ -171,17 +97,266 @@ class KnowledgeBaseAnswers(BaseHandler):
             Since no highly relevant documentation was found, be helpful but keep responses concise and direct.
             """
 
-        agent = Agent(
-            model="gemini-2.5-flash",
-            system_prompt=system_prompt,
+REPHRASING_PROMPT = """Rephrase the following user message as a clear, concise search query for finding relevant Jeen.ai company documentation.
+            - Use English only!
+            - Focus on the core question or information need from the user
+            - Convert conversational language into a structured query suitable for knowledge base search
+            - Use the chat history for context if relevant, but focus on the main query
+            - Return only the rephrased search query, no additional text!"""
+
+agent_registry.register(
+    "generation_with_docs",
+    lambda: Agent(model=MODEL_NAME, system_prompt=GENERATION_WITH_DOCS_PROMPT),
+)
+agent_registry.register(
+    "generation_without_docs",
+    lambda: Agent(model=MODEL_NAME, system_prompt=GENERATION_WITHOUT_DOCS_PROMPT),
+)
+agent_registry.register(
+    "rephrasing", lambda: Agent(model=MODEL_NAME, system_prompt=REPHRASING_PROMPT)
+)
+
+# Search company documentation for relevant topics
+LIMIT_TOPICS = 10
+MAX_TOPIC_DISTANCE = 0.7  # Threshold for considering a topic relevant
+
+
+class _Speculation(NamedTuple):
+    embedding: List[float]
+    results: List[RetrievedTopic]
+    search_seconds: float
+    seconds: float
+
+
+class KnowledgeBaseAnswers(BaseHandler):
+    # "vector" or "hybrid" (vector + full-text), None follows the retrieval_mode setting
+    retriever: Literal["vector", "hybrid"] | None = None
+
+    async def __call__(self, message: Message):
+        # Ensure message.text is not None before passing to generation_agent
+        if message.text is None:
+            logger.warning(f"Received message with no text from {message.sender_jid}")
+            return
+        # Stage timings of the message's pipeline record
+        timings = pipeline_latency.stages()
+        started = time.monotonic()
+        # get the last 7 messages, from memory once the chat was loaded
+        history = await chat_history.recent(self.session, message.chat_jid, limit=7)
+        timings["history"] = time.monotonic() - started
+
+        # Self-contained English questions are searched as they are
+        speculation = None
+        # The cache is keyed on the query, which only stands on its own when the message
+        # was self-contained or rephrased with the history folded in
+        cacheable = True
+        if rephrase_gate.should_rephrase(message):
+            # Search with the raw message while the question is being rephrased
+            if speculative_retrieval.enabled:
+                speculation = asyncio.create_task(self._speculative_search(message.text))
+            started = time.monotonic()
+            try:
+                rephrased_response = await self.rephrasing_agent(
+                    (await self.whatsapp.get_my_jid()).user, message, history
+                )
+                query = rephrased_response.output
+                rephrase_gate.observe(time.monotonic() - started)
+            except DeadlineExceeded:
+                # Out of time, search with the message as it is
+                logger.warning(f"Rephrasing {message.message_id} ran out of time")
+                answer_deadline.record("rephrase")
+                query = message.text
+                cacheable = False
+            except BaseException:
+                if speculation is not None:
+                    speculation.cancel()
+                    await asyncio.gather(speculation, return_exceptions=True)
+                raise
+            timings["rephrase"] = time.monotonic() - started
+        else:
+            query = message.text
+
+        embedded_question, retrieved_topics = await self._retrieve(
+            query, speculation, timings
+        )
+
+        similar_topics = []
+        similar_topics_distances = []
+        topic_ids = []
+        has_relevant_docs = False
+
+        for topic in retrieved_topics:
+            topic_ids.append(topic.id)
+            similar_topics.append(f"{topic.subject} \n {topic.content}")
+            similar_topics_distances.append(f"topic_distance: {topic.distance}")
+            # High relevance threshold, or the query names something the topic mentions
+            if topic.distance < 0.5 or (
+                topic.lexical_rank is not None and topic.distance < MAX_TOPIC_DISTANCE
+            ):
+                has_relevant_docs = True
+
+        sender_number = parse_jid(message.sender_jid).user
+        # Near-identical questions over the same topics get the same answer
+        script = dominant_script(message.text)
+        answer = None
+        if cacheable:
+            answer = answer_cache.lookup(embedded_question, topic_ids, script, has_relevant_docs)
+        context_tokens = 0
+        outcome = "cached"
+        if answer is None:
+            # Only the passages matching the question, within the token budget
+            context = context_packer.pack(f"{message.text}\n{query}", retrieved_topics)
+            context_tokens = context.tokens
+            started = time.monotonic()
+            try:
+                generation_response = await self.generation_agent(
+                    message.text, context.topics, message.sender_jid, history, has_relevant_docs
+                )
+                answer = generation_response.output
+                outcome = "answered"
+            except DeadlineExceeded:
+                # Out of time, reply with the best topic rather than not at all
+                logger.warning(f"Generating the answer to {message.message_id} ran out of time")
+                answer_deadline.record("generate")
+                answer = answer_deadline.fallback(retrieved_topics)
+                outcome = "deadline"
+            timings["generate"] = time.monotonic() - started
+            if outcome == "answered" and cacheable:
+                answer_cache.store(
+                    embedded_question,
+                    topic_ids,
+                    script,
+                    has_relevant_docs,
+                    answer,
+                    timings["generate"],
+                )
+        else:
+            logger.info(f"Answering {message.message_id} from the answer cache")
+        logger.info(
+            "RAG Query Results:\n"
+            f"Sender: {sender_number}\n"
+            f"Question: {message.text}\n"
+            f"Rephrased Question: {query}\n"
+            f"Chat JID: {message.chat_jid}\n"
+            f"Retrieved Topics: {len(similar_topics)}\n"
+            f"Context Tokens: {context_tokens}\n"
+            f"Similarity Scores: {similar_topics_distances}\n"
+            f"Stage Timings: { {stage: round(seconds, 3) for stage, seconds in timings.items()} }\n"
+            "Topics:\n"
+            + "\n".join(f"- {topic[:100]}..." for topic in similar_topics)
+            + "\n"
+            f"Generated Response: {answer}"
+        )
+
+        trace = pipeline_latency.current()
+        if trace is not None:
+            trace.fields.update(
+                outcome=outcome,
+                rephrased="rephrase" in timings,
+                topics=len(topic_ids),
+                relevant_docs=has_relevant_docs,
+                context_tokens=context_tokens,
+            )
+
+        with pipeline_latency.stage("send"):
+            await self.send_message(
+                message.chat_jid,
+                answer,
+            )
+
+        # Mark the message as answered, in the background
+        reactions.finish(self.whatsapp, message.message_id, message.chat_jid)
+
+    async def search(
+        self, query: str, embedding: List[float], timings: Dict[str, float] | None = None
+    ) -> List[RetrievedTopic]:
+        """
+        Topics of a query with the selected retriever
+        :param timings: Receives the latency of each hybrid retrieval branch
+        """
+        retriever = self.retriever or ("hybrid" if hybrid_retrieval.enabled else "vector")
+        if retriever == "hybrid":
+            return await hybrid_search(
+                self.session, query, embedding, LIMIT_TOPICS, MAX_TOPIC_DISTANCE, timings
+            )
+        return await search_topics(self.session, embedding, LIMIT_TOPICS, MAX_TOPIC_DISTANCE)
+
+    async def _speculative_search(self, text: str) -> _Speculation | None:
+        started = time.monotonic()
+        try:
+            embedding = await embedding_cache.embed(self.embedding_client, text, self.session)
+            search_started = time.monotonic()
+            results = await self.search(text, embedding)
+        except Exception as e:
+            speculative_retrieval.failed += 1
+            logger.warning(f"Speculative search failed, searching after rephrasing: {e}")
+            return None
+        finished = time.monotonic()
+        return _Speculation(embedding, results, finished - search_started, finished - started)
+
+    async def _retrieve(
+        self,
+        rephrased: str,
+        speculation: asyncio.Task | None,
+        timings: Dict[str, float],
+    ) -> Tuple[List[float], List[RetrievedTopic]]:
+        """
+        Embed the rephrased query and find its topics, reusing the speculative search
+        on the raw message when both queries embed close enough.
+        :return: The query embedding and the retrieved topics
+        """
+        speculative = None
+        if speculation is not None:
+            # The session is only free for the next queries once the speculation is done
+            waiting_since = time.monotonic()
+            speculative = await speculation
+            timings["speculative_wait"] = time.monotonic() - waiting_since
+            if speculative is not None:
+                timings["speculative"] = speculative.seconds
+
+        started = time.monotonic()
+        # Get query embedding, repeat questions are served from the cache
+        embedded_question = await embedding_cache.embed(
+            self.embedding_client, rephrased, self.session
+        )
+        timings["embed"] = time.monotonic() - started
+
+        if (
+            speculative is not None
+            and cosine_similarity(speculative.embedding, embedded_question)
+            >= speculative_retrieval.min_similarity
+        ):
+            speculative_retrieval.record(
+                True, speculative.search_seconds - timings["speculative_wait"]
             )
+            return embedded_question, speculative.results
+
+        # Search company documentation for relevant topics
+        started = time.monotonic()
+        results = await self.search(rephrased, embedded_question, timings)
+        timings["search"] = time.monotonic() - started
+        if speculative is not None:
+            results = fuse_results([results, speculative.results], LIMIT_TOPICS)
+            speculative_retrieval.record(False, -timings["speculative_wait"])
+        return embedded_question, results
+
+    @retry(
+        wait=wait_random_exponential(min=1, max=30),
+        stop=stop_after_attempt(6) | stop_at_deadline,
+        before_sleep=before_sleep_log(logger, logging.DEBUG),
+        retry_error_callback=reraise_past_deadline,
+    )
+    async def generation_agent(
+        self, query: str, topics: list[str], sender: str, history: List[HistoryEntry], has_relevant_docs: bool = False
+    ) -> AgentRunResult[str]:
+        # Pick the system prompt variant based on whether we have relevant documentation
+        agent = "generation_with_docs" if has_relevant_docs and topics else "generation_without_docs"
 
         if has_relevant_docs and topics:
             prompt_template = f"""
             User Query: {query}
             
             # Recent chat history:
-            {chat2text(history)}
+            {history2text(history)}
             
             # Highly Relevant Jeen.ai Documentation:
             {"\n---\n".join(topics)}
@@ -193,7 +368,7 @@ class KnowledgeBaseAnswers(BaseHandler):
             User Query: {query}
             
             # Recent chat history:
-            {chat2text(history)}
+            {history2text(history)}
             
             # Available Documentation:
             {"\n---\n".join(topics) if len(topics) > 0 else "No highly relevant documentation found for this specific query."}
@@ -201,28 +376,22 @@ class KnowledgeBaseAnswers(BaseHandler):
             Note: The available documentation may not be highly relevant to this specific question. Provide general Jeen.ai information and suggest appropriate resources.
             """
 
-        return await agent.run(prompt_template)
+        context_packer.record_prompt(estimate_tokens(prompt_template))
+        return await within_deadline(agent_registry.run(agent, prompt_template))
 
     @retry(
         wait=wait_random_exponential(min=1, max=30),
-        stop=stop_after_attempt(6),
+        stop=stop_after_attempt(6) | stop_at_deadline,
         before_sleep=before_sleep_log(logger, logging.DEBUG),
-        reraise=True,
+        retry_error_callback=reraise_past_deadline,
     )
     async def rephrasing_agent(
-        self, my_jid: str, message: Message, history: List[Message]
+        self, my_jid: str, message: Message, history: List[HistoryEntry]
     ) -> AgentRunResult[str]:
-        rephrased_agent = Agent(
-            model="gemini-2.5-flash",
-            system_prompt=f"""Rephrase the following user message as a clear, concise search query for finding relevant Jeen.ai company documentation.
-            - Use English only!
-            - Focus on the core question or information need from the user
-            - Convert conversational language into a structured query suitable for knowledge base search
-            - Use the chat history for context if relevant, but focus on the main query
-            - Return only the rephrased search query, no additional text!""",
-        )
-
         # We obviously need to translate the question and turn the question vebality to a title / summary text to make it closer to the questions in the rag
-        return await rephrased_agent.run(
-            f"{message.text}\n\n## Recent chat history:\n {chat2text(history)}"
+        return await within_deadline(
+            agent_registry.run(
+                "rephrasing",
+                f"{message.text}\n\n## Recent chat history:\n {history2text(history)}"
+            )
         )
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Any, Dict, Literal, Set
+
+from utils.latency import Histogram
+from whatsapp import WhatsAppClient
+
+logger = logging.getLogger(__name__)
+
+# Which acknowledgement reactions are sent: none, 💬 on receipt, or 💬 then ✅ once answered
+ReactionMode = Literal["none", "start", "start_finish"]
+
+START_EMOJI = "💬"
+FINISH_EMOJI = "✅"
+
+
+class Reactions:
+    """
+    Sends acknowledgement reactions in the background, off the reply path.
+
+    Reactions are cosmetic, so nothing waits for them: each one is a task, at most
+    `max_concurrent` of them talk to the gateway at once and beyond `max_pending`
+    queued reactions new ones are dropped. Reactions to the same message are sent in
+    order, since a later reaction replaces the earlier one. Failures are counted and
+    logged, never raised.
+    """
+
+    def __init__(self, mode: ReactionMode = "start_finish", max_concurrent: int = 4, max_pending: int = 200):
+        self._tasks: Set[asyncio.Task] = set()
+        # Latest reaction task of each message, the next one waits for it
+        self._latest: Dict[str, asyncio.Task] = {}
+        self.configure(mode, max_concurrent, max_pending)
+        self.clear()
+
+    def configure(self, mode: ReactionMode, max_concurrent: int, max_pending: int):
+        assert max_concurrent > 0, "max_concurrent must be positive"
+        self.mode = mode
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self._slots = asyncio.Semaphore(max_concurrent)
+
+    def start(self, whatsapp: WhatsAppClient, message_id: str, chat_jid: str):
+        """React with 💬 to a message that is about to be answered"""
+        if self.mode != "none":
+            self._react(whatsapp, message_id, chat_jid, START_EMOJI)
+
+    def finish(self, whatsapp: WhatsAppClient, message_id: str, chat_jid: str):
+        """React with ✅ to a message that was answered"""
+        if self.mode == "start_finish":
+            self._react(whatsapp, message_id, chat_jid, FINISH_EMOJI)
+
+    def _react(self, whatsapp: WhatsAppClient, message_id: str, chat_jid: str, emoji: str):
+        if len(self._tasks) >= self.max_pending:
+            self.dropped += 1
+            logger.warning(f"Dropping reaction {emoji} for message {message_id}, {len(self._tasks)} pending")
+            return
+        previous = self._latest.get(message_id)
+        task = asyncio.create_task(
+            self._send(whatsapp, message_id, chat_jid, emoji, previous),
+            name=f"reaction-{message_id}",
+        )
+        self._tasks.add(task)
+        self._latest[message_id] = task
+        task.add_done_callback(lambda done: self._done(message_id, done))
+
+    async def _send(
+        self,
+        whatsapp: WhatsAppClient,
+        message_id: str,
+        chat_jid: str,
+        emoji: str,
+        previous: asyncio.Task | None,
+    ):
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        async with self._slots:
+            started = time.monotonic()
+            try:
+                await whatsapp.react_to_message(message_id=message_id, phone=chat_jid, emoji=emoji)
+            except Exception as e:
+                self.failed[type(e).__name__] += 1
+                logger.warning(f"Failed to send reaction {emoji} for message {message_id}: {e}")
+                return
+            finally:
+                self._seconds.record(time.monotonic() - started)
+        self.sent[emoji] += 1
+
+    def _done(self, message_id: str, task: asyncio.Task):
+        self._tasks.discard(task)
+        if self._latest.get(message_id) is task:
+            del self._latest[message_id]
+
+    async def drain(self, timeout: float = 5.0):
+        """Give the pending reactions `timeout` seconds to go out, e.g. at shutdown"""
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if pending:
+            logger.warning(f"Cancelled {len(pending)} reactions at shutdown")
+
+    def clear(self):
+        self.sent: Counter[str] = Counter()
+        self.failed: Counter[str] = Counter()
+        self.dropped = 0
+        self._seconds = Histogram(1024)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "pending": len(self._tasks),
+            "sent": dict(self.sent),
+            "failed": dict(self.failed),
+            "dropped": self.dropped,
+            "seconds": self._seconds.stats(),
+        }
+
+
+# Shared by every handler in the process, configured from the settings at startup
+reactions = Reactions()
@@ -0,0 +1,105 @@
+import logging
+import re
+from collections import Counter
+from typing import Any, Dict
+
+from models import Message
+from utils.language import dominant_script
+
+logger = logging.getLogger(__name__)
+
+_WORDS = re.compile(r"[a-z0-9]+(?:['\-.][a-z0-9]+)*")
+
+# At least one of these marks a message as English rather than another Latin-script language
+_ENGLISH_WORDS = frozenset(
+    "a an the how what when where which who why can could do does is are was should "
+    "i my we our to of in on for with from by and or not".split()
+)
+
+# Words that only make sense with the earlier turns of the conversation
+_REFERENCES = frozenset(
+    "it its it's this that these those they them their there he she him her "
+    "above previous earlier same again also too else another former latter one".split()
+)
+_REFERENCE_OPENERS = ("and ", "but ", "so ", "or ", "what about ", "how about ")
+
+# Conversational filler the rephrasing agent would strip from the query
+_FILLER = frozenset(
+    "hi hello hey thanks thank please pls plz ok okay yes sure lol guys".split()
+)
+
+
+class RephraseGate:
+    """
+    CPU-only check of whether a message already is a good search query, so it can be
+    embedded as is instead of paying a rephrasing LLM round trip. A message qualifies
+    when it is a single line of English of moderate length, has no conversational
+    filler and doesn't refer to earlier turns or reply to another message.
+    """
+
+    def __init__(self, enabled: bool = True, min_words: int = 3, max_words: int = 20):
+        self.configure(enabled, min_words, max_words)
+        self.clear()
+
+    def configure(self, enabled: bool, min_words: int, max_words: int):
+        self.enabled = enabled
+        self.min_words = min_words
+        self.max_words = max_words
+
+    def rephrase_reason(self, message: Message) -> str | None:
+        """
+        Why the message needs rephrasing
+        :return: The reason, or None when the message can be searched as is
+        """
+        text = (message.text or "").strip()
+        if not self.enabled:
+            return "disabled"
+        if message.reply_to_id:
+            return "reply"
+        if "\n" in text or "@" in text:
+            return "multi_line"
+        if dominant_script(text) != "latin" or not text.isascii():
+            return "language"
+        words = _WORDS.findall(text.casefold())
+        if not self.min_words <= len(words) <= self.max_words:
+            return "length"
+        if _ENGLISH_WORDS.isdisjoint(words):
+            return "language"
+        if not _REFERENCES.isdisjoint(words) or text.casefold().startswith(_REFERENCE_OPENERS):
+            return "reference"
+        if not _FILLER.isdisjoint(words):
+            return "filler"
+        return None
+
+    def should_rephrase(self, message: Message) -> bool:
+        reason = self.rephrase_reason(message)
+        self.reasons[reason or "skipped"] += 1
+        return reason is not None
+
+    def observe(self, rephrase_seconds: float):
+        """Record the latency of a rephrasing call, used to estimate the saved latency"""
+        self._rephrased += 1
+        self._rephrase_seconds += rephrase_seconds
+
+    def clear(self):
+        self.reasons: Counter[str] = Counter()
+        self._rephrased = 0
+        self._rephrase_seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        checked = sum(self.reasons.values())
+        skipped = self.reasons["skipped"]
+        average = self._rephrase_seconds / self._rephrased if self._rephrased else 0.0
+        return {
+            "enabled": self.enabled,
+            "checked": checked,
+            "skipped": skipped,
+            "skip_rate": skipped / checked if checked else 0.0,
+            "reasons": {reason: n for reason, n in self.reasons.items() if reason != "skipped"},
+            "average_rephrase_seconds": average,
+            "saved_seconds": skipped * average,
+        }
+
+
+# Shared by every handler in the process, configured from the settings at startup
+rephrase_gate = RephraseGate()
@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, NamedTuple, Sequence
+
+import numpy as np
+from sqlalchemy import Select, Text, cast, func, literal_column, text
+from sqlalchemy.dialects.postgresql import TSQUERY
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import KBTopic
+from .topic_index import topic_index
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievedTopic(NamedTuple):
+    """A knowledge base topic found for a query, without its embedding"""
+
+    id: str
+    subject: str
+    content: str
+    source: str
+    # Cosine distance to the query
+    distance: float
+    # Rank among the full-text matches, None when the topic didn't match the query's words
+    lexical_rank: int | None = None
+
+
+# Constant of reciprocal rank fusion, dampens the weight of the top ranks
+RRF_K = 60
+
+
+def nearest_topics_query(
+    embedding: List[float], limit: int = 10, max_distance: float = 0.7
+) -> Select:
+    """
+    Statement selecting the nearest knowledge base topics of an embedding.
+    The inner query orders by the distance with a LIMIT, so the HNSW index drives
+    the scan; the threshold only filters the nearest rows it returns.
+    """
+    nearest = (
+        select(
+            KBTopic.id,
+            KBTopic.subject,
+            KBTopic.content,
+            KBTopic.source,
+            KBTopic.embedding.cosine_distance(embedding).label("distance"),
+        )
+        .order_by(text("distance"))
+        .limit(limit)
+        .subquery("nearest")
+    )
+    return (
+        select(nearest)
+        .where(nearest.c.distance < max_distance)
+        .order_by(nearest.c.distance)
+    )
+
+
+def lexical_topics_query(query: str, embedding: List[float], limit: int = 10) -> Select:
+    """
+    Statement selecting the topics best matching any word of a query, e.g. product
+    names and UI labels that embeddings tend to miss. The cosine distance is still
+    computed, for the few matching rows only.
+    """
+    # plainto_tsquery requires every word, any of them is enough here
+    tsquery = cast(
+        func.replace(
+            cast(func.plainto_tsquery(literal_column("'english'::regconfig"), query), Text), "&", "|"
+        ),
+        TSQUERY,
+    )
+    matches = (
+        select(
+            KBTopic.id,
+            KBTopic.subject,
+            KBTopic.content,
+            KBTopic.source,
+            KBTopic.embedding.cosine_distance(embedding).label("distance"),
+            func.ts_rank_cd(KBTopic.search_vector, tsquery).label("rank"),
+        )
+        .where(KBTopic.search_vector.op("@@")(tsquery))
+        .order_by(text("rank DESC"))
+        .limit(limit)
+        .subquery("matches")
+    )
+    return select(
+        matches.c.id, matches.c.subject, matches.c.content, matches.c.source, matches.c.distance
+    ).order_by(matches.c.rank.desc())
+
+
+async def search_topics(
+    session: AsyncSession,
+    embedding: List[float],
+    limit: int = 10,
+    max_distance: float = 0.7,
+) -> List[RetrievedTopic]:
+    """
+    Nearest knowledge base topics of a query embedding, from the in-memory index
+    when it is ready and from pgvector otherwise
+    :param limit: Maximum number of topics
+    :param max_distance: Topics further away (cosine) are not considered relevant
+    :return: Topics with their distance, nearest first
+    """
+    hits = topic_index.search(embedding, limit, max_distance)
+    if hits is not None:
+        return [RetrievedTopic(*hit) for hit in hits]
+    result = await session.exec(nearest_topics_query(embedding, limit, max_distance))
+    return [RetrievedTopic(*row) for row in result.all()]
+
+
+async def search_lexical(
+    session: AsyncSession, query: str, embedding: List[float], limit: int = 10
+) -> List[RetrievedTopic]:
+    """
+    Knowledge base topics matching the words of a query, see `lexical_topics_query`
+    :return: Topics with their distance, best match first
+    """
+    result = await session.exec(lexical_topics_query(query, embedding, limit))
+    return [RetrievedTopic(*row, lexical_rank=rank) for rank, row in enumerate(result.all())]
+
+
+async def hybrid_search(
+    session: AsyncSession,
+    query: str,
+    embedding: List[float],
+    limit: int = 10,
+    max_distance: float = 0.7,
+    timings: Dict[str, float] | None = None,
+) -> List[RetrievedTopic]:
+    """
+    Vector and full-text search run concurrently and fused with reciprocal rank fusion.
+    The full-text branch uses its own connection unless the vector branch is
+    answered by the in-memory index.
+    :param timings: Receives the latency of each branch
+    """
+    timings = timings if timings is not None else {}
+
+    async def timed(name: str, search):
+        started = time.monotonic()
+        try:
+            return await search
+        finally:
+            timings[name] = time.monotonic() - started
+
+    async def both(lexical_session: AsyncSession):
+        return await asyncio.gather(
+            timed("search_vector", search_topics(session, embedding, limit, max_distance)),
+            timed("search_lexical", search_lexical(lexical_session, query, embedding, limit)),
+        )
+
+    if topic_index.ready:
+        vector, lexical = await both(session)
+    elif session.bind is not None:
+        async with AsyncSession(session.bind, expire_on_commit=False) as lexical_session:
+            vector, lexical = await both(lexical_session)
+    else:
+        vector = await timed("search_vector", search_topics(session, embedding, limit, max_distance))
+        lexical = await timed("search_lexical", search_lexical(session, query, embedding, limit))
+
+    hybrid_retrieval.record(vector, lexical, timings["search_vector"], timings["search_lexical"])
+    return fuse_results([vector, lexical], limit)
+
+
+def fuse_results(rankings: Sequence[List[RetrievedTopic]], limit: int = 10) -> List[RetrievedTopic]:
+    """
+    Merge rankings of the same knowledge base with reciprocal rank fusion.
+    A topic keeps its smallest distance and best lexical rank over the rankings;
+    earlier rankings win ties.
+    """
+    scores: Dict[str, float] = {}
+    best: Dict[str, RetrievedTopic] = {}
+    for ranking in rankings:
+        for rank, topic in enumerate(ranking):
+            scores[topic.id] = scores.get(topic.id, 0.0) + 1.0 / (RRF_K + rank + 1)
+            known = best.get(topic.id)
+            if known is None:
+                best[topic.id] = topic
+                continue
+            lexical_ranks = [r for r in (known.lexical_rank, topic.lexical_rank) if r is not None]
+            best[topic.id] = known._replace(
+                distance=min(known.distance, topic.distance),
+                lexical_rank=min(lexical_ranks) if lexical_ranks else None,
+            )
+    ordered = sorted(scores, key=lambda topic_id: -scores[topic_id])
+    return [best[topic_id] for topic_id in ordered[:limit]]
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    a_vec = np.asarray(a, dtype=np.float32)
+    b_vec = np.asarray(b, dtype=np.float32)
+    norm = float(np.linalg.norm(a_vec) * np.linalg.norm(b_vec))
+    return float(a_vec @ b_vec) / norm if norm else 0.0
+
+
+class SpeculativeRetrieval:
+    """
+    Settings and counters of speculative retrieval: the raw message is embedded and
+    searched while the rephrasing agent runs. When the rephrased query embeds within
+    `min_similarity` of the raw message, the speculative results are used as they
+    are and the second search is skipped; otherwise both result sets are fused.
+    """
+
+    def __init__(self, enabled: bool = True, min_similarity: float = 0.9):
+        self.configure(enabled, min_similarity)
+        self.clear()
+
+    def configure(self, enabled: bool, min_similarity: float):
+        self.enabled = enabled
+        self.min_similarity = min_similarity
+
+    def record(self, used: bool, saved_seconds: float):
+        """
+        Account for one speculative search
+        :param used: Whether its results were used without a second search
+        :param saved_seconds: Wall time saved, negative when waiting for it cost time
+        """
+        if used:
+            self.used += 1
+        else:
+            self.fused += 1
+        self._saved_seconds += saved_seconds
+
+    def clear(self):
+        self.used = 0
+        self.fused = 0
+        self.failed = 0
+        self._saved_seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        runs = self.used + self.fused
+        return {
+            "enabled": self.enabled,
+            "min_similarity": self.min_similarity,
+            "used": self.used,
+            "fused": self.fused,
+            "failed": self.failed,
+            "used_rate": self.used / runs if runs else 0.0,
+            "saved_seconds": self._saved_seconds,
+        }
+
+
+class HybridRetrieval:
+    """Whether answers use hybrid retrieval, with the latency and yield of each branch"""
+
+    def __init__(self, enabled: bool = False):
+        self.configure(enabled)
+        self.clear()
+
+    def configure(self, enabled: bool):
+        self.enabled = enabled
+
+    def record(
+        self,
+        vector: List[RetrievedTopic],
+        lexical: List[RetrievedTopic],
+        vector_seconds: float,
+        lexical_seconds: float,
+    ):
+        self.searches += 1
+        # Topics the vector search alone would have missed
+        self.lexical_only += len({t.id for t in lexical} - {t.id for t in vector})
+        self._vector_seconds += vector_seconds
+        self._lexical_seconds += lexical_seconds
+
+    def clear(self):
+        self.searches = 0
+        self.lexical_only = 0
+        self._vector_seconds = 0.0
+        self._lexical_seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "searches": self.searches,
+            "lexical_only_topics": self.lexical_only,
+            "average_vector_seconds": self._vector_seconds / self.searches if self.searches else 0.0,
+            "average_lexical_seconds": (
+                self._lexical_seconds / self.searches if self.searches else 0.0
+            ),
+        }
+
+
+# Shared by every handler in the process, configured from the settings at startup
+speculative_retrieval = SpeculativeRetrieval()
+hybrid_retrieval = HybridRetrieval()
@@ -1,9 +1,14 @@
 import logging
+import time
+
 from sqlmodel.ext.asyncio.session import AsyncSession
 from voyageai.client_async import AsyncClient
 
+from handler.admission import AdmissionRejected, admission_controller
 from handler.knowledge_base_answers import KnowledgeBaseAnswers
+from handler.reactions import reactions
 from models import Message
+from utils.latency import pipeline_latency
 from whatsapp import WhatsAppClient
 from .base_handler import BaseHandler
 
@@ -24,18 +29,26 @@ class Router(BaseHandler):
         super().__init__(session, whatsapp, embedding_client)
 
     async def __call__(self, message: Message):
-        # Send immediate emoji reaction to acknowledge message receipt
-        try:
-            await self.whatsapp.react_to_message(
-                message_id=message.message_id,
-                phone=message.chat_jid,
-                emoji="💬"
-            )
-            logger.info(f"Sent immediate reaction 💬 for message {message.message_id}")
-        except Exception as e:
-            logger.warning(f"Failed to send immediate reaction: {e}")
-        
-        # Route all intents to LLM knowledge base for intelligent responses
-        await self.ask_knowledge_base(message)
+        # Acknowledge the message in the background, answering doesn't wait for it
+        reactions.start(self.whatsapp, message.message_id, message.chat_jid)
 
+        if admission_controller.would_wait():
+            # Don't hold on to a pooled DB connection while waiting for a slot. This also
+            # commits the stored message ahead of its journal entry, which is only marked
+            # processed once answered: a crash in between replays the entry, storing the
+            # message again (a no-op) and answering it.
+            await self.session.commit()
+
+        # Route all intents to LLM knowledge base for intelligent responses
+        try:
+            waiting_since = time.monotonic()
+            async with admission_controller.admit():
+                pipeline_latency.stages()["admission_wait"] = time.monotonic() - waiting_since
+                await self.ask_knowledge_base(message)
+        except AdmissionRejected as e:
+            logger.warning(f"Shedding message {message.message_id}, pipeline overloaded: {e}")
+            trace = pipeline_latency.current()
+            if trace is not None:
+                trace.fields["outcome"] = "busy"
+            await self.send_message(message.chat_jid, admission_controller.busy_reply)
 
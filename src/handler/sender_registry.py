@@ -0,0 +1,224 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import and_, event
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import Sender
+
+logger = logging.getLogger(__name__)
+
+# Key of the senders written by a session but not committed yet, in `Session.info`
+_STAGED_KEY = "sender_registry_staged"
+# SQLSTATE of a foreign key violation
+_FOREIGN_KEY_VIOLATION = "23503"
+
+
+def sender_upsert(rows: List[Dict[str, Any]]):
+    """
+    Insert senders, updating the push name of existing ones only when a new,
+    different push name is given
+    """
+    stmt = insert(Sender).values(rows)
+    push_name = Sender.__table__.c.push_name
+    return stmt.on_conflict_do_update(
+        index_elements=["jid"],
+        set_={"push_name": stmt.excluded.push_name},
+        where=and_(
+            stmt.excluded.push_name.is_not(None),
+            push_name.is_distinct_from(stmt.excluded.push_name),
+        ),
+    )
+
+
+def is_foreign_key_violation(error: BaseException) -> bool:
+    """Whether a failed write referenced a row that doesn't exist, e.g. a deleted sender"""
+    if not isinstance(error, IntegrityError):
+        return False
+    orig = error.orig
+    return (getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)) == _FOREIGN_KEY_VIOLATION
+
+
+class SenderRegistry:
+    """
+    Bounded, process-local LRU of the senders known to be in the database, with their last push name.
+
+    Messages of known senders skip the sender lookup entirely. New senders are written
+    right away, since messages reference them, but only become known once the transaction
+    that wrote them commits. Push name changes of known senders are collected and written
+    in batches by a background task.
+    """
+
+    def __init__(self, max_size: int = 10000, batch_size: int = 500):
+        self.configure(max_size, batch_size)
+        self._senders: OrderedDict[str, str | None] = OrderedDict()
+        self._pending_names: Dict[str, str] = {}
+        self._flusher: asyncio.Task | None = None
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.name_changes = 0
+        self.flushes = 0
+
+    def configure(self, max_size: int, batch_size: int):
+        assert max_size > 0, "max_size must be positive"
+        self.max_size = max_size
+        self.batch_size = batch_size
+
+    async def ensure(self, session: AsyncSession, jid: str, push_name: str | None = None):
+        """
+        Make sure a sender exists before one of its messages is written
+        :param session: Session of the transaction writing the message
+        :param jid: Normalized JID of the sender
+        :param push_name: Current push name of the sender [Optional]
+        """
+        await self.ensure_many(session, {jid: push_name})
+
+    async def ensure_many(self, session: AsyncSession, senders: Dict[str, str | None]):
+        """
+        Make sure many senders exist, writing the unknown ones in as few statements as possible
+        :param session: Session of the transaction writing the messages
+        :param senders: Push names by normalized sender JID
+        """
+        staged = self._staged(session)
+        rows = []
+        for jid, push_name in senders.items():
+            if jid in staged or self._lookup(jid, push_name):
+                continue
+            rows.append({"jid": jid, "push_name": push_name})
+
+        for i in range(0, len(rows), self.batch_size):
+            await session.exec(sender_upsert(rows[i : i + self.batch_size]))
+        self.writes += len(rows)
+
+        if isinstance(getattr(session, "sync_session", None), Session):
+            for row in rows:
+                staged[row["jid"]] = (self, row["push_name"])
+        else:
+            for row in rows:
+                self._remember(row["jid"], row["push_name"])
+
+    def _staged(self, session: AsyncSession) -> Dict[str, Tuple["SenderRegistry", str | None]]:
+        sync_session = getattr(session, "sync_session", None)
+        if not isinstance(sync_session, Session):
+            return {}
+        return sync_session.info.setdefault(_STAGED_KEY, {})
+
+    def _lookup(self, jid: str, push_name: str | None) -> bool:
+        if jid not in self._senders:
+            self.misses += 1
+            return False
+        self.hits += 1
+        self._senders.move_to_end(jid)
+        if push_name and push_name != self._senders[jid]:
+            self._senders[jid] = push_name
+            self._pending_names[jid] = push_name
+            self.name_changes += 1
+        return True
+
+    def _remember(self, jid: str, push_name: str | None):
+        if jid in self._senders:
+            self._senders.move_to_end(jid)
+            if not push_name:
+                return
+        self._senders[jid] = push_name
+        while len(self._senders) > self.max_size:
+            self._senders.popitem(last=False)
+
+    def clear(self):
+        """Forget every sender and reset the counters"""
+        self._senders.clear()
+        self._pending_names.clear()
+        self.hits = self.misses = self.writes = self.name_changes = self.flushes = 0
+
+    def forget(self, jid: str):
+        """Drop a sender from the registry, e.g. after it was deleted from the database"""
+        self._senders.pop(jid, None)
+        self._pending_names.pop(jid, None)
+
+    async def flush(self, async_session: async_sessionmaker[AsyncSession]):
+        """Write the pending push name changes, in batches"""
+        pending, self._pending_names = self._pending_names, {}
+        rows = [{"jid": jid, "push_name": name} for jid, name in pending.items()]
+        try:
+            async with async_session() as session:
+                for i in range(0, len(rows), self.batch_size):
+                    await session.exec(sender_upsert(rows[i : i + self.batch_size]))
+                await session.commit()
+        except Exception:
+            # Keep them for the next flush, unless a newer name arrived meanwhile
+            self._pending_names = {**pending, **self._pending_names}
+            raise
+        self.flushes += 1
+
+    def start(self, async_session: async_sessionmaker[AsyncSession], flush_interval: float = 5.0):
+        """Flush pending push name changes every `flush_interval` seconds in the background"""
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(
+                self._flush_periodically(async_session, flush_interval),
+                name="sender-registry",
+            )
+
+    async def stop(self, async_session: async_sessionmaker[AsyncSession]):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        if self._pending_names:
+            try:
+                await self.flush(async_session)
+            except Exception as e:
+                logger.error(f"Failed writing {len(self._pending_names)} push name changes: {e}")
+
+    async def _flush_periodically(
+        self, async_session: async_sessionmaker[AsyncSession], flush_interval: float
+    ):
+        while True:
+            await asyncio.sleep(flush_interval)
+            if not self._pending_names:
+                continue
+            try:
+                await self.flush(async_session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed writing push name changes: {e}")
+
+    def __len__(self) -> int:
+        return len(self._senders)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._senders),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "name_changes": self.name_changes,
+            "pending_name_changes": len(self._pending_names),
+            "flushes": self.flushes,
+        }
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_committed_senders(session: Session):
+    for jid, (registry, push_name) in session.info.pop(_STAGED_KEY, {}).items():
+        registry._remember(jid, push_name)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_staged_senders(session: Session):
+    session.info.pop(_STAGED_KEY, None)
+
+
+# Shared by every handler in the process, configured from the settings at startup
+sender_registry = SenderRegistry()
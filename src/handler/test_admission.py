@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from handler.admission import AdmissionController, AdmissionRejected
+
+
+async def _hold(controller: AdmissionController, release: asyncio.Event):
+    async with controller.admit():
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test_requests_queue_then_shed_above_high_water_mark():
+    controller = AdmissionController(max_concurrent=2, max_waiting=1, wait_timeout=1.0)
+    release = asyncio.Event()
+
+    tasks = [asyncio.create_task(_hold(controller, release)) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert controller.stats()["in_flight"] == 2
+    assert controller.stats()["waiting"] == 1
+
+    with pytest.raises(AdmissionRejected):
+        async with controller.admit():
+            pass
+
+    release.set()
+    await asyncio.gather(*tasks)
+
+    stats = controller.stats()
+    assert stats["admitted"] == 3
+    assert stats["queued"] == 1
+    assert stats["shed"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["waiting"] == 0
+
+
+@pytest.mark.asyncio
+async def test_waiting_too_long_is_shed_and_frees_the_queue():
+    controller = AdmissionController(max_concurrent=1, max_waiting=5, wait_timeout=0.01)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(controller, release))
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionRejected):
+        async with controller.admit():
+            pass
+
+    release.set()
+    await holder
+    # The slot is free again for the next request
+    async with controller.admit():
+        assert controller.stats()["in_flight"] == 1
+
+    stats = controller.stats()
+    assert stats["timed_out"] == 1
+    assert stats["waiting"] == 0
@@ -0,0 +1,197 @@
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from api.database_admin import clear_database_data
+from handler import MessageHandler
+from handler.base_handler import BaseHandler
+from handler.sender_registry import SenderRegistry, sender_registry
+from models import Message, Sender, WhatsAppWebhookPayload, bulk_upsert, upsert
+from test_utils.mock_session import AsyncSessionMock, mock_session  # noqa
+
+
+@pytest.fixture(autouse=True)
+def empty_sender_registry():
+    sender_registry.clear()
+    yield
+    sender_registry.clear()
+
+
+def _payload(message_id: str, text: str | None, pushname: str | None = "Test User"):
+    return WhatsAppWebhookPayload(
+        from_="1234567890@s.whatsapp.net",
+        timestamp=datetime.now(timezone.utc),
+        pushname=pushname,
+        message={"id": message_id, "text": text},
+    )
+
+
+@pytest.mark.asyncio
+async def test_store_messages_writes_in_bulk(mock_session: AsyncSessionMock):
+    handler = BaseHandler(mock_session, AsyncMock(), AsyncMock())
+
+    messages = await handler.store_messages(
+        [
+            _payload("m1", "first"),
+            _payload("m2", None),  # no text, not stored
+            _payload("m3", "second", pushname=None),
+            _payload("m1", "first, redelivered"),
+        ]
+    )
+
+    assert [m.message_id for m in messages] == ["m1", "m3"]
+    assert messages[0].text == "first, redelivered"
+    # One statement for the senders, one for the messages
+    statements = [call.args[0] for call in mock_session.exec.await_args_list]
+    assert [s.table.name for s in statements] == ["sender", "message"]
+    sender_sql = str(statements[0].compile(dialect=postgresql.dialect()))
+    # Existing senders are only touched when their push name changed
+    assert "ON CONFLICT (jid) DO UPDATE" in sender_sql
+    assert "IS DISTINCT FROM" in sender_sql
+
+
+@pytest.mark.asyncio
+async def test_known_senders_skip_the_database(mock_session: AsyncSessionMock):
+    handler = BaseHandler(mock_session, AsyncMock(), AsyncMock())
+
+    await handler.store_message(_payload("m1", "first"))
+    await handler.store_message(_payload("m2", "second"))
+    await handler.store_message(_payload("m3", "third", pushname=None))
+
+    statements = [call.args[0] for call in mock_session.exec.await_args_list]
+    assert [s.table.name for s in statements if hasattr(s, "table")].count("sender") == 1
+    stats = sender_registry.stats()
+    assert (stats["hits"], stats["misses"], stats["writes"]) == (2, 1, 1)
+
+    # A new push name is queued for the background flush instead of written inline
+    await handler.store_message(_payload("m4", "fourth", pushname="New Name"))
+    assert sender_registry.stats()["pending_name_changes"] == 1
+
+
+class _ForeignKeyViolation(Exception):
+    sqlstate = "23503"
+
+
+def _sender_writes(session: AsyncSessionMock) -> int:
+    statements = [call.args[0] for call in session.exec.await_args_list]
+    return [getattr(s, "table", None) is not None and s.table.name for s in statements].count("sender")
+
+
+@pytest.mark.asyncio
+async def test_senders_are_written_again_after_the_data_is_cleared(mock_session: AsyncSessionMock):
+    handler = BaseHandler(mock_session, AsyncMock(), AsyncMock())
+    await handler.store_message(_payload("m1", "first"))
+    assert len(sender_registry) == 1
+
+    await clear_database_data(mock_session)
+    assert len(sender_registry) == 0
+
+    await handler.store_message(_payload("m2", "second"))
+    assert _sender_writes(mock_session) == 2
+
+
+@pytest.mark.asyncio
+async def test_senders_deleted_elsewhere_are_written_again(mock_session: AsyncSessionMock):
+    handler = BaseHandler(mock_session, AsyncMock(), AsyncMock())
+    await handler.store_message(_payload("m1", "first"))
+    # Another replica cleared the senders, the message insert fails its foreign key once
+    violation = IntegrityError("INSERT INTO message", {}, _ForeignKeyViolation())
+    mock_session.scalar.side_effect = [violation, None]
+
+    await handler.store_message(_payload("m2", "second"))
+    assert _sender_writes(mock_session) == 2
+    assert mock_session.scalar.await_count == 3
+
+    calls = mock_session.exec.await_count
+    mock_session.exec.side_effect = [violation, None, None]
+    await handler.store_messages([_payload("m3", "third")])
+    # The failed message insert, then the sender and the message again
+    assert mock_session.exec.await_count == calls + 3
+
+
+@pytest.mark.asyncio
+async def test_other_integrity_errors_are_raised(mock_session: AsyncSessionMock):
+    handler = BaseHandler(mock_session, AsyncMock(), AsyncMock())
+    mock_session.scalar.side_effect = IntegrityError("INSERT INTO message", {}, Exception("unique"))
+
+    with pytest.raises(IntegrityError):
+        await handler.store_message(_payload("m1", "first"))
+
+
+@pytest.mark.asyncio
+async def test_new_senders_are_known_only_after_commit():
+    registry = SenderRegistry()
+    sync_session = Session(create_engine("sqlite://"))
+
+    class _Session:
+        exec = AsyncMock()
+
+    session = _Session()
+    session.sync_session = sync_session
+
+    sync_session.connection()  # begin a transaction
+    await registry.ensure(session, "1@s.whatsapp.net", "One")
+    await registry.ensure(session, "1@s.whatsapp.net", "One")
+    assert session.exec.await_count == 1
+    sync_session.rollback()
+    assert len(registry) == 0
+
+    sync_session.connection()
+    await registry.ensure(session, "1@s.whatsapp.net", "One")
+    sync_session.commit()
+    assert len(registry) == 1
+    assert session.exec.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_splits_large_batches(mock_session: AsyncSessionMock):
+    senders = [Sender(jid=f"{i}@s.whatsapp.net") for i in range(25)]
+    await bulk_upsert(mock_session, senders, batch_size=10)
+
+    assert mock_session.exec.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_upsert_reads_the_row_back_with_returning(mock_session: AsyncSessionMock):
+    message = Message(
+        message_id="a",
+        text="hello",
+        chat_jid="1234567890@s.whatsapp.net",
+        sender_jid="1234567890@s.whatsapp.net",
+    )
+    mock_session.scalar.return_value = message
+
+    assert await upsert(mock_session, message, on_conflict="changed") is message
+    sql = str(mock_session.scalar.await_args.args[0].compile(dialect=postgresql.dialect()))
+    assert "RETURNING message.message_id" in sql
+    assert "WHERE message.timestamp IS DISTINCT FROM excluded.timestamp OR" in sql
+    # One round trip, no re-select
+    mock_session.exec.assert_not_awaited()
+
+    # An unchanged row isn't returned, so it is read separately
+    mock_session.scalar.return_value = None
+    await upsert(mock_session, message, on_conflict="nothing")
+    mock_session.exec.assert_awaited_once()
+
+
+def test_should_answer():
+    private = Message(
+        message_id="a",
+        text="hello",
+        chat_jid="1234567890@s.whatsapp.net",
+        sender_jid="1234567890@s.whatsapp.net",
+    )
+    group = Message(
+        message_id="b",
+        text="hello",
+        chat_jid="123456789-123456@g.us",
+        sender_jid="1234567890@s.whatsapp.net",
+    )
+    assert MessageHandler.should_answer(private)
+    assert not MessageHandler.should_answer(group)
+    assert not MessageHandler.should_answer(None)
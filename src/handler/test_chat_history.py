@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from handler.chat_history import ChatHistory, history2text
+from models import Message
+from utils.chat_text import chat2text
+
+CHAT = "1234567890@s.whatsapp.net"
+START = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _message(i: int, chat_jid: str = CHAT, text: str | None = None) -> Message:
+    return Message(
+        message_id=f"m{i}",
+        timestamp=START + timedelta(minutes=i),
+        text=text or f"message {i}",
+        chat_jid=chat_jid,
+        sender_jid=chat_jid,
+    )
+
+
+def _session(rows=()):
+    session = MagicMock()
+    result = MagicMock()
+    result.all.return_value = [(m.message_id, m.timestamp, m.sender_jid, m.text) for m in rows]
+    session.exec = AsyncMock(return_value=result)
+    return session
+
+
+@pytest.mark.asyncio
+async def test_chats_are_loaded_once_then_served_from_memory():
+    history = ChatHistory(messages_per_chat=3)
+    # The database returns the newest first
+    session = _session([_message(2), _message(1)])
+
+    entries = await history.recent(session, CHAT, limit=3)
+    assert [e.message_id for e in entries] == ["m2", "m1"]
+    assert history2text(entries) == chat2text([_message(2), _message(1)])
+
+    history.add(session, [_message(3), _message(4)])
+    entries = await history.recent(session, CHAT, limit=3)
+    assert [e.message_id for e in entries] == ["m4", "m3", "m2"]
+    assert session.exec.await_count == 1
+    assert history.stats()["hits"] == 1
+
+    # Messages of chats that aren't buffered are left to the database
+    history.add(session, [_message(5, chat_jid="999@s.whatsapp.net")])
+    assert len(history) == 1
+
+
+@pytest.mark.asyncio
+async def test_rewritten_and_out_of_order_messages():
+    history = ChatHistory(messages_per_chat=3)
+    session = _session()
+    await history.recent(session, CHAT)
+
+    history.add(session, [_message(3), _message(1), _message(2)])
+    history.add(session, [_message(3, text="edited")])
+    entries = await history.recent(session, CHAT)
+    assert [(e.message_id, e.text) for e in entries] == [
+        ("m3", "edited"),
+        ("m2", "message 2"),
+        ("m1", "message 1"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_idle_chats_are_evicted():
+    history = ChatHistory(messages_per_chat=3, max_chats=2)
+    session = _session()
+    for chat in ("1@s.whatsapp.net", "2@s.whatsapp.net"):
+        await history.recent(session, chat)
+    await history.recent(session, "1@s.whatsapp.net")
+    await history.recent(session, "3@s.whatsapp.net")
+
+    assert history.stats()["evictions"] == 1
+    await history.recent(session, "1@s.whatsapp.net")
+    assert history.stats()["hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_messages_enter_the_buffer_on_commit():
+    history = ChatHistory(messages_per_chat=3)
+    session = _session()
+    session.sync_session = Session(create_engine("sqlite://"))
+    await history.recent(session, CHAT)
+
+    session.sync_session.connection()  # begin a transaction
+    history.add(session, [_message(1)])
+    # The writing session sees its own message, others don't yet
+    assert [e.message_id for e in await history.recent(session, CHAT)] == ["m1"]
+    assert await history.recent(_session(), CHAT) == []
+    session.sync_session.rollback()
+    assert await history.recent(session, CHAT) == []
+
+    session.sync_session.connection()
+    history.add(session, [_message(2)])
+    session.sync_session.commit()
+    assert [e.message_id for e in await history.recent(_session(), CHAT)] == ["m2"]
+
+
+@pytest.mark.asyncio
+async def test_chats_are_reloaded_after_the_ttl(monkeypatch: pytest.MonkeyPatch):
+    now = 1000.0
+    monkeypatch.setattr("handler.chat_history.time.monotonic", lambda: now)
+    history = ChatHistory(messages_per_chat=3, ttl=10)
+    session = _session([_message(1)])
+    await history.recent(session, CHAT)
+
+    # Another replica stored a message through its own session
+    session.exec.return_value.all.return_value = [
+        (m.message_id, m.timestamp, m.sender_jid, m.text) for m in (_message(2), _message(1))
+    ]
+    assert [e.message_id for e in await history.recent(session, CHAT)] == ["m1"]
+
+    now += 10
+    assert [e.message_id for e in await history.recent(session, CHAT)] == ["m2", "m1"]
+    assert session.exec.await_count == 2
+    stats = history.stats()
+    assert (stats["hits"], stats["misses"], stats["reloads"]) == (1, 1, 1)
@@ -0,0 +1,66 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from handler.reactions import Reactions
+
+
+def _whatsapp(delay: float = 0.0, error: Exception | None = None):
+    calls = []
+
+    async def react_to_message(message_id: str, phone: str, emoji: str):
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        calls.append((message_id, emoji))
+
+    whatsapp = AsyncMock()
+    whatsapp.react_to_message = react_to_message
+    whatsapp.calls = calls
+    return whatsapp
+
+
+@pytest.mark.asyncio
+async def test_reactions_go_out_in_the_background_and_in_order():
+    reactions = Reactions()
+    whatsapp = _whatsapp(delay=0.02)
+
+    reactions.start(whatsapp, "m1", "1@s.whatsapp.net")
+    reactions.finish(whatsapp, "m1", "1@s.whatsapp.net")
+    # Nothing was awaited yet
+    assert whatsapp.calls == []
+    assert reactions.stats()["pending"] == 2
+
+    await reactions.drain()
+    # The ✅ must not be replaced by a late 💬
+    assert whatsapp.calls == [("m1", "💬"), ("m1", "✅")]
+    assert reactions.stats()["sent"] == {"💬": 1, "✅": 1}
+    assert reactions._latest == {}
+
+
+@pytest.mark.asyncio
+async def test_modes():
+    whatsapp = _whatsapp()
+    for mode, expected in (("none", []), ("start", ["💬"]), ("start_finish", ["💬", "✅"])):
+        reactions = Reactions(mode=mode)
+        whatsapp.calls.clear()
+        reactions.start(whatsapp, "m1", "1@s.whatsapp.net")
+        reactions.finish(whatsapp, "m1", "1@s.whatsapp.net")
+        await reactions.drain()
+        assert [emoji for _, emoji in whatsapp.calls] == expected
+
+
+@pytest.mark.asyncio
+async def test_failures_and_overflow_are_counted():
+    reactions = Reactions(max_concurrent=1, max_pending=2)
+    whatsapp = _whatsapp(error=ConnectionError("gateway down"))
+
+    for i in range(3):
+        reactions.start(whatsapp, f"m{i}", "1@s.whatsapp.net")
+    await reactions.drain()
+
+    stats = reactions.stats()
+    assert stats["failed"] == {"ConnectionError": 2}
+    assert stats["dropped"] == 1
+    assert stats["pending"] == 0
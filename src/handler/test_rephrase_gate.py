@@ -0,0 +1,56 @@
+import pytest
+
+from handler.rephrase_gate import RephraseGate
+from models import Message
+
+
+def _message(text: str, reply_to_id: str | None = None) -> Message:
+    return Message(
+        message_id="m1",
+        text=text,
+        chat_jid="1234567890@s.whatsapp.net",
+        sender_jid="1234567890@s.whatsapp.net",
+        reply_to_id=reply_to_id,
+    )
+
+
+@pytest.mark.parametrize(
+    "text, reason",
+    [
+        ("How do I create a new agent in Jeen?", None),
+        ("What file types can the knowledge base index?", None),
+        ("איך יוצרים סוכן חדש?", "language"),
+        ("¿Cómo creo un agente nuevo?", "language"),
+        ("Wie erstelle ich einen Agenten?", "language"),
+        ("agent?", "length"),
+        ("And how do I delete it?", "reference"),
+        ("Can I share that with my team?", "reference"),
+        ("Hi, how do I reset my password?", "filler"),
+        ("How do I\ncreate an agent?", "multi_line"),
+    ],
+)
+def test_rephrase_reason(text, reason):
+    assert RephraseGate().rephrase_reason(_message(text)) == reason
+
+
+def test_replies_are_rephrased():
+    gate = RephraseGate()
+    assert gate.rephrase_reason(_message("How do I create an agent?", "m0")) == "reply"
+
+
+def test_stats_estimate_saved_latency():
+    gate = RephraseGate()
+    assert gate.should_rephrase(_message("Can I share that with my team?"))
+    gate.observe(1.5)
+    assert not gate.should_rephrase(_message("How do I create a new agent?"))
+    assert not gate.should_rephrase(_message("How do I upload a PDF document?"))
+
+    stats = gate.stats()
+    assert (stats["checked"], stats["skipped"]) == (3, 2)
+    assert stats["reasons"] == {"reference": 1}
+    assert stats["saved_seconds"] == pytest.approx(3.0)
+
+
+def test_disabled_gate_always_rephrases():
+    gate = RephraseGate(enabled=False)
+    assert gate.should_rephrase(_message("How do I create a new agent?"))
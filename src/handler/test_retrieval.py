@@ -0,0 +1,129 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from handler import knowledge_base_answers
+from handler import retrieval as retrieval_module
+from handler.knowledge_base_answers import KnowledgeBaseAnswers
+from handler.retrieval import (
+    RetrievedTopic,
+    fuse_results,
+    hybrid_retrieval,
+    hybrid_search,
+    lexical_topics_query,
+    nearest_topics_query,
+    speculative_retrieval,
+)
+
+
+def _topic(topic_id: str, distance: float = 0.3) -> RetrievedTopic:
+    return RetrievedTopic(topic_id, topic_id, f"about {topic_id}", "test", distance)
+
+
+@pytest.fixture(autouse=True)
+def reset_speculative_retrieval():
+    speculative_retrieval.clear()
+    yield
+    speculative_retrieval.clear()
+
+
+def test_fuse_results_prefers_topics_found_by_both():
+    fused = fuse_results(
+        [[_topic("a", 0.3), _topic("b", 0.4)], [_topic("c", 0.2), _topic("b", 0.35)]], limit=2
+    )
+
+    assert [(t.id, t.distance) for t in fused] == [("b", 0.35), ("a", 0.3)]
+
+
+def test_nearest_topics_query_computes_the_distance_once():
+    sql = str(
+        nearest_topics_query([0.1] * 1024, limit=5, max_distance=0.7).compile(
+            dialect=postgresql.dialect()
+        )
+    )
+
+    assert sql.count("<=>") == 1
+    assert "kbtopic.embedding AS" not in sql and "kbtopic.embedding," not in sql
+    assert "ORDER BY distance" in sql
+
+
+def test_lexical_query_matches_any_word():
+    sql = str(lexical_topics_query("create a WORKFLOW", [0.1] * 1024).compile(dialect=postgresql.dialect()))
+
+    assert "plainto_tsquery('english'::regconfig" in sql
+    assert "kbtopic.search_vector @@" in sql
+    assert "ts_rank_cd" in sql
+
+
+@pytest.mark.asyncio
+async def test_hybrid_search_fuses_both_branches(monkeypatch):
+    hybrid_retrieval.clear()
+    vector = AsyncMock(return_value=[_topic("a", 0.3), _topic("b", 0.45)])
+    lexical = AsyncMock(
+        return_value=[_topic("c", 0.8)._replace(lexical_rank=0), _topic("b", 0.45)._replace(lexical_rank=1)]
+    )
+    monkeypatch.setattr(retrieval_module, "search_topics", vector)
+    monkeypatch.setattr(retrieval_module, "search_lexical", lexical)
+    timings = {}
+
+    topics = await hybrid_search(AsyncMock(bind=None), "Interactive 2", [1.0, 0.0], timings=timings)
+
+    assert [t.id for t in topics] == ["b", "a", "c"]
+    assert topics[0].lexical_rank == 1 and topics[1].lexical_rank is None
+    assert {"search_vector", "search_lexical"} <= timings.keys()
+    assert hybrid_retrieval.stats()["lexical_only_topics"] == 1
+
+
+@pytest.fixture
+def retrieval(monkeypatch):
+    embeddings = {"raw question": [1.0, 0.0], "close query": [0.99, 0.05], "other query": [0.0, 1.0]}
+    searches = {
+        (1.0, 0.0): [_topic("raw", 0.2)],
+        (0.0, 1.0): [_topic("rephrased")],
+    }
+    embed = AsyncMock(side_effect=lambda client, text, session=None: embeddings[text])
+    search = AsyncMock(side_effect=lambda session, embedding, *args: searches[tuple(embedding)])
+    monkeypatch.setattr(knowledge_base_answers.embedding_cache, "embed", embed)
+    monkeypatch.setattr(knowledge_base_answers, "search_topics", search)
+    return KnowledgeBaseAnswers(AsyncMock(), AsyncMock(), AsyncMock()), search
+
+
+@pytest.mark.asyncio
+async def test_close_rephrasing_reuses_the_speculative_search(retrieval):
+    handler, search = retrieval
+    speculation = asyncio.create_task(handler._speculative_search("raw question"))
+    timings = {}
+
+    embedding, topics = await handler._retrieve("close query", speculation, timings)
+
+    assert embedding == [0.99, 0.05]
+    assert [t.id for t in topics] == ["raw"]
+    assert search.await_count == 1
+    assert "search" not in timings and "speculative" in timings
+    assert speculative_retrieval.stats()["used"] == 1
+
+
+@pytest.mark.asyncio
+async def test_diverging_rephrasing_fuses_both_searches(retrieval):
+    handler, search = retrieval
+    speculation = asyncio.create_task(handler._speculative_search("raw question"))
+
+    _, topics = await handler._retrieve("other query", speculation, {})
+
+    assert {t.id for t in topics} == {"raw", "rephrased"}
+    assert search.await_count == 2
+    assert speculative_retrieval.stats()["fused"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_speculation_falls_back_to_the_rephrased_search(retrieval):
+    handler, search = retrieval
+    search.side_effect = [RuntimeError("database is gone"), [_topic("rephrased")]]
+    speculation = asyncio.create_task(handler._speculative_search("raw question"))
+
+    _, topics = await handler._retrieve("other query", speculation, {})
+
+    assert [t.id for t in topics] == ["rephrased"]
+    assert speculative_retrieval.stats()["failed"] == 1
@@ -0,0 +1,119 @@
+import time
+from unittest.mock import AsyncMock
+
+import numpy as np
+import pytest
+
+from handler.retrieval import search_topics
+from handler.topic_index import TopicIndex, topic_index
+from models import KBTopic
+from test_utils.mock_session import AsyncSessionMock, mock_session  # noqa
+
+
+def _topic(topic_id: str, embedding) -> KBTopic:
+    return KBTopic(
+        id=topic_id, subject=topic_id, content=f"about {topic_id}", source="test", embedding=embedding
+    )
+
+
+def _loaded_index(embeddings, **kwargs) -> TopicIndex:
+    index = TopicIndex(enabled=True, **kwargs)
+    index.upsert(_topic(f"t{i}", e) for i, e in enumerate(embeddings))
+    index._loaded_at = time.monotonic()
+    return index
+
+
+def test_search_matches_brute_force():
+    rng = np.random.default_rng(7)
+    embeddings = rng.normal(size=(200, 16)).astype(np.float32)
+    query = rng.normal(size=16)
+    index = _loaded_index(embeddings)
+
+    hits = index.search(query.tolist(), limit=5, max_distance=2.0)
+
+    unit = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    expected = np.argsort(1.0 - unit @ (query / np.linalg.norm(query)))[:5]
+    assert [hit[0] for hit in hits] == [f"t{i}" for i in expected]
+    assert [hit[4] for hit in hits] == sorted(hit[4] for hit in hits)
+
+
+def test_upsert_replaces_and_threshold_applies():
+    index = _loaded_index([[1.0, 0.0], [0.0, 1.0]])
+
+    assert [hit[0] for hit in index.search([1.0, 0.1], max_distance=0.5)] == ["t0"]
+
+    index.upsert([_topic("t0", [-1.0, 0.0])])
+    assert [hit[0] for hit in index.search([1.0, 0.1], max_distance=0.5)] == []
+    assert index.stats()["size"] == 2
+
+
+def test_falls_back_until_loaded_or_when_oversized():
+    index = TopicIndex(enabled=True)
+    assert index.search([1.0, 0.0]) is None
+
+    index = _loaded_index([[1.0, 0.0], [0.0, 1.0]], max_topics=1)
+    assert index.search([1.0, 0.0]) is None
+    assert index.stats()["fallbacks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_reload_keeps_topics_written_meanwhile(mock_session: AsyncSessionMock):
+    index = TopicIndex(enabled=True)
+    rows = [("t0", "t0", "about t0", "test", np.array([1.0, 0.0]))]
+
+    async def exec_(statement):
+        # The loader commits a topic while the table is being read
+        index.upsert([_topic("t1", [0.0, 1.0])])
+        result = AsyncMock()
+        result.all = lambda: rows
+        return result
+
+    mock_session.scalar.return_value = 1
+    mock_session.exec = exec_
+    await index.reload(mock_session)
+
+    assert index.ready
+    assert sorted(hit[0] for hit in index.search([1.0, 1.0], max_distance=2.0)) == ["t0", "t1"]
+
+
+@pytest.mark.asyncio
+async def test_reload_replays_writes_in_order(mock_session: AsyncSessionMock):
+    index = TopicIndex(enabled=True)
+    # The read saw t1 before it was deleted
+    rows = [("t1", "t1", "about t1", "test", np.array([0.0, 1.0]))]
+
+    async def exec_(statement):
+        index.upsert([_topic("t1", [0.0, 1.0])])
+        index.remove(["t1"])
+        index.remove(["t2"])
+        index.upsert([_topic("t2", [1.0, 0.0])])
+        result = AsyncMock()
+        result.all = lambda: rows
+        return result
+
+    mock_session.scalar.return_value = 1
+    mock_session.exec = exec_
+    await index.reload(mock_session)
+
+    # The deleted topic doesn't come back, the re-added one stays
+    assert [hit[0] for hit in index.search([1.0, 1.0], max_distance=2.0)] == ["t2"]
+
+
+@pytest.mark.asyncio
+async def test_search_topics_uses_a_ready_index(monkeypatch, mock_session: AsyncSessionMock):
+    monkeypatch.setattr(topic_index, "search", lambda *args: [("t0", "s", "c", "test", 0.1)])
+
+    hits = await search_topics(mock_session, [1.0, 0.0])
+
+    assert hits[0].id == "t0" and hits[0].distance == 0.1
+    mock_session.exec.assert_not_called()
+
+
+def test_remove_drops_deleted_topics():
+    index = _loaded_index([[1.0, 0.0], [0.0, 1.0], [0.7, 0.7]])
+
+    index.remove(["t0", "unknown"])
+
+    assert sorted(hit[0] for hit in index.search([1.0, 0.0], max_distance=2.0)) == ["t1", "t2"]
+    index.upsert([_topic("t3", [1.0, 0.0])])
+    assert index.search([1.0, 0.0], limit=1)[0][0] == "t3"
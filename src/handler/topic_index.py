@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import KBTopic
+
+logger = logging.getLogger(__name__)
+
+
+class TopicIndex:
+    """
+    In-memory exact nearest neighbour index of the knowledge base topics.
+
+    The embeddings are kept normalised in one contiguous float32 matrix, so a query
+    is a single matrix-vector product plus `argpartition`, with no database round
+    trip. The document loader of this process updates the index in place; the
+    periodic reload picks up topics written by other replicas. Searches return
+    None, and callers fall back to pgvector, while the index is disabled, not loaded
+    yet, stale, or holds more than `max_topics` topics.
+    """
+
+    def __init__(self, enabled: bool = False, max_topics: int = 20000, refresh_interval: float = 300.0):
+        self.configure(enabled, max_topics, refresh_interval)
+        self._reset()
+        self._loaded_at: float | None = None
+        # Upserts and removals made while a reload reads the table, replayed on top of it in order
+        self._writes_during_reload: List[Tuple[str, list]] | None = None
+        self._refresher: asyncio.Task | None = None
+
+        self.searches = 0
+        self.fallbacks = 0
+        self.reloads = 0
+        self._search_seconds = 0.0
+
+    def configure(self, enabled: bool, max_topics: int, refresh_interval: float):
+        self.enabled = enabled
+        self.max_topics = max_topics
+        self.refresh_interval = refresh_interval
+
+    def _reset(self):
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._rows: Dict[str, int] = {}
+        self._topics: List[tuple] = []
+        self._oversized = False
+
+    @property
+    def ready(self) -> bool:
+        """Whether searches are answered from memory"""
+        return (
+            self.enabled
+            and self._loaded_at is not None
+            # Missing two reloads in a row means the refresh loop is failing
+            and time.monotonic() - self._loaded_at < 2 * self.refresh_interval
+            and not self._oversized
+            and len(self._topics) <= self.max_topics
+        )
+
+    def search(self, embedding: List[float], limit: int = 10, max_distance: float = 0.7) -> List[tuple] | None:
+        """
+        Nearest topics of a query embedding, like `handler.retrieval.search_topics`
+        :return: (id, subject, content, source, distance) tuples nearest first,
+                 or None when the caller should query the database instead
+        """
+        if not self.ready:
+            self.fallbacks += 1
+            return None
+
+        started = time.perf_counter()
+        hits = []
+        if self._topics:
+            distances = 1.0 - self._matrix @ _unit(embedding)
+            if limit < len(distances):
+                nearest = np.argpartition(distances, limit)[:limit]
+            else:
+                nearest = np.arange(len(distances))
+            for row in nearest[np.argsort(distances[nearest], kind="stable")]:
+                distance = float(distances[row])
+                if distance >= max_distance:
+                    break
+                hits.append((*self._topics[row], distance))
+        self.searches += 1
+        self._search_seconds += time.perf_counter() - started
+        return hits
+
+    def upsert(self, topics: Iterable[KBTopic]):
+        """Add or replace topics, called once they are committed"""
+        topics = list(topics)
+        if self._writes_during_reload is not None:
+            self._writes_during_reload.append(("upsert", topics))
+        self._apply(topics)
+
+    def remove(self, topic_ids: Iterable[str]):
+        """Drop deleted topics, called once the deletion is committed"""
+        topic_ids = list(topic_ids)
+        if self._writes_during_reload is not None:
+            self._writes_during_reload.append(("remove", topic_ids))
+        self._remove(topic_ids)
+
+    def _remove(self, topic_ids: List[str]):
+        rows = {self._rows[i] for i in topic_ids if i in self._rows}
+        if not rows:
+            return
+        keep = [row for row in range(len(self._topics)) if row not in rows]
+        self._matrix = np.ascontiguousarray(self._matrix[keep])
+        self._topics = [self._topics[row] for row in keep]
+        self._rows = {topic[0]: i for i, topic in enumerate(self._topics)}
+
+    def _apply(self, topics: List[KBTopic]):
+        new_rows = []
+        for topic in topics:
+            vector = _unit(topic.embedding)
+            row = self._rows.get(topic.id)
+            if row is None:
+                self._rows[topic.id] = len(self._topics) + len(new_rows)
+                new_rows.append(vector)
+                self._topics.append((topic.id, topic.subject, topic.content, topic.source))
+            else:
+                self._matrix[row] = vector
+                self._topics[row] = (topic.id, topic.subject, topic.content, topic.source)
+        if new_rows:
+            stacked = np.stack(new_rows)
+            self._matrix = stacked if not self._matrix.size else np.vstack([self._matrix, stacked])
+
+    async def reload(self, session: AsyncSession):
+        """Rebuild the index from the database"""
+        total = await session.scalar(select(func.count(KBTopic.id)))
+        if total > self.max_topics:
+            # Not worth the memory, pgvector's HNSW index answers instead
+            self._reset()
+            self._oversized = True
+            self._loaded_at = time.monotonic()
+            logger.warning(f"{total} topics exceed the in-memory index limit of {self.max_topics}")
+            return
+
+        self._writes_during_reload = []
+        try:
+            result = await session.exec(
+                select(KBTopic.id, KBTopic.subject, KBTopic.content, KBTopic.source, KBTopic.embedding)
+            )
+            rows = result.all()
+            self._reset()
+            if rows:
+                self._matrix = np.ascontiguousarray(
+                    np.stack([_unit(embedding) for *_, embedding in rows])
+                )
+                self._topics = [tuple(row[:4]) for row in rows]
+                self._rows = {topic[0]: i for i, topic in enumerate(self._topics)}
+            writes, self._writes_during_reload = self._writes_during_reload, None
+            for op, items in writes:
+                if op == "upsert":
+                    self._apply(items)
+                else:
+                    self._remove(items)
+        finally:
+            self._writes_during_reload = None
+        self._loaded_at = time.monotonic()
+        self.reloads += 1
+        logger.info(f"Loaded {len(self._topics)} topics into the in-memory index")
+
+    def clear(self):
+        """Forget every topic, e.g. after the knowledge base table was emptied"""
+        self._reset()
+
+    def start(self, async_session: async_sessionmaker[AsyncSession]):
+        """Reload the index every `refresh_interval` seconds in the background, starting now"""
+        if self.enabled and self._refresher is None:
+            self._refresher = asyncio.create_task(
+                self._reload_periodically(async_session), name="topic-index"
+            )
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+
+    async def _reload_periodically(self, async_session: async_sessionmaker[AsyncSession]):
+        while True:
+            try:
+                async with async_session() as session:
+                    await self.reload(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed loading the topic index: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "size": len(self._topics),
+            "max_topics": self.max_topics,
+            "memory_bytes": self._matrix.nbytes,
+            "reloads": self.reloads,
+            "searches": self.searches,
+            "fallbacks": self.fallbacks,
+            "average_search_seconds": (
+                self._search_seconds / self.searches if self.searches else 0.0
+            ),
+        }
+
+
+def _unit(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+# Shared by every handler in the process, configured from the settings at startup
+topic_index = TopicIndex()
@@ -0,0 +1,35 @@
+from .dedup import RecentMessageIds
+from .filters import (
+    BroadcastRule,
+    ChatTypeRule,
+    FilterAction,
+    FilterRule,
+    MessageTypeRule,
+    PayloadFilter,
+    SenderRule,
+    payload_message_type,
+)
+from .ingestor import WebhookIngestor
+from .journal import IngestJournal
+from .processor import IngestItem, PayloadProcessor, payload_chat_jid
+from .worker_pool import ChatWorkerPool
+from .write_behind import MessageWriteBehind
+
+__all__ = [
+    "BroadcastRule",
+    "ChatTypeRule",
+    "ChatWorkerPool",
+    "FilterAction",
+    "FilterRule",
+    "IngestItem",
+    "IngestJournal",
+    "MessageTypeRule",
+    "MessageWriteBehind",
+    "PayloadFilter",
+    "PayloadProcessor",
+    "RecentMessageIds",
+    "SenderRule",
+    "WebhookIngestor",
+    "payload_chat_jid",
+    "payload_message_type",
+]
@@ -0,0 +1,59 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict
+
+
+class RecentMessageIds:
+    """
+    Bounded set of recently accepted message IDs, each remembered for `ttl` seconds.
+    When full, the oldest IDs are evicted first.
+    Used to drop webhook redeliveries before they cost any DB work.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600.0):
+        assert max_size > 0, "max_size must be positive"
+        self.max_size = max_size
+        self.ttl = ttl
+        self._seen: OrderedDict[str, float] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def check_and_add(self, message_id: str) -> bool:
+        """
+        Remember a message ID
+        :return: True if the ID was already seen within the TTL
+        """
+        now = time.monotonic()
+        seen_at = self._seen.get(message_id)
+        if seen_at is not None and now - seen_at < self.ttl:
+            self.hits += 1
+            return True
+
+        self._seen[message_id] = now
+        self._seen.move_to_end(message_id)
+        self.misses += 1
+        self._evict(now)
+        return False
+
+    def _evict(self, now: float):
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+        # Entries are ordered by the time they were added, so expired ones sit at the front
+        while self._seen:
+            oldest_id, seen_at = next(iter(self._seen.items()))
+            if now - seen_at < self.ttl:
+                break
+            del self._seen[oldest_id]
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._seen),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
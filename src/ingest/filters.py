@@ -0,0 +1,171 @@
+import logging
+from abc import ABC, abstractmethod
+from enum import Enum
+from typing import Any, Dict, Iterable, List
+
+from models import WhatsAppWebhookPayload
+from whatsapp.jid import (
+    BroadcastServer,
+    JIDParseError,
+    NewsletterServer,
+    normalize_jid,
+    parse_jid,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class FilterAction(str, Enum):
+    """What to do with a payload, in increasing order of severity"""
+
+    PASS = "pass"
+    # Keep the message for history, but never answer it
+    STORE_ONLY = "store_only"
+    # Discard the message before it reaches the journal or the database
+    DROP = "drop"
+
+
+_SEVERITY = {FilterAction.PASS: 0, FilterAction.STORE_ONLY: 1, FilterAction.DROP: 2}
+
+_MEDIA_TYPES = (
+    "image",
+    "video",
+    "audio",
+    "document",
+    "sticker",
+    "contact",
+    "list",
+    "location",
+    "order",
+)
+
+
+def payload_message_type(payload: WhatsAppWebhookPayload) -> str:
+    """
+    Type of the message carried by a payload: "reaction", a media or special type
+    such as "image" or "location", "text", or "other" for payloads without content
+    """
+    if payload.reaction:
+        return "reaction"
+    for message_type in _MEDIA_TYPES:
+        if getattr(payload, message_type, None):
+            return message_type
+    if payload.message and payload.message.text:
+        return "text"
+    return "other"
+
+
+def _split_from(payload: WhatsAppWebhookPayload) -> tuple[str, str]:
+    sender_jid, _, chat_jid = (payload.from_ or "").partition(" in ")
+    return sender_jid, chat_jid or sender_jid
+
+
+class FilterRule(ABC):
+    """A single filter rule, applying its action to the payloads it matches"""
+
+    name = "rule"
+
+    def __init__(self, action: FilterAction):
+        self.action = FilterAction(action)
+        self.matched = 0
+
+    @abstractmethod
+    def matches(self, payload: WhatsAppWebhookPayload) -> bool:
+        """Whether the rule applies to the payload"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "action": self.action.value, "matched": self.matched}
+
+
+class BroadcastRule(FilterRule):
+    """Matches status updates, broadcast lists and newsletter posts"""
+
+    name = "broadcast"
+
+    def matches(self, payload: WhatsAppWebhookPayload) -> bool:
+        _, chat_jid = _split_from(payload)
+        server = chat_jid.rpartition("@")[2]
+        return server in (BroadcastServer, NewsletterServer)
+
+
+class ChatTypeRule(FilterRule):
+    """Matches group chats, or private chats when `groups` is False"""
+
+    def __init__(self, action: FilterAction, groups: bool = True):
+        super().__init__(action)
+        self.groups = groups
+        self.name = "group" if groups else "private"
+
+    def matches(self, payload: WhatsAppWebhookPayload) -> bool:
+        _, chat_jid = _split_from(payload)
+        try:
+            is_group = parse_jid(chat_jid).is_group()
+        except JIDParseError:
+            return False
+        return is_group == self.groups
+
+
+class SenderRule(FilterRule):
+    """
+    Matches the senders of a deny list, or with `allow` every sender that is
+    not on the allow list
+    """
+
+    def __init__(self, action: FilterAction, jids: Iterable[str], allow: bool = False):
+        super().__init__(action)
+        # Accept bare phone numbers as well as full JIDs
+        self.jids = {normalize_jid(jid) for jid in jids}
+        self.allow = allow
+        self.name = "sender_allowlist" if allow else "sender_denylist"
+
+    def matches(self, payload: WhatsAppWebhookPayload) -> bool:
+        sender_jid, _ = _split_from(payload)
+        return (normalize_jid(sender_jid) in self.jids) != self.allow
+
+
+class MessageTypeRule(FilterRule):
+    """Matches payloads of the given message types, see `payload_message_type`"""
+
+    name = "message_type"
+
+    def __init__(self, action: FilterAction, message_types: Iterable[str]):
+        super().__init__(action)
+        self.message_types = set(message_types)
+
+    def matches(self, payload: WhatsAppWebhookPayload) -> bool:
+        return payload_message_type(payload) in self.message_types
+
+
+class PayloadFilter:
+    """
+    Chain of filter rules evaluated on a parsed payload, before any database access.
+
+    Every rule is checked in order and the most severe action of the matching rules
+    wins, so a "drop" rule can't be shadowed by an earlier "store only" one. Rules
+    are cheap, so all of them are checked even after a drop, and each rule's counter
+    shows every payload it matched.
+    """
+
+    def __init__(self, rules: List[FilterRule]):
+        self.rules = rules
+        self.evaluated = 0
+        self._actions = {action: 0 for action in FilterAction}
+
+    def evaluate(self, payload: WhatsAppWebhookPayload) -> FilterAction:
+        self.evaluated += 1
+        result = FilterAction.PASS
+        for rule in self.rules:
+            if rule.action == FilterAction.PASS or not rule.matches(payload):
+                continue
+            rule.matched += 1
+            if _SEVERITY[rule.action] > _SEVERITY[result]:
+                result = rule.action
+        self._actions[result] += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "evaluated": self.evaluated,
+            **{action.value: count for action, count in self._actions.items()},
+            "rules": [rule.stats() for rule in self.rules],
+        }
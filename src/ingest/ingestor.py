@@ -0,0 +1,196 @@
+import logging
+from typing import Any, Dict, List, Tuple
+
+from models import Message, WhatsAppWebhookPayload
+from .dedup import RecentMessageIds
+from .filters import FilterAction, PayloadFilter
+from .journal import IngestJournal
+from .processor import IngestItem, payload_chat_jid
+from .worker_pool import ChatWorkerPool
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookIngestor:
+    """
+    Entry point for accepted webhooks: filters out messages we don't want, drops
+    redeliveries, journals the payload and queues it for the workers.
+    """
+
+    def __init__(
+        self,
+        pool: ChatWorkerPool[IngestItem],
+        journal: IngestJournal | None = None,
+        recent_ids: RecentMessageIds | None = None,
+        payload_filter: PayloadFilter | None = None,
+    ):
+        self.pool = pool
+        self.journal = journal
+        self.recent_ids = recent_ids
+        self.payload_filter = payload_filter
+        self._journal_failures = 0
+        self._journal_duplicates = 0
+        self._replayed = 0
+
+    async def accept(self, payload: WhatsAppWebhookPayload, raw_body: bytes) -> bool:
+        """
+        Accept a validated webhook payload for background processing
+        :param payload: The validated payload
+        :param raw_body: The raw request body, written to the journal as is
+        :return: False if the payload was filtered out or is a redelivery of an already accepted message
+        """
+        action = self.classify(payload)
+        if action == FilterAction.DROP:
+            return False
+
+        message_id = payload.message.id if payload.message else None
+        if (
+            message_id
+            and self.recent_ids is not None
+            and self.recent_ids.check_and_add(message_id)
+        ):
+            logger.info(f"Dropping redelivered message {message_id}")
+            return False
+
+        journal_id = None
+        if self.journal:
+            try:
+                journal_id = await self.journal.append(raw_body, message_id)
+                if journal_id is None:
+                    # Accepted earlier, most likely by another replica
+                    self._journal_duplicates += 1
+                    logger.info(f"Dropping redelivered message {message_id}")
+                    return False
+            except Exception as e:
+                # Better to process without a safety net than to drop the message
+                self._journal_failures += 1
+                logger.error(f"Failed writing webhook to the ingest journal: {e}")
+
+        await self.pool.submit(
+            payload_chat_jid(payload),
+            IngestItem(payload, journal_id, store_only=action == FilterAction.STORE_ONLY),
+        )
+        return True
+
+    def classify(self, payload: WhatsAppWebhookPayload) -> FilterAction:
+        """Run the payload filter, without touching the journal or the database"""
+        if self.payload_filter is None:
+            return FilterAction.PASS
+        return self.payload_filter.evaluate(payload)
+
+    async def journal_batch(
+        self, payloads: List[WhatsAppWebhookPayload]
+    ) -> List[Tuple[WhatsAppWebhookPayload, int | None]]:
+        """
+        Drop the redeliveries of a batch of filtered payloads and journal the rest,
+        like `accept` does for single webhooks
+        :param payloads: Payloads that passed the filter, in delivery order
+        :return: The payloads to process, with their journal entry ID (None when not journaled)
+        """
+        accepted = []
+        for payload in payloads:
+            message_id = payload.message.id if payload.message else None
+            if (
+                message_id
+                and self.recent_ids is not None
+                and self.recent_ids.check_and_add(message_id)
+            ):
+                continue
+            accepted.append(payload)
+
+        journal_ids: Dict[str, int] = {}
+        if self.journal:
+            to_journal = {
+                payload.message.id: payload.model_dump_json(by_alias=True, exclude_none=True)
+                for payload in accepted
+                if payload.message
+            }
+            try:
+                journal_ids = await self.journal.append_many(
+                    [(body, message_id) for message_id, body in to_journal.items()]
+                )
+            except Exception as e:
+                # Better to process without a safety net than to drop the messages
+                self._journal_failures += 1
+                logger.error(f"Failed writing a webhook batch to the ingest journal: {e}")
+                to_journal = {}
+            # Accepted earlier, most likely by another replica
+            duplicates = to_journal.keys() - journal_ids.keys()
+            if duplicates:
+                self._journal_duplicates += len(duplicates)
+                logger.info(f"Dropping {len(duplicates)} redelivered messages of a batch")
+                accepted = [
+                    payload
+                    for payload in accepted
+                    if not payload.message or payload.message.id not in duplicates
+                ]
+
+        return [
+            (payload, journal_ids.get(payload.message.id) if payload.message else None)
+            for payload in accepted
+        ]
+
+    async def submit_stored(self, message: Message, journal_id: int | None = None):
+        """Queue a message that was already stored (e.g. by the batch endpoint) to be answered"""
+        await self.pool.submit(message.chat_jid, IngestItem(journal_id=journal_id, message=message))
+
+    async def resubmit(self, journal_id: int, raw_body: str):
+        """Queue a journal entry that was accepted earlier but never finished processing"""
+        try:
+            payload = WhatsAppWebhookPayload.model_validate_json(raw_body)
+        except ValueError as e:
+            logger.error(f"Skipping unreadable journal entry {journal_id}: {e}")
+            return
+        if not payload.from_:
+            return
+        # Replays go through the same filter chain as fresh webhooks
+        action = self.classify(payload)
+        if action == FilterAction.DROP:
+            if self.journal:
+                try:
+                    await self.journal.complete([journal_id])
+                except Exception as e:
+                    logger.error(f"Failed completing dropped journal entry {journal_id}: {e}")
+            return
+        self._replayed += 1
+        await self.pool.submit(
+            payload_chat_jid(payload),
+            IngestItem(payload, journal_id, store_only=action == FilterAction.STORE_ONLY),
+        )
+
+    def start(self):
+        self.pool.start()
+        if self.journal:
+            self.journal.start(self.resubmit)
+
+    async def stop(self, drain_timeout: float = 30.0):
+        if self.journal:
+            await self.journal.stop()
+        await self.pool.stop(drain_timeout)
+        if self.journal:
+            leftovers = [
+                item.journal_id
+                for item in self.pool.pending_items()
+                if item.journal_id is not None
+            ]
+            try:
+                await self.journal.release(leftovers)
+            except Exception as e:
+                logger.error(f"Failed releasing journal entries: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pool": self.pool.stats(),
+            "journal": {
+                "enabled": self.journal is not None,
+                "write_failures": self._journal_failures,
+                "duplicates": self._journal_duplicates,
+                "replayed": self._replayed,
+            },
+            "recent_ids": (
+                self.recent_ids.stats() if self.recent_ids is not None else None
+            ),
+            "filter": (
+                self.payload_filter.stats() if self.payload_filter is not None else None
+            ),
+        }
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel import or_
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import IngestEntry
+
+logger = logging.getLogger(__name__)
+
+
+class IngestJournal:
+    """
+    Durable journal of accepted webhook payloads, backed by the `ingestentry` table.
+
+    The webhook appends the raw body before acknowledging, and the entry is marked as
+    processed in the same transaction as the handler's writes. Entries whose claim went
+    stale (the replica that accepted them crashed or was redeployed) are claimed again
+    with `FOR UPDATE SKIP LOCKED`, so several replicas can sweep the table safely.
+    Processed entries are kept for the retention period, during which their unique
+    message ID rejects redeliveries that reach a different replica.
+    """
+
+    def __init__(
+        self,
+        async_session: async_sessionmaker[AsyncSession],
+        lease_seconds: float = 300.0,
+        retention_hours: float = 24.0,
+        max_attempts: int = 5,
+        sweep_interval: float = 60.0,
+        replay_batch_size: int = 500,
+    ):
+        self.async_session = async_session
+        self.lease = timedelta(seconds=lease_seconds)
+        self.retention = timedelta(hours=retention_hours)
+        self.max_attempts = max_attempts
+        self.sweep_interval = sweep_interval
+        self.replay_batch_size = replay_batch_size
+        self._sweeper: asyncio.Task | None = None
+
+    async def append(
+        self, payload: str | bytes, message_id: str | None = None
+    ) -> int | None:
+        """
+        Write an accepted payload to the journal, claimed by this replica
+        :param payload: Raw JSON body of the webhook
+        :param message_id: WhatsApp message ID of the payload [Optional]
+        :return: The journal entry ID, or None if the message ID was already journaled
+        """
+        if isinstance(payload, bytes):
+            payload = payload.decode()
+        now = datetime.now(timezone.utc)
+        async with self.async_session() as session:
+            entry_id = await session.scalar(
+                insert(IngestEntry)
+                .values(
+                    message_id=message_id,
+                    payload=payload,
+                    received_at=now,
+                    claimed_at=now,
+                    attempts=1,
+                )
+                .on_conflict_do_nothing(index_elements=["message_id"])
+                .returning(IngestEntry.id)
+            )
+            await session.commit()
+        return entry_id
+
+    async def append_many(self, entries: List[Tuple[str, str]]) -> Dict[str, int]:
+        """
+        Write many accepted payloads to the journal in one statement, claimed by this replica
+        :param entries: (raw JSON payload, WhatsApp message ID) of each payload
+        :return: Journal entry ID by message ID, without the message IDs that were already journaled
+        """
+        if not entries:
+            return {}
+        now = datetime.now(timezone.utc)
+        async with self.async_session() as session:
+            rows = (
+                await session.exec(
+                    insert(IngestEntry)
+                    .values(
+                        [
+                            {
+                                "message_id": message_id,
+                                "payload": payload,
+                                "received_at": now,
+                                "claimed_at": now,
+                                "attempts": 1,
+                            }
+                            for payload, message_id in entries
+                        ]
+                    )
+                    .on_conflict_do_nothing(index_elements=["message_id"])
+                    .returning(IngestEntry.message_id, IngestEntry.id)
+                )
+            ).all()
+            await session.commit()
+        return {row[0]: row[1] for row in rows}
+
+    @staticmethod
+    async def mark_processed(session: AsyncSession, entry_ids: List[int]):
+        """Mark entries as processed, as part of the caller's transaction"""
+        await session.exec(
+            update(IngestEntry)
+            .where(IngestEntry.id.in_(entry_ids))
+            .values(processed_at=datetime.now(timezone.utc))
+        )
+
+    async def complete(self, entry_ids: List[int]):
+        """Mark entries as processed in a transaction of their own, e.g. when they are filtered out"""
+        if not entry_ids:
+            return
+        async with self.async_session() as session:
+            await self.mark_processed(session, entry_ids)
+            await session.commit()
+
+    async def release(self, entry_ids: Iterable[int]):
+        """Drop this replica's claim on entries it won't process, so they are replayed right away"""
+        entry_ids = list(entry_ids)
+        if not entry_ids:
+            return
+        async with self.async_session() as session:
+            await session.exec(
+                update(IngestEntry)
+                .where(IngestEntry.id.in_(entry_ids), IngestEntry.processed_at.is_(None))
+                .values(claimed_at=None)
+            )
+            await session.commit()
+        logger.info(f"Released {len(entry_ids)} unprocessed journal entries")
+
+    async def claim_unfinished(self) -> List[Tuple[int, str]]:
+        """
+        Claim unprocessed entries that nobody is working on
+        :return: List of (entry ID, raw payload), oldest first
+        """
+        now = datetime.now(timezone.utc)
+        claimable = (
+            select(IngestEntry.id)
+            .where(
+                IngestEntry.processed_at.is_(None),
+                IngestEntry.attempts < self.max_attempts,
+                or_(
+                    IngestEntry.claimed_at.is_(None),
+                    IngestEntry.claimed_at < now - self.lease,
+                ),
+            )
+            .order_by(IngestEntry.id)
+            .limit(self.replay_batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        stmt = (
+            update(IngestEntry)
+            .where(IngestEntry.id.in_(claimable.scalar_subquery()))
+            .values(claimed_at=now, attempts=IngestEntry.attempts + 1)
+            .returning(IngestEntry.id, IngestEntry.payload)
+        )
+        async with self.async_session() as session:
+            rows = (await session.exec(stmt)).all()
+            await session.commit()
+        return sorted((row[0], row[1]) for row in rows)
+
+    async def prune(self) -> int:
+        """Delete processed entries older than the retention period"""
+        async with self.async_session() as session:
+            res = await session.exec(
+                delete(IngestEntry).where(
+                    IngestEntry.processed_at < datetime.now(timezone.utc) - self.retention
+                )
+            )
+            await session.commit()
+        return res.rowcount
+
+    async def replay(self, submit: Callable[[int, str], Awaitable[None]]) -> int:
+        """
+        Claim and resubmit every unfinished entry
+        :param submit: Called with the entry ID and raw payload of every claimed entry
+        :return: Number of replayed entries
+        """
+        replayed = 0
+        while True:
+            entries = await self.claim_unfinished()
+            for entry_id, payload in entries:
+                await submit(entry_id, payload)
+            replayed += len(entries)
+            if len(entries) < self.replay_batch_size:
+                break
+        if replayed:
+            logger.info(f"Replayed {replayed} unfinished journal entries")
+        return replayed
+
+    def start(self, submit: Callable[[int, str], Awaitable[None]]):
+        """Replay unfinished entries now, then keep sweeping for stale claims in the background"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep(submit), name="ingest-journal")
+
+    async def stop(self):
+        if self._sweeper is None:
+            return
+        self._sweeper.cancel()
+        await asyncio.gather(self._sweeper, return_exceptions=True)
+        self._sweeper = None
+
+    async def _sweep(self, submit: Callable[[int, str], Awaitable[None]]):
+        while True:
+            try:
+                await self.replay(submit)
+                pruned = await self.prune()
+                if pruned:
+                    logger.debug(f"Pruned {pruned} processed journal entries")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ingest journal sweep failed: {e}")
+            await asyncio.sleep(self.sweep_interval)
@@ -0,0 +1,88 @@
+import logging
+from dataclasses import dataclass
+from typing import List
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
+from voyageai.client_async import AsyncClient
+
+from handler import MessageHandler
+from models import Message, WhatsAppWebhookPayload
+from whatsapp import WhatsAppClient
+from whatsapp.jid import JIDParseError, parse_jid
+from .journal import IngestJournal
+from .write_behind import MessageWriteBehind
+
+logger = logging.getLogger(__name__)
+
+
+def payload_chat_jid(payload: WhatsAppWebhookPayload) -> str:
+    """
+    Get the chat JID of a webhook payload, used as the ordering key for background processing.
+    The `from` field is either "<sender>" for private chats or "<sender> in <chat>" for groups.
+    """
+    assert payload.from_, "Missing sender"
+    chat_jid = payload.from_.split(" in ")[-1]
+    try:
+        return str(parse_jid(chat_jid).to_non_ad())
+    except JIDParseError:
+        return chat_jid
+
+
+@dataclass
+class IngestItem:
+    """A webhook payload queued for processing"""
+
+    payload: WhatsAppWebhookPayload | None = None
+    # Journal entry of the payload, None when the journal is disabled or unavailable
+    journal_id: int | None = None
+    # Set instead of the payload for messages that were already stored and only need an answer
+    message: Message | None = None
+    # Stored for the chat history, but never answered
+    store_only: bool = False
+
+
+class PayloadProcessor:
+    """Runs the message handler for a batch of webhook payloads of one chat in its own DB session."""
+
+    def __init__(
+        self,
+        async_session: async_sessionmaker[AsyncSession],
+        whatsapp: WhatsAppClient,
+        embedding_client: AsyncClient,
+        write_behind: MessageWriteBehind | None = None,
+    ):
+        """
+        :param write_behind: Buffer for the store-only payloads, written inline when not set
+        """
+        self.async_session = async_session
+        self.whatsapp = whatsapp
+        self.embedding_client = embedding_client
+        self.write_behind = write_behind
+
+    async def __call__(self, items: List[IngestItem]):
+        if self.write_behind is not None:
+            store_only = [(i.payload, i.journal_id) for i in items if i.store_only]
+            if store_only:
+                await self.write_behind.add(store_only)
+                items = [item for item in items if not item.store_only]
+                if not items:
+                    return
+
+        async with self.async_session() as session:
+            try:
+                handler = MessageHandler(session, self.whatsapp, self.embedding_client)
+                store_only = [item.payload for item in items if item.store_only]
+                if store_only:
+                    # Skip the per-message path, nothing here will be answered
+                    await handler.store_messages(store_only)
+                to_answer = [item.message or item.payload for item in items if not item.store_only]
+                if to_answer:
+                    await handler.handle_burst(to_answer)
+                journal_ids = [i.journal_id for i in items if i.journal_id is not None]
+                if journal_ids:
+                    await IngestJournal.mark_processed(session, journal_ids)
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
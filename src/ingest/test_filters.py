@@ -0,0 +1,126 @@
+from datetime import datetime, timezone
+from typing import List
+
+import pytest
+
+from ingest import (
+    BroadcastRule,
+    ChatTypeRule,
+    ChatWorkerPool,
+    FilterAction,
+    FilterRule,
+    IngestItem,
+    MessageTypeRule,
+    PayloadFilter,
+    SenderRule,
+    WebhookIngestor,
+    payload_message_type,
+)
+from models import WhatsAppWebhookPayload
+
+
+def _payload(from_: str, message_id: str = "m1", **content) -> WhatsAppWebhookPayload:
+    content.setdefault("message", {"id": message_id, "text": "hi"})
+    return WhatsAppWebhookPayload(
+        from_=from_, timestamp=datetime.now(timezone.utc), **content
+    )
+
+
+def _filter() -> PayloadFilter:
+    return PayloadFilter(
+        [
+            BroadcastRule(FilterAction.DROP),
+            SenderRule(FilterAction.DROP, ["972500000666"]),
+            MessageTypeRule(FilterAction.DROP, ["reaction"]),
+            ChatTypeRule(FilterAction.STORE_ONLY, groups=True),
+        ]
+    )
+
+
+def test_rules_pick_the_most_severe_action():
+    payload_filter = _filter()
+
+    assert payload_filter.evaluate(_payload("1234567890@s.whatsapp.net")) == FilterAction.PASS
+    assert (
+        payload_filter.evaluate(_payload("1234567890@s.whatsapp.net in 123-456@g.us"))
+        == FilterAction.STORE_ONLY
+    )
+    assert payload_filter.evaluate(_payload("1234567890@s.whatsapp.net in status@broadcast")) == FilterAction.DROP
+    # Denied sender in a group: dropped, even though the group rule says store only
+    assert (
+        payload_filter.evaluate(_payload("972500000666:12@s.whatsapp.net in 123-456@g.us"))
+        == FilterAction.DROP
+    )
+    assert (
+        payload_filter.evaluate(
+            _payload("1234567890@s.whatsapp.net", message=None, reaction={"id": "m0", "message": "👍"})
+        )
+        == FilterAction.DROP
+    )
+
+    stats = payload_filter.stats()
+    assert stats["evaluated"] == 5
+    assert (stats["pass"], stats["store_only"], stats["drop"]) == (1, 1, 3)
+    assert {rule["name"]: rule["matched"] for rule in stats["rules"]} == {
+        "broadcast": 1,
+        "sender_denylist": 1,
+        "message_type": 1,
+        # Rules after a drop still count their matches
+        "group": 2,
+    }
+
+
+def test_sender_allowlist_matches_everyone_else():
+    rule = SenderRule(FilterAction.STORE_ONLY, ["1234567890@s.whatsapp.net"], allow=True)
+
+    assert not rule.matches(_payload("1234567890:3@s.whatsapp.net"))
+    assert rule.matches(_payload("972500000000@s.whatsapp.net"))
+
+
+def test_rules_must_implement_matches():
+    class Incomplete(FilterRule):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete(FilterAction.DROP)
+
+
+def test_payload_message_type():
+    assert payload_message_type(_payload("1@s.whatsapp.net")) == "text"
+    assert (
+        payload_message_type(
+            _payload(
+                "1@s.whatsapp.net",
+                image={"media_path": "a.jpg", "mime_type": "image/jpeg", "caption": ""},
+            )
+        )
+        == "image"
+    )
+    assert payload_message_type(_payload("1@s.whatsapp.net", message={"id": "m1"})) == "other"
+
+
+@pytest.mark.asyncio
+async def test_ingestor_drops_and_marks_store_only_before_the_journal():
+    processed: List[IngestItem] = []
+
+    async def process(items: List[IngestItem]):
+        processed.extend(items)
+
+    ingestor = WebhookIngestor(
+        ChatWorkerPool(process, workers=1, max_queue_size=10), payload_filter=_filter()
+    )
+    ingestor.start()
+    assert not await ingestor.accept(
+        _payload("1234567890@s.whatsapp.net in status@broadcast", "m1"), b"{}"
+    )
+    assert await ingestor.accept(
+        _payload("1234567890@s.whatsapp.net in 123-456@g.us", "m2"), b"{}"
+    )
+    assert await ingestor.accept(_payload("1234567890@s.whatsapp.net", "m3"), b"{}")
+    await ingestor.stop()
+
+    assert [(item.payload.message.id, item.store_only) for item in processed] == [
+        ("m2", True),
+        ("m3", False),
+    ]
+    assert ingestor.stats()["filter"]["drop"] == 1
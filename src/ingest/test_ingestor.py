@@ -0,0 +1,272 @@
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import List
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from api.webhook import _batch_adapter, webhook_batch
+from config import Settings
+from handler import router as router_module
+from handler.admission import AdmissionController
+from handler.knowledge_base_answers import KnowledgeBaseAnswers
+from handler.router import Router
+from ingest import (
+    ChatWorkerPool,
+    FilterAction,
+    IngestItem,
+    PayloadFilter,
+    PayloadProcessor,
+    RecentMessageIds,
+    SenderRule,
+    WebhookIngestor,
+)
+from models import Message, WhatsAppWebhookPayload
+from test_utils.mock_session import AsyncSessionMock, mock_session  # noqa
+
+RAW_BODY = b'{"from": "1234567890@s.whatsapp.net", "timestamp": "2024-01-29T12:00:00Z", "message": {"id": "m1", "text": "hi"}}'
+
+
+@pytest.fixture
+def processed():
+    return []
+
+
+@pytest.fixture
+def pool(processed):
+    async def process(items: List[IngestItem]):
+        processed.extend(items)
+
+    return ChatWorkerPool(process, workers=2, max_queue_size=10)
+
+
+@pytest.mark.asyncio
+async def test_accept_journals_and_queues(pool, processed):
+    journal = AsyncMock()
+    journal.append = AsyncMock(return_value=42)
+    journal.start = lambda submit: None
+    ingestor = WebhookIngestor(pool, journal)
+    ingestor.start()
+
+    await ingestor.accept(WhatsAppWebhookPayload.model_validate_json(RAW_BODY), RAW_BODY)
+    await ingestor.stop()
+
+    journal.append.assert_awaited_once_with(RAW_BODY, "m1")
+    assert [item.journal_id for item in processed] == [42]
+    journal.release.assert_awaited_once_with([])
+
+
+@pytest.mark.asyncio
+async def test_accept_survives_journal_failure(pool, processed):
+    journal = AsyncMock()
+    journal.append = AsyncMock(side_effect=ConnectionError("db down"))
+    journal.start = lambda submit: None
+    ingestor = WebhookIngestor(pool, journal)
+    ingestor.start()
+
+    await ingestor.accept(WhatsAppWebhookPayload.model_validate_json(RAW_BODY), RAW_BODY)
+    await ingestor.stop()
+
+    assert [item.journal_id for item in processed] == [None]
+    assert ingestor.stats()["journal"]["write_failures"] == 1
+
+
+@pytest.mark.asyncio
+async def test_resubmit_replays_journal_entry(pool, processed):
+    ingestor = WebhookIngestor(pool)
+    ingestor.start()
+
+    await ingestor.resubmit(7, RAW_BODY.decode())
+    await ingestor.resubmit(8, "not json")
+    await ingestor.stop()
+
+    assert len(processed) == 1
+    assert processed[0].journal_id == 7
+    assert processed[0].payload.message.text == "hi"
+
+
+@pytest.mark.asyncio
+async def test_replays_are_filtered_like_fresh_webhooks(
+    mock_session: AsyncSessionMock, monkeypatch: pytest.MonkeyPatch
+):
+    router = AsyncMock()
+    monkeypatch.setattr(Router, "__call__", router)
+
+    @asynccontextmanager
+    async def async_session():
+        yield mock_session
+
+    processor = PayloadProcessor(async_session, AsyncMock(), AsyncMock())
+    pool = ChatWorkerPool(processor, workers=1, max_queue_size=10)
+    journal = AsyncMock()
+    journal.start = lambda submit: None
+    journal.release = AsyncMock()
+    ingestor = WebhookIngestor(
+        pool,
+        journal,
+        payload_filter=PayloadFilter([SenderRule(FilterAction.STORE_ONLY, ["1234567890"])]),
+    )
+    ingestor.start()
+
+    await ingestor.resubmit(7, RAW_BODY.decode())
+    await ingestor.stop()
+
+    # Stored and marked processed, but never answered
+    router.assert_not_awaited()
+    tables = [call.args[0].table.name for call in mock_session.exec.await_args_list]
+    assert tables[-2:] == ["message", "ingestentry"]
+    mock_session.commit.assert_awaited_once()
+
+    # Dropped payloads are only marked processed
+    ingestor.payload_filter = PayloadFilter([SenderRule(FilterAction.DROP, ["1234567890"])])
+    await ingestor.resubmit(8, RAW_BODY.decode())
+    journal.complete.assert_awaited_once_with([8])
+    assert ingestor.stats()["journal"]["replayed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_redeliveries_are_dropped(pool, processed):
+    journal = AsyncMock()
+    # The second replica's journal already holds the message
+    journal.append = AsyncMock(side_effect=[1, None])
+    journal.start = lambda submit: None
+    ingestor = WebhookIngestor(pool, journal, RecentMessageIds(max_size=10))
+    ingestor.start()
+
+    payload = WhatsAppWebhookPayload.model_validate_json(RAW_BODY)
+    assert await ingestor.accept(payload, RAW_BODY)
+    # Redelivered to this replica, caught before touching the journal
+    assert not await ingestor.accept(payload, RAW_BODY)
+    # Redelivered to another replica with an empty cache, caught by the journal
+    other = WebhookIngestor(pool, journal, RecentMessageIds(max_size=10))
+    assert not await other.accept(payload, RAW_BODY)
+    await ingestor.stop()
+
+    assert len(processed) == 1
+    assert journal.append.await_count == 2
+    assert ingestor.stats()["recent_ids"]["hits"] == 1
+    assert other.stats()["journal"]["duplicates"] == 1
+
+
+def test_recent_message_ids_expire_and_evict(monkeypatch: pytest.MonkeyPatch):
+    now = 1000.0
+    monkeypatch.setattr("ingest.dedup.time.monotonic", lambda: now)
+    recent = RecentMessageIds(max_size=2, ttl=60)
+
+    assert not recent.check_and_add("a")
+    assert recent.check_and_add("a")
+    now += 61
+    assert not recent.check_and_add("a")
+
+    recent.check_and_add("b")
+    recent.check_and_add("c")
+    assert len(recent) == 2
+    assert not recent.check_and_add("a")
+
+
+def _batch_payload(message_id: str, age: timedelta = timedelta(0)) -> WhatsAppWebhookPayload:
+    return WhatsAppWebhookPayload(
+        from_="1234567890@s.whatsapp.net",
+        timestamp=datetime.now(timezone.utc) - age,
+        message={"id": message_id, "text": "hi"},
+    )
+
+
+@pytest.mark.asyncio
+async def test_batches_are_journaled_and_deduplicated(pool, processed):
+    journal = AsyncMock()
+    # m2 was journaled by another replica
+    journal.append_many = AsyncMock(return_value={"m1": 1, "m3": 3})
+    ingestor = WebhookIngestor(pool, journal, RecentMessageIds(max_size=10))
+    ingestor.recent_ids.check_and_add("m4")
+
+    accepted = await ingestor.journal_batch([_batch_payload(f"m{i}") for i in range(1, 5)])
+
+    assert [(payload.message.id, journal_id) for payload, journal_id in accepted] == [
+        ("m1", 1),
+        ("m3", 3),
+    ]
+    # Replays parse the journaled payloads like fresh webhooks
+    body, message_id = journal.append_many.await_args.args[0][0]
+    assert WhatsAppWebhookPayload.model_validate_json(body).message.id == message_id == "m1"
+    assert ingestor.stats()["journal"]["duplicates"] == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_endpoint_answers_only_recent_messages(pool, processed):
+    journal = AsyncMock()
+    journal.append_many = AsyncMock(return_value={"old": 1, "new": 2})
+    journal.start = lambda submit: None
+    ingestor = WebhookIngestor(pool, journal)
+    ingestor.start()
+    payloads = [_batch_payload("old", age=timedelta(days=1)), _batch_payload("new")]
+    handler = AsyncMock()
+    handler.store_messages = AsyncMock(
+        return_value=[Message.from_webhook(payload) for payload in payloads]
+    )
+    session = AsyncMock()
+    request = MagicMock()
+    request.body = AsyncMock(
+        return_value=_batch_adapter.dump_json(payloads, by_alias=True, exclude_none=True)
+    )
+    request.app.state.settings = Settings.model_construct(webhook_batch_answer_max_age_seconds=300.0)
+
+    result = await webhook_batch(request, session, handler, ingestor)
+    await ingestor.stop()
+
+    assert result == {"received": 2, "stored": 2, "queued": 1}
+    # The old message is done once stored, the new one once answered
+    assert session.exec.await_args.args[0].compile().params["id_1"] == [1]
+    assert [(item.message.message_id, item.journal_id) for item in processed] == [("new", 2)]
+
+    processed.clear()
+    journal.append_many = AsyncMock(return_value={"new": 3})
+    ingestor = WebhookIngestor(pool, journal)
+    ingestor.start()
+    result = await webhook_batch(request, session, handler, ingestor, backfill=True)
+    await ingestor.stop()
+    assert result["queued"] == 0
+    assert processed == []
+
+
+@pytest.mark.asyncio
+async def test_crash_after_the_admission_commit_is_replayed(
+    mock_session: AsyncSessionMock, monkeypatch: pytest.MonkeyPatch
+):
+    # The pipeline is busy, so the router commits the stored message before queueing
+    controller = AdmissionController()
+    monkeypatch.setattr(
+        router_module,
+        "admission_controller",
+        SimpleNamespace(would_wait=lambda: True, admit=controller.admit),
+    )
+    monkeypatch.setattr(router_module, "reactions", MagicMock())
+    answer = AsyncMock(side_effect=[ConnectionError("crashed while answering"), None])
+    monkeypatch.setattr(KnowledgeBaseAnswers, "__call__", answer)
+
+    @asynccontextmanager
+    async def async_session():
+        yield mock_session
+
+    processor = PayloadProcessor(async_session, AsyncMock(), AsyncMock())
+    payload = WhatsAppWebhookPayload.model_validate_json(RAW_BODY)
+    mock_session.scalar.return_value = Message.from_webhook(payload)
+
+    with pytest.raises(ConnectionError):
+        await processor([IngestItem(payload, journal_id=7)])
+    # The message was committed, its journal entry wasn't marked processed
+    mock_session.commit.assert_awaited_once()
+    tables = [getattr(call.args[0], "table", None) for call in mock_session.exec.await_args_list]
+    assert "ingestentry" not in [table.name for table in tables if table is not None]
+
+    # The sweeper replays the entry: stored again, answered and marked processed
+    pool = ChatWorkerPool(processor, workers=1, max_queue_size=10)
+    ingestor = WebhookIngestor(pool)
+    ingestor.start()
+    await ingestor.resubmit(7, RAW_BODY.decode())
+    await ingestor.stop()
+
+    assert answer.await_count == 2
+    assert mock_session.exec.await_args_list[-1].args[0].table.name == "ingestentry"
+    assert mock_session.commit.await_count == 3
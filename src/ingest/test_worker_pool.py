@@ -0,0 +1,123 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from ingest import ChatWorkerPool, payload_chat_jid
+from models import WhatsAppWebhookPayload
+
+
+@pytest.mark.asyncio
+async def test_same_chat_is_processed_in_order():
+    processed = []
+
+    async def process(batch):
+        for chat, n in batch:
+            # Later items finish faster, so any reordering would show up
+            await asyncio.sleep(0.01 * (5 - n))
+            processed.append((chat, n))
+
+    pool = ChatWorkerPool(process, workers=4, max_queue_size=100)
+    pool.start()
+    for n in range(5):
+        await pool.submit("chat-a", ("chat-a", n))
+    await pool.stop()
+
+    assert processed == [("chat-a", n) for n in range(5)]
+    assert pool.stats()["batches"] == 5
+
+
+@pytest.mark.asyncio
+async def test_different_chats_run_in_parallel():
+    running = 0
+    max_running = 0
+
+    async def process(batch):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+
+    pool = ChatWorkerPool(process, workers=3, max_queue_size=100)
+    pool.start()
+    for chat in ("a", "b", "c"):
+        await pool.submit(chat, chat)
+    await pool.stop()
+
+    assert max_running == 3
+    assert pool.stats()["processed"] == 3
+
+
+@pytest.mark.asyncio
+async def test_failures_are_counted_and_do_not_stop_workers():
+    async def process(batch):
+        if batch == ["bad"]:
+            raise RuntimeError("boom")
+
+    pool = ChatWorkerPool(process, workers=1, max_queue_size=10)
+    pool.start()
+    await pool.submit("a", "bad")
+    await pool.submit("a", "good")
+    await pool.stop()
+
+    stats = pool.stats()
+    assert stats["failed"] == 1
+    assert stats["processed"] == 1
+    assert stats["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_bursts_are_coalesced_per_chat():
+    batches = []
+
+    async def process(batch):
+        batches.append(batch)
+
+    pool = ChatWorkerPool(process, workers=2, max_queue_size=10, coalesce_window=0.05)
+    pool.start()
+    for n in range(3):
+        await pool.submit("a", f"a{n}")
+        await asyncio.sleep(0.01)
+    await pool.submit("b", "b0")
+    await asyncio.sleep(0.2)
+    # Arrives after the window closed, so it gets its own batch
+    await pool.submit("a", "a3")
+    await pool.stop()
+
+    assert sorted(batches) == [["a0", "a1", "a2"], ["a3"], ["b0"]]
+    assert pool.stats()["coalesced"] == 2
+
+
+@pytest.mark.asyncio
+async def test_coalescing_is_bounded_by_max_wait():
+    batches = []
+
+    async def process(batch):
+        batches.append(batch)
+
+    pool = ChatWorkerPool(
+        process, workers=1, max_queue_size=100, coalesce_window=0.05, coalesce_max_wait=0.1
+    )
+    pool.start()
+    # A chat that never goes quiet still gets answered
+    for n in range(10):
+        await pool.submit("a", n)
+        await asyncio.sleep(0.03)
+    await pool.stop()
+
+    assert len(batches) > 1
+    assert [n for batch in batches for n in batch] == list(range(10))
+
+
+def test_payload_chat_jid():
+    group = WhatsAppWebhookPayload(
+        from_="1234567890:12@s.whatsapp.net in 123456789-123456@g.us",
+        timestamp=datetime.now(timezone.utc),
+    )
+    private = WhatsAppWebhookPayload(
+        from_="1234567890:12@s.whatsapp.net",
+        timestamp=datetime.now(timezone.utc),
+    )
+    assert payload_chat_jid(group) == "123456789-123456@g.us"
+    assert payload_chat_jid(private) == "1234567890@s.whatsapp.net"
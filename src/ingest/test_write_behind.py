@@ -0,0 +1,89 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock
+
+import pytest
+
+from ingest import MessageWriteBehind
+from models import WhatsAppWebhookPayload
+from test_utils.mock_session import AsyncSessionMock, mock_session  # noqa
+
+
+def _payload(message_id: str) -> WhatsAppWebhookPayload:
+    return WhatsAppWebhookPayload(
+        from_="1234567890@s.whatsapp.net in 123-456@g.us",
+        timestamp=datetime.now(timezone.utc),
+        message={"id": message_id, "text": "hello"},
+    )
+
+
+def _write_behind(session: AsyncSessionMock, **kwargs) -> MessageWriteBehind:
+    @asynccontextmanager
+    async def async_session():
+        yield session
+
+    return MessageWriteBehind(async_session, AsyncMock(), AsyncMock(), **kwargs)
+
+
+def _tables(session: AsyncSessionMock):
+    return [call.args[0].table.name for call in session.exec.await_args_list]
+
+
+@pytest.mark.asyncio
+async def test_flushes_once_max_rows_are_buffered(mock_session: AsyncSessionMock):
+    write_behind = _write_behind(mock_session, flush_interval=60, max_rows=3)
+
+    await write_behind.add([(_payload("m1"), 1), (_payload("m2"), None)])
+    mock_session.exec.assert_not_awaited()
+
+    await write_behind.add([(_payload("m3"), 3)])
+    # Senders, messages and the journal entries, in one transaction
+    assert _tables(mock_session)[-2:] == ["message", "ingestentry"]
+    mock_session.commit.assert_awaited_once()
+    assert write_behind.stats()["rows_written"] == 3
+    assert write_behind.stats()["buffered"] == 0
+
+
+@pytest.mark.asyncio
+async def test_flushes_periodically_and_on_stop(mock_session: AsyncSessionMock):
+    write_behind = _write_behind(mock_session, flush_interval=0.01, max_rows=100)
+    write_behind.start()
+
+    await write_behind.add([(_payload("m1"), None)])
+    await asyncio.sleep(0.05)
+    assert write_behind.stats()["flushes"] == 1
+
+    await write_behind.add([(_payload("m2"), None)])
+    await write_behind.stop()
+    assert write_behind.stats()["rows_written"] == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_flushes_are_retried(mock_session: AsyncSessionMock):
+    write_behind = _write_behind(mock_session, flush_interval=60, max_rows=100, max_buffered=3)
+    mock_session.commit.side_effect = [ConnectionError("db down"), None]
+
+    await write_behind.add([(_payload("m1"), None), (_payload("m2"), 2)])
+    await write_behind.flush()
+    assert write_behind.stats()["buffered"] == 2
+    assert write_behind.stats()["rows_written"] == 0
+
+    await write_behind.add([(_payload("m3"), None)])
+    await write_behind.flush()
+    stats = write_behind.stats()
+    assert (stats["buffered"], stats["rows_written"], stats["failed"]) == (0, 3, 2)
+    # The retried rows went out first, with the rows buffered meanwhile
+    message_rows = mock_session.exec.await_args_list[-2].args[0].compile().params
+    assert [v for k, v in message_rows.items() if k.startswith("message_id")] == ["m1", "m2", "m3"]
+
+
+@pytest.mark.asyncio
+async def test_failed_flushes_keep_a_bounded_buffer(mock_session: AsyncSessionMock):
+    write_behind = _write_behind(mock_session, flush_interval=60, max_rows=100, max_buffered=2)
+    mock_session.commit.side_effect = ConnectionError("db down")
+
+    await write_behind.add([(_payload(f"m{i}"), i) for i in range(3)])
+    await write_behind.flush()
+    stats = write_behind.stats()
+    assert (stats["buffered"], stats["dropped"]) == (2, 1)
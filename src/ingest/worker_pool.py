@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Generic, List, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class _ChatQueue(Generic[T]):
+    items: Deque[T] = field(default_factory=deque)
+    first_arrival: float = 0.0
+    last_arrival: float = 0.0
+    # Waiting in the ready queue or being processed by a worker
+    scheduled: bool = False
+    timer: asyncio.TimerHandle | None = None
+
+
+class ChatWorkerPool(Generic[T]):
+    """
+    Bounded pool of asyncio workers that drains accepted webhook items in the background.
+
+    Items that share a chat key are processed one batch at a time, in arrival order.
+    Different chats are processed in parallel, up to the number of workers.
+
+    With a coalesce window, a chat is only handed to a worker once it has been quiet for
+    the window (or `coalesce_max_wait` passed since its first pending item), and the worker
+    gets every pending item of the chat as one batch. Without it, batches hold one item.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[List[T]], Awaitable[None]],
+        workers: int = 8,
+        max_queue_size: int = 1000,
+        coalesce_window: float = 0.0,
+        coalesce_max_wait: float = 5.0,
+    ):
+        """
+        :param process: Coroutine function called with every batch of items of a chat
+        :param workers: Number of concurrent workers
+        :param max_queue_size: Maximum number of items waiting to be processed,
+            `submit` waits for a free slot once the limit is reached
+        :param coalesce_window: Seconds of quiet to wait for before processing a chat, 0 to disable
+        :param coalesce_max_wait: Upper bound on the wait of the first item of a burst
+        """
+        assert workers > 0, "workers must be positive"
+        assert max_queue_size > 0, "max_queue_size must be positive"
+        self._process = process
+        self._workers = workers
+        self._max_queue_size = max_queue_size
+        self._coalesce_window = coalesce_window
+        self._coalesce_max_wait = max(coalesce_max_wait, coalesce_window)
+
+        self._chats: Dict[str, _ChatQueue[T]] = {}
+        self._ready: asyncio.Queue[str] = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max_queue_size)
+        self._tasks: List[asyncio.Task] = []
+
+        self._queued = 0
+        self._busy = 0
+        self._busy_seconds = 0.0
+        self._submitted = 0
+        self._processed = 0
+        self._failed = 0
+        self._batches = 0
+        self._coalesced = 0
+        self._started_at: float | None = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._started_at = time.monotonic()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"chat-worker-{i}")
+            for i in range(self._workers)
+        ]
+        logger.info(f"Started {self._workers} chat workers")
+
+    async def stop(self, drain_timeout: float = 30.0):
+        """
+        Stop the workers, giving queued items up to `drain_timeout` seconds to finish
+        """
+        if not self._tasks:
+            return
+        # Don't wait out the coalesce window of chats that are still collecting a burst
+        for chat_key, chat in self._chats.items():
+            if chat.timer:
+                chat.timer.cancel()
+                self._mark_ready(chat_key)
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Chat workers did not drain within {drain_timeout}s, "
+                f"{self._queued} queued items dropped"
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Stopped chat workers")
+
+    async def submit(self, chat_key: str, item: T):
+        """
+        Queue an item for background processing.
+        Waits for a free slot when the queue is full.
+        """
+        await self._slots.acquire()
+        self._queued += 1
+        self._submitted += 1
+
+        now = time.monotonic()
+        chat = self._chats.get(chat_key)
+        if chat is None:
+            chat = self._chats[chat_key] = _ChatQueue()
+        if not chat.items:
+            chat.first_arrival = now
+        chat.last_arrival = now
+        chat.items.append(item)
+
+        # A scheduled chat is already queued or in progress, its worker will pick this up
+        if not chat.scheduled:
+            self._schedule(chat_key, chat)
+
+    def _schedule(self, chat_key: str, chat: _ChatQueue[T]):
+        if chat.timer:
+            chat.timer.cancel()
+            chat.timer = None
+
+        delay = (
+            min(
+                chat.last_arrival + self._coalesce_window,
+                chat.first_arrival + self._coalesce_max_wait,
+            )
+            - time.monotonic()
+        )
+        if self._coalesce_window <= 0 or delay <= 0:
+            self._mark_ready(chat_key)
+        else:
+            chat.timer = asyncio.get_running_loop().call_later(
+                delay, self._mark_ready, chat_key
+            )
+
+    def _mark_ready(self, chat_key: str):
+        chat = self._chats[chat_key]
+        chat.timer = None
+        chat.scheduled = True
+        self._ready.put_nowait(chat_key)
+
+    async def _worker(self):
+        while True:
+            chat_key = await self._ready.get()
+            try:
+                chat = self._chats[chat_key]
+                if self._coalesce_window > 0:
+                    batch = list(chat.items)
+                    chat.items.clear()
+                else:
+                    batch = [chat.items.popleft()]
+                self._queued -= len(batch)
+
+                await self._run(chat_key, batch)
+                for _ in batch:
+                    self._slots.release()
+
+                if chat.items:
+                    # Items that arrived meanwhile already waited for the chat to be free.
+                    # Go to the back of the line so a busy chat can't starve the others.
+                    self._ready.put_nowait(chat_key)
+                else:
+                    del self._chats[chat_key]
+            finally:
+                self._ready.task_done()
+
+    async def _run(self, chat_key: str, batch: List[T]):
+        self._busy += 1
+        started = time.monotonic()
+        try:
+            await self._process(batch)
+            self._processed += len(batch)
+            self._batches += 1
+            self._coalesced += len(batch) - 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._failed += len(batch)
+            logger.exception(f"Failed processing items for chat {chat_key}: {e}")
+        finally:
+            self._busy -= 1
+            self._busy_seconds += time.monotonic() - started
+
+    def pending_items(self) -> List[T]:
+        """Items still waiting in the queue, e.g. the ones left behind by `stop`"""
+        return [item for chat in self._chats.values() for item in chat.items]
+
+    def stats(self) -> Dict[str, Any]:
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {
+            "workers": self._workers,
+            "busy_workers": self._busy,
+            "queue_depth": self._queued,
+            "max_queue_size": self._max_queue_size,
+            "active_chats": len(self._chats),
+            "submitted": self._submitted,
+            "processed": self._processed,
+            "failed": self._failed,
+            "batches": self._batches,
+            "coalesced": self._coalesced,
+            "coalesce_window": self._coalesce_window,
+            "utilisation": self._busy / self._workers,
+            "average_utilisation": (
+                self._busy_seconds / (uptime * self._workers) if uptime else 0.0
+            ),
+        }
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
+from voyageai.client_async import AsyncClient
+
+from handler.base_handler import BaseHandler
+from models import WhatsAppWebhookPayload
+from whatsapp import WhatsAppClient
+from .journal import IngestJournal
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriteBehind:
+    """
+    Buffer for inbound messages that are stored but never answered, written with a
+    group commit every `flush_interval` seconds or once `max_rows` are waiting.
+
+    Buffered payloads keep their journal entries unprocessed until the transaction
+    that writes them commits, so a crash before the flush loses nothing: the journal
+    replays them. A failed flush puts its batch back for the next one; beyond
+    `max_buffered` payloads the oldest are given up, left to the journal if any.
+    """
+
+    def __init__(
+        self,
+        async_session: async_sessionmaker[AsyncSession],
+        whatsapp: WhatsAppClient,
+        embedding_client: AsyncClient,
+        flush_interval: float = 0.2,
+        max_rows: int = 500,
+        max_buffered: int | None = None,
+    ):
+        """
+        :param max_buffered: Payloads kept while flushes fail, 10 × `max_rows` by default
+        """
+        assert flush_interval > 0, "flush_interval must be positive"
+        assert max_rows > 0, "max_rows must be positive"
+        self.async_session = async_session
+        self.whatsapp = whatsapp
+        self.embedding_client = embedding_client
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.max_buffered = max_buffered or 10 * max_rows
+
+        self._buffer: List[Tuple[WhatsAppWebhookPayload, int | None]] = []
+        self._lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+
+        self._flushes = 0
+        self._rows = 0
+        self._failed = 0
+        self._dropped = 0
+        self._flush_seconds = 0.0
+
+    async def add(self, entries: List[Tuple[WhatsAppWebhookPayload, int | None]]):
+        """
+        Buffer payloads to be stored with the next flush.
+        Flushes right away, in the caller, once the buffer is full.
+        :param entries: Payloads with their journal entry ID, if any
+        """
+        self._buffer.extend(entries)
+        if len(self._buffer) >= self.max_rows:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+            started = time.monotonic()
+            try:
+                async with self.async_session() as session:
+                    handler = BaseHandler(session, self.whatsapp, self.embedding_client)
+                    await handler.store_messages([payload for payload, _ in batch])
+                    journal_ids = [i for _, i in batch if i is not None]
+                    if journal_ids:
+                        await IngestJournal.mark_processed(session, journal_ids)
+                    await session.commit()
+            except Exception as e:
+                # Retried with the next flush, ahead of what was buffered meanwhile
+                self._failed += len(batch)
+                self._buffer = batch + self._buffer
+                overflow = len(self._buffer) - self.max_buffered
+                if overflow > 0:
+                    # Journaled payloads are still replayed once their claim goes stale
+                    self._dropped += overflow
+                    del self._buffer[:overflow]
+                logger.error(
+                    f"Failed writing {len(batch)} buffered messages, retrying with the next flush"
+                    f"{f' ({overflow} given up)' if overflow > 0 else ''}: {e}"
+                )
+                return
+            finally:
+                self._flush_seconds += time.monotonic() - started
+            self._flushes += 1
+            self._rows += len(batch)
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically(), name="message-write-behind")
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffered": len(self._buffer),
+            "flush_interval": self.flush_interval,
+            "max_rows": self.max_rows,
+            "flushes": self._flushes,
+            "rows_written": self._rows,
+            "failed": self._failed,
+            "dropped": self._dropped,
+            "average_batch": self._rows / self._flushes if self._flushes else 0.0,
+            "average_flush_seconds": (
+                self._flush_seconds / self._flushes if self._flushes else 0.0
+            ),
+        }
@@ -6,6 +6,7 @@ from typing import Dict, List
 from pydantic import BaseModel, Field, PrivateAttr
 from pydantic_ai import Agent
 from pydantic_ai.agent import AgentRunResult
+from sqlalchemy import and_, delete, or_
 from sqlmodel import desc, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 from tenacity import (
@@ -16,9 +17,12 @@ from tenacity import (
 )
 from voyageai.client_async import AsyncClient
 
+from handler.topic_index import topic_index
 from models import KBTopicCreate, Message
 from models.knowledge_base_topic import KBTopic
 from models.upsert import bulk_upsert
+from utils.agents import MODEL_NAME, agent_registry
+from utils.answer_cache import answer_cache
 from utils.voyage_embed_text import voyage_embed_text
 from whatsapp import WhatsAppClient
 
@@ -39,31 +43,37 @@ def _deid_text(message: str, user_mapping: Dict[str, str]) -> str:
     return message
 
 
-@retry(
-    wait=wait_random_exponential(min=5, max=90, multiplier=1.5),
-    stop=stop_after_attempt(6),
-    before_sleep=before_sleep_log(logger, logging.DEBUG),
-    reraise=True,
-)
-async def conversation_splitter_agent(content: str) -> AgentRunResult[List[Topic]]:
-    agent = Agent(
-        model="gemini-2.5-flash",
-        # Set bigger then 1024 max token for this agent, because it's a long conversation
-        # https://github.com/santokalayil/ai_agents/blame/26b51578ef5864b7f4f0c540e89297867c76d8ab/pydantic_ai/models/anthropic.py#L207C1-L208C1
-        model_settings={"max_tokens": 10000},
-        system_prompt="""Attached is a snapshot from a group chat conversation. The conversation is a mix of different topics. Your task is to:
+CONVERSATION_SPLITTER_PROMPT = """Attached is a snapshot from a group chat conversation. The conversation is a mix of different topics. Your task is to:
 - Break the conversation into a list of topics, each topic have the same theme of subject.
 - For each topic, write a concise summary of the topic. This will help me to understand the group dynamics and the topics discussed.
 - Don't miss any topic! Every subject discussed should be highlighted in the summary, even if it's a small one. You MUST include ALL topics.
 - You MUST respond in English.
 
 My goal is learn the different subject discussed in the group chat. This will be used as a knowledge base for the group, so it should not loose any important information or insights.
-""",
+"""
+
+agent_registry.register(
+    "conversation_splitter",
+    lambda: Agent(
+        model=MODEL_NAME,
+        # Set bigger then 1024 max token for this agent, because it's a long conversation
+        # https://github.com/santokalayil/ai_agents/blame/26b51578ef5864b7f4f0c540e89297867c76d8ab/pydantic_ai/models/anthropic.py#L207C1-L208C1
+        model_settings={"max_tokens": 10000},
+        system_prompt=CONVERSATION_SPLITTER_PROMPT,
         output_type=List[Topic],
         retries=5,
-    )
+    ),
+)
 
-    return await agent.run(content)
+
+@retry(
+    wait=wait_random_exponential(min=5, max=90, multiplier=1.5),
+    stop=stop_after_attempt(6),
+    before_sleep=before_sleep_log(logger, logging.DEBUG),
+    reraise=True,
+)
+async def conversation_splitter_agent(content: str) -> AgentRunResult[List[Topic]]:
+    return await agent_registry.run("conversation_splitter", content)
 
 
 def _get_speaker_mapping(messages: List[Message]) -> Dict[str, str]:
@@ -238,10 +248,14 @@ class CompanyDocumentLoader:
                 title = doc.get("title", "Unknown")
                 content = doc.get("content", "")
                 source = doc.get("source", "unknown")
+                document_id = doc.get("document_id")
+                chunk_index = doc.get("chunk_index")
             else:
                 title = getattr(doc, "title", "Unknown")
                 content = getattr(doc, "content", "")
                 source = getattr(doc, "source", "unknown")
+                document_id = getattr(doc, "document_id", None)
+                chunk_index = getattr(doc, "chunk_index", None)
             
             # Create a unique ID based on title and content hash
             doc_id = hashlib.sha256(f"{title}_{content}".encode()).hexdigest()
@@ -252,13 +266,52 @@ class CompanyDocumentLoader:
                 start_time=current_time,
                 source=source,
                 subject=title,
-                content=content
+                content=content,
+                document_id=document_id,
+                chunk_index=chunk_index,
             )
             kb_topics.append(kb_topic)
         
         # Bulk insert the documents
         await bulk_upsert(session, kb_topics)
+        removed_ids = await self._delete_stale_chunks(session, kb_topics)
         await session.commit()
+        # Cached answers may be outdated by the new documents
+        answer_cache.bump_kb_version()
+        topic_index.remove(removed_ids)
+        topic_index.upsert(kb_topics)
         
         logger.info(f"Successfully loaded {len(kb_topics)} company documents into knowledge base")
         return len(kb_topics)
+
+    @staticmethod
+    async def _delete_stale_chunks(session: AsyncSession, kb_topics: List[KBTopic]) -> List[str]:
+        """
+        Delete the chunks of reloaded documents that the new version no longer has,
+        and rows of the same files stored whole before documents were chunked.
+        :return: IDs of the deleted rows
+        """
+        current: Dict[str, List[str]] = {}
+        sources: Dict[str, str] = {}
+        for topic in kb_topics:
+            if topic.document_id is not None:
+                current.setdefault(topic.document_id, []).append(topic.id)
+                sources[topic.document_id] = topic.source
+
+        removed = []
+        for document_id, ids in current.items():
+            result = await session.exec(
+                delete(KBTopic)
+                .where(
+                    or_(
+                        KBTopic.document_id == document_id,
+                        and_(KBTopic.document_id.is_(None), KBTopic.source == sources[document_id]),
+                    ),
+                    KBTopic.id.not_in(ids),
+                )
+                .returning(KBTopic.id)
+            )
+            removed.extend(result.scalars().all())
+        if removed:
+            logger.info(f"Deleted {len(removed)} outdated chunks")
+        return removed
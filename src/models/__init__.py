@@ -1,5 +1,7 @@
+from .ingest_entry import IngestEntry
 from .knowledge_base_topic import KBTopic, KBTopicCreate
 from .message import Message, BaseMessage
+from .query_embedding import QueryEmbedding
 from .sender import Sender, BaseSender
 from .upsert import upsert, bulk_upsert
 from .webhook import WhatsAppWebhookPayload
@@ -14,4 +16,6 @@ __all__ = [
     "bulk_upsert",
     "KBTopic",
     "KBTopicCreate",
+    "IngestEntry",
+    "QueryEmbedding",
 ]
@@ -0,0 +1,35 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlmodel import Field, SQLModel, Column, DateTime, Index, Text
+
+
+class IngestEntry(SQLModel, table=True):
+    """Journal row for an accepted webhook, pruned some time after it was processed."""
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # WhatsApp message ID, unique so redeliveries are rejected across replicas
+    message_id: Optional[str] = Field(default=None, max_length=255)
+    # Raw JSON body exactly as it was received from the gateway
+    payload: str = Field(sa_column=Column(Text, nullable=False))
+    received_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=Column(DateTime(timezone=True), nullable=False),
+    )
+    # Set by the replica that is processing the entry, stale claims are replayed
+    claimed_at: Optional[datetime] = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), nullable=True)
+    )
+    processed_at: Optional[datetime] = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), nullable=True)
+    )
+    attempts: int = Field(default=1)
+
+    __table_args__ = (
+        Index("ingest_entry_message_id_idx", "message_id", unique=True),
+        Index(
+            "ingest_entry_unprocessed_idx",
+            "id",
+            postgresql_where="processed_at IS NULL",
+        ),
+    )
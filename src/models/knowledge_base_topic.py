@@ -2,6 +2,8 @@ from datetime import datetime, timezone
 from typing import List, Optional, Any
 
 from pgvector.sqlalchemy import Vector
+from sqlalchemy import Computed
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlmodel import Field, SQLModel, Index, Column, DateTime
 
 
@@ -14,6 +16,9 @@ class KBTopicBase(SQLModel):
     source: str
     subject: str
     content: str
+    # Document the topic is a chunk of, None for whole documents
+    document_id: Optional[str] = Field(default=None, index=True)
+    chunk_index: Optional[int] = Field(default=None)
 
 
 class KBTopicCreate(KBTopicBase):
@@ -24,6 +29,17 @@ class KBTopicCreate(KBTopicBase):
 class KBTopic(KBTopicBase, table=True):
     id: str = Field(primary_key=True)
     embedding: Any = Field(sa_type=Vector(1024))
+    # Full-text document of the topic, maintained by Postgres
+    search_vector: Optional[str] = Field(
+        default=None,
+        sa_column=Column(
+            TSVECTOR,
+            Computed(
+                "to_tsvector('english'::regconfig, coalesce(subject, '') || ' ' || coalesce(content, ''))",
+                persisted=True,
+            ),
+        ),
+    )
 
     # Add pgvector index
     __table_args__ = (
@@ -33,4 +49,5 @@ class KBTopic(KBTopicBase, table=True):
             postgresql_using="hnsw",
             postgresql_ops={"embedding": "vector_cosine_ops"},
         ),
+        Index("kb_topic_search_vector_idx", "search_vector", postgresql_using="gin"),
     )
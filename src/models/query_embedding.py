@@ -0,0 +1,21 @@
+from datetime import datetime, timezone
+from typing import Any
+
+from pgvector.sqlalchemy import Vector
+from sqlmodel import Field, SQLModel, Column, DateTime, Index, Text
+
+
+class QueryEmbedding(SQLModel, table=True):
+    """Persisted entry of the query embedding cache, so it survives restarts."""
+
+    # sha256 of the embedding model and the normalised query text
+    key: str = Field(primary_key=True, max_length=64)
+    model: str = Field(max_length=64)
+    text: str = Field(sa_column=Column(Text, nullable=False))
+    embedding: Any = Field(sa_type=Vector(1024))
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=Column(DateTime(timezone=True), nullable=False),
+    )
+
+    __table_args__ = (Index("query_embedding_created_at_idx", "created_at"),)
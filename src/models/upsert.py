@@ -1,71 +1,102 @@
-from typing import List
+from typing import List, Literal
 
+from sqlalchemy import and_, or_
 from sqlalchemy.dialects.postgresql import insert
 from sqlmodel import SQLModel, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+OnConflict = Literal["update", "changed", "nothing"]
 
-async def upsert(session: AsyncSession, entity: SQLModel):
-    # Split fields into primary keys and values
-    pkeys, vals = {}, {}
-    for f in entity.__table__.columns:
-        (pkeys if f.primary_key else vals)[f.name] = getattr(entity, f.name)
 
-    # Create insert statement
-    stmt = insert(entity.__class__).values(**{**pkeys, **vals})
+def _written_columns(model):
+    # Generated columns are computed by Postgres and can't be written
+    return [col for col in model.__table__.columns if col.computed is None]
 
-    # Create on_conflict_do_update statement
-    stmt = stmt.on_conflict_do_update(
-        index_elements=list(pkeys.keys()),  # Convert keys to list
-        set_={
-            k: stmt.excluded[k]  # Use excluded to reference values from INSERT
-            for k in vals.keys()  # Only update non-primary key columns
-        },
-    )
 
-    await session.exec(stmt)
+def _on_conflict(stmt, model, pkeys: List[str], on_conflict: OnConflict):
+    """
+    Add the ON CONFLICT clause of an upsert
+    :param on_conflict: "update" overwrites existing rows, "changed" only rewrites rows
+        whose values differ, "nothing" keeps existing rows as they are
+    """
+    if on_conflict == "nothing":
+        return stmt.on_conflict_do_nothing(index_elements=pkeys)
 
-    # Query for the updated instance
-    select_stmt = select(entity.__class__).where(
-        *[getattr(entity.__class__, k) == v for k, v in pkeys.items()]
+    columns = [col for col in _written_columns(model) if not col.primary_key]
+    where = None
+    if on_conflict == "changed":
+        # Skip the write (and the dead tuple) when a redelivery brings nothing new
+        where = or_(*[col.is_distinct_from(stmt.excluded[col.name]) for col in columns])
+    return stmt.on_conflict_do_update(
+        index_elements=pkeys,
+        set_={col.name: stmt.excluded[col.name] for col in columns},
+        where=where,
     )
-    db_instance = await session.exec(select_stmt)
-    result = db_instance.first()
 
-    # Merge the instance into the session
-    return result
 
+async def upsert(session: AsyncSession, entity: SQLModel, on_conflict: OnConflict = "update"):
+    """
+    Insert or update a row, reading it back in the same round trip with RETURNING
+    :param session: Database session
+    :param entity: Entity to write
+    :param on_conflict: See `bulk_upsert`
+    :return: The row as stored in the database
+    """
+    model = entity.__class__
+    values = {f.name: getattr(entity, f.name) for f in _written_columns(model)}
+    pkeys = [f.name for f in model.__table__.columns if f.primary_key]
+
+    stmt = _on_conflict(insert(model).values(**values), model, pkeys, on_conflict)
+    stmt = select(model).from_statement(stmt.returning(model)).execution_options(
+        populate_existing=True
+    )
+    result = await session.scalar(stmt)
+    if result is not None or on_conflict == "update":
+        return result
 
-async def bulk_upsert(session: AsyncSession, entities: List[SQLModel]):
+    # The existing row was left untouched, so nothing was returned
+    select_stmt = select(model).where(
+        and_(*[getattr(model, k) == values[k] for k in pkeys])
+    )
+    return (await session.exec(select_stmt)).first()
+
+
+async def bulk_upsert(
+    session: AsyncSession,
+    entities: List[SQLModel],
+    on_conflict: OnConflict = "update",
+    batch_size: int = 1000,
+):
+    """
+    Insert many rows of the same model with multi-row INSERT ... ON CONFLICT statements
+    :param session: Database session
+    :param entities: Entities to write, all of the same model
+    :param on_conflict: "update" overwrites existing rows, "changed" only rewrites rows
+        whose values differ, "nothing" keeps existing rows as they are
+    :param batch_size: Rows per statement, keeps each statement under asyncpg's bind parameter limit
+    """
     if not entities:
         return None
 
     # Get the first entity to determine the model class and structure
     entity_class = entities[0].__class__
 
-    # Extract all values for bulk insert
-    values_list = []
     # Get structure from first entity
     first_entity = entities[0]
-    pkeys = {f.name for f in first_entity.__table__.columns if f.primary_key}
+    pkeys = [f.name for f in first_entity.__table__.columns if f.primary_key]
 
+    # Postgres refuses to touch the same row twice in one statement, the last entity wins
+    rows = {}
     for entity in entities:
         row_data = {}
-        for f in entity.__table__.columns:
+        for f in _written_columns(entity_class):
             row_data[f.name] = getattr(entity, f.name)
-        values_list.append(row_data)
-
-    # Create bulk insert statement
-    stmt = insert(entity_class).values(values_list)
-
-    # Create on_conflict_do_update statement
-    stmt = stmt.on_conflict_do_update(
-        index_elements=list(pkeys),
-        set_={
-            col.name: stmt.excluded[col.name]
-            for col in entity_class.__table__.columns
-            if not col.primary_key
-        },
-    )
+        rows[tuple(row_data[k] for k in pkeys)] = row_data
+    values_list = list(rows.values())
+
+    for i in range(0, len(values_list), batch_size):
+        # Create bulk insert statement
+        stmt = insert(entity_class).values(values_list[i : i + batch_size])
 
-    return await session.exec(stmt)
+        stmt = _on_conflict(stmt, entity_class, pkeys, on_conflict)
+        await session.exec(stmt)
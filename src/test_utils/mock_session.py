@@ -99,6 +99,7 @@ class AsyncSessionMock(MagicMock):
         self.commit = AsyncMock(side_effect=self._commit)
         self.execute = AsyncMock(side_effect=self._execute)
         self.exec = AsyncMock(side_effect=self._exec)
+        self.scalar = AsyncMock(return_value=None)
 
     async def _get(self, model_class: Type[SQLModel], key: Any):
         model_key = (model_class.__name__, key)
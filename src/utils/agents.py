@@ -0,0 +1,66 @@
+import logging
+from typing import Any, Callable, Dict
+
+from pydantic_ai import Agent
+from pydantic_ai.agent import AgentRunResult
+
+from .context_packer import estimate_tokens
+from .rate_limit import gemini_limiter
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "gemini-2.5-flash"
+
+
+class AgentRegistry:
+    """
+    Builds every pydantic-ai agent variant once and shares it across requests.
+
+    Agents keep no per-run state, so a single instance can serve concurrent runs;
+    whatever differs between runs goes into the run's prompt. Modules register a
+    factory per variant at import time, and the application builds them all at startup
+    so the model and provider resolution never happens on the request path.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Agent]] = {}
+        self._agents: Dict[str, Agent] = {}
+
+    def register(self, name: str, factory: Callable[[], Agent]):
+        assert name not in self._factories, f"Agent {name} is already registered"
+        self._factories[name] = factory
+
+    def get(self, name: str) -> Agent:
+        """Get an agent, building it on first use if it wasn't built at startup"""
+        agent = self._agents.get(name)
+        if agent is None:
+            agent = self._agents[name] = self._factories[name]()
+        return agent
+
+    async def run(self, name: str, prompt: str) -> AgentRunResult:
+        """Run an agent within the model provider's rate limits"""
+        estimate = estimate_tokens(prompt)
+        async with gemini_limiter.limit(estimate):
+            result = await self.get(name).run(prompt)
+        # Output and system prompt tokens are only known afterwards
+        usage = result.usage() if callable(result.usage) else result.usage
+        total_tokens = getattr(usage, "total_tokens", None)
+        if total_tokens:
+            gemini_limiter.charge(total_tokens - estimate)
+        return result
+
+    def build_all(self):
+        for name in self._factories:
+            self.get(name)
+        logger.info(f"Built {len(self._agents)} agents: {', '.join(self._agents)}")
+
+    def clear(self):
+        """Drop the built agents, e.g. after the model settings changed"""
+        self._agents.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"registered": list(self._factories), "built": list(self._agents)}
+
+
+# Shared by every module in the process
+agent_registry = AgentRegistry()
@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import count
+from typing import Any, Dict, FrozenSet, Iterable, List, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import KBTopic
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _CachedAnswer:
+    # Unit length, so the cosine distance is 1 - dot product
+    embedding: np.ndarray
+    topic_ids: FrozenSet[str]
+    script: str
+    relevant_docs: bool
+    kb_version: int
+    answer: str
+    expires_at: float
+    generation_seconds: float
+
+
+class AnswerCache:
+    """
+    Semantic cache of generated answers, keyed on the query embedding.
+
+    A query within `max_distance` (cosine) of a cached query gets the cached answer,
+    as long as it is written in the same script (answers follow the user's language),
+    was answered with the same prompt (with or without relevant documentation), the
+    knowledge base version didn't change and retrieval returned the same topics.
+    The KB version is bumped by this process's document loader, and by a background
+    check of the topic table every `kb_check_interval` seconds, which catches KB
+    changes made by other replicas.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1000,
+        max_distance: float = 0.05,
+        ttl: float = 24 * 3600,
+        kb_check_interval: float = 30.0,
+    ):
+        self.configure(max_size, max_distance, ttl, kb_check_interval)
+        self.kb_version = 0
+        # Topic count and latest load time of the knowledge base, as last read
+        self._kb_fingerprint: Tuple[int, Any] | None = None
+        self._checker: asyncio.Task | None = None
+        self._ids = count()
+        self._entries: OrderedDict[int, _CachedAnswer] = OrderedDict()
+        # Stacked embeddings of the entries, rebuilt lazily after a change
+        self._matrix: np.ndarray | None = None
+        self._matrix_ids: List[int] = []
+
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._saved_seconds = 0.0
+
+    def configure(self, max_size: int, max_distance: float, ttl: float, kb_check_interval: float = 30.0):
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.kb_check_interval = kb_check_interval
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def bump_kb_version(self):
+        """Invalidate every cached answer, called when the knowledge base changes"""
+        self.kb_version += 1
+        self._entries.clear()
+        self._matrix = None
+        logger.info(f"Knowledge base version is now {self.kb_version}")
+
+    async def check_kb_version(self, session: AsyncSession):
+        """Bump the KB version when the topic table changed since the last check, e.g. on another replica"""
+        result = await session.exec(select(func.count(KBTopic.id), func.max(KBTopic.start_time)))
+        fingerprint = tuple(result.one())
+        if self._kb_fingerprint is not None and fingerprint != self._kb_fingerprint:
+            self.bump_kb_version()
+        self._kb_fingerprint = fingerprint
+
+    def start(self, async_session: async_sessionmaker[AsyncSession]):
+        """Check the knowledge base for changes every `kb_check_interval` seconds in the background"""
+        if self.enabled and self._checker is None:
+            self._checker = asyncio.create_task(
+                self._check_periodically(async_session), name="answer-cache"
+            )
+
+    async def stop(self):
+        if self._checker is not None:
+            self._checker.cancel()
+            await asyncio.gather(self._checker, return_exceptions=True)
+            self._checker = None
+
+    async def _check_periodically(self, async_session: async_sessionmaker[AsyncSession]):
+        while True:
+            try:
+                async with async_session() as session:
+                    await self.check_kb_version(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed checking the knowledge base version: {e}")
+            await asyncio.sleep(self.kb_check_interval)
+
+    def lookup(
+        self,
+        embedding: List[float],
+        topic_ids: Iterable[str],
+        script: str,
+        relevant_docs: bool,
+    ) -> str | None:
+        """
+        Find the cached answer of a near-identical query
+        :param embedding: Embedding of the (rephrased) query
+        :param topic_ids: IDs of the topics retrieved for the query
+        :param script: Script of the user's message, see `utils.language.dominant_script`
+        :param relevant_docs: Whether the retrieved topics are relevant enough to answer from
+        :return: The cached answer, or None
+        """
+        if not self.enabled or not self._entries:
+            self.misses += 1
+            return None
+
+        if self._matrix is None:
+            self._matrix_ids = list(self._entries)
+            self._matrix = np.stack([self._entries[i].embedding for i in self._matrix_ids])
+        distances = 1.0 - self._matrix @ _unit(embedding)
+
+        # Evicting invalidates the matrix, keep scanning the candidates of this one
+        matrix_ids = self._matrix_ids
+        for index in np.argsort(distances):
+            if distances[index] > self.max_distance:
+                break
+            entry_id = matrix_ids[index]
+            entry = self._entries[entry_id]
+            if entry.script != script or entry.relevant_docs != relevant_docs:
+                continue
+            if (
+                entry.kb_version != self.kb_version
+                or entry.topic_ids != frozenset(topic_ids)
+                or entry.expires_at <= time.monotonic()
+            ):
+                # A stale neighbour mustn't hide a valid entry further away
+                self.stale += 1
+                self._evict(entry_id)
+                continue
+            self.hits += 1
+            self._saved_seconds += entry.generation_seconds
+            self._entries.move_to_end(entry_id)
+            return entry.answer
+
+        self.misses += 1
+        return None
+
+    def store(
+        self,
+        embedding: List[float],
+        topic_ids: Iterable[str],
+        script: str,
+        relevant_docs: bool,
+        answer: str,
+        generation_seconds: float = 0.0,
+    ):
+        """
+        Cache a generated answer
+        :param generation_seconds: How long generating the answer took, reported as saved on every hit
+        """
+        if not self.enabled:
+            return
+        self._entries[next(self._ids)] = _CachedAnswer(
+            embedding=_unit(embedding),
+            topic_ids=frozenset(topic_ids),
+            script=script,
+            relevant_docs=relevant_docs,
+            kb_version=self.kb_version,
+            answer=answer,
+            expires_at=time.monotonic() + self.ttl,
+            generation_seconds=generation_seconds,
+        )
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        self._matrix = None
+
+    def _evict(self, entry_id: int):
+        del self._entries[entry_id]
+        self._matrix = None
+
+    def clear(self):
+        """Forget every cached answer and reset the counters"""
+        self._entries.clear()
+        self._matrix = None
+        self.hits = self.misses = self.stale = 0
+        self._saved_seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "max_distance": self.max_distance,
+            "kb_version": self.kb_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": self._saved_seconds,
+        }
+
+
+def _unit(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+# Shared by every handler in the process, configured from the settings at startup
+answer_cache = AnswerCache()
@@ -1,13 +1,12 @@
 from typing import List
 
-from models import Message
+from models import BaseMessage
 from whatsapp.jid import parse_jid
 
 
-def chat2text(history: List[Message]) -> str:
-    return "\n".join(
-        [
-            f"{message.timestamp}: @{parse_jid(message.sender_jid).user}: {message.text}"
-            for message in history
-        ]
-    )
+def chat2line(message: BaseMessage) -> str:
+    return f"{message.timestamp}: @{parse_jid(message.sender_jid).user}: {message.text}"
+
+
+def chat2text(history: List[BaseMessage]) -> str:
+    return "\n".join([chat2line(message) for message in history])
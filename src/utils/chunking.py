@@ -0,0 +1,94 @@
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from .context_packer import estimate_tokens, split_passages
+
+# Separates the pages of extracted PDF text
+PAGE_BREAK = "\f"
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+)$")
+
+
+@dataclass
+class Chunk:
+    # Headings the chunk is under, outermost first
+    headings: List[str]
+    content: str
+    # Page the chunk starts on, 1-based
+    page: int
+    index: int
+
+    @property
+    def heading(self) -> str | None:
+        return " › ".join(self.headings) if self.headings else None
+
+
+def chunk_document(content: str, max_tokens: int = 400, overlap_tokens: int = 50) -> List[Chunk]:
+    """
+    Split a document into chunks of at most about `max_tokens` tokens.
+
+    Markdown headings ("# Title", as written by the .docx extraction) start a new
+    chunk, and chunks break between paragraphs (lines) or pages where possible;
+    paragraphs larger than a chunk are split on sentences. Consecutive chunks of a
+    section repeat up to `overlap_tokens` of the end of the previous chunk.
+    """
+    assert 0 <= overlap_tokens < max_tokens, "overlap_tokens must be smaller than max_tokens"
+
+    # (headings, [(paragraph, page)]) per section
+    sections: List[Tuple[List[str], List[Tuple[str, int]]]] = [([], [])]
+    headings: List[Tuple[int, str]] = []
+    for page, page_text in enumerate(content.split(PAGE_BREAK), start=1):
+        for line in page_text.split("\n"):
+            line = line.strip()
+            if not line:
+                continue
+            heading = _HEADING.match(line)
+            if heading is None:
+                for passage in split_passages(line, max_tokens):
+                    sections[-1][1].append((passage, page))
+                continue
+            level = len(heading.group(1))
+            headings = [(lvl, text) for lvl, text in headings if lvl < level]
+            headings.append((level, heading.group(2).strip()))
+            sections.append(([text for _, text in headings], []))
+
+    chunks: List[Chunk] = []
+    for section_headings, paragraphs in sections:
+        current: List[Tuple[str, int]] = []
+        tokens = 0
+        fresh = 0  # Paragraphs of the current chunk that aren't overlap
+        for paragraph, page in paragraphs:
+            size = estimate_tokens(paragraph)
+            if fresh and tokens + size > max_tokens:
+                chunks.append(_chunk(section_headings, current, len(chunks)))
+                current, tokens = _overlap(current, overlap_tokens, max_tokens - size)
+                fresh = 0
+            current.append((paragraph, page))
+            tokens += size
+            fresh += 1
+        if fresh:
+            chunks.append(_chunk(section_headings, current, len(chunks)))
+    return chunks
+
+
+def _overlap(paragraphs: List[Tuple[str, int]], overlap_tokens: int, room: int):
+    """Trailing paragraphs within the overlap, as long as the next paragraph still fits"""
+    tail: List[Tuple[str, int]] = []
+    tokens = 0
+    for paragraph, page in reversed(paragraphs):
+        size = estimate_tokens(paragraph)
+        if tokens + size > min(overlap_tokens, room):
+            break
+        tail.insert(0, (paragraph, page))
+        tokens += size
+    return tail, tokens
+
+
+def _chunk(headings: List[str], paragraphs: List[Tuple[str, int]], index: int) -> Chunk:
+    return Chunk(
+        headings=headings,
+        content="\n".join(paragraph for paragraph, _ in paragraphs),
+        page=paragraphs[0][1],
+        index=index,
+    )
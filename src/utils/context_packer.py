@@ -0,0 +1,181 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Protocol, Sequence
+
+_WORDS = re.compile(r"\w+")
+_PARAGRAPHS = re.compile(r"\n\s*\n")
+_SENTENCES = re.compile(r"(?<=[.!?])\s+")
+
+# Words too common to tell passages apart
+_STOPWORDS = frozenset(
+    "a an the how what when where which who why can could do does did is are was were "
+    "be to of in on for with from by and or not i my me we our you your it this that "
+    "there use using jeen".split()
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Local estimate of the number of LLM tokens of a text, no tokenizer needed.
+    About 4 characters per token for ASCII, non-Latin scripts tokenize much denser.
+    """
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars + 1) // 2
+
+
+def query_terms(text: str) -> set[str]:
+    return {word for word in _WORDS.findall(text.casefold()) if word not in _STOPWORDS}
+
+
+def split_passages(content: str, max_tokens: int = 150) -> List[str]:
+    """Split a document into paragraphs, long paragraphs into runs of sentences"""
+    passages = []
+    for paragraph in _PARAGRAPHS.split(content):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            passages.append(paragraph)
+            continue
+        current = ""
+        for sentence in _SENTENCES.split(paragraph):
+            candidate = f"{current} {sentence}".strip()
+            if current and estimate_tokens(candidate) > max_tokens:
+                passages.append(current)
+                candidate = sentence
+            current = candidate
+        if current:
+            passages.append(current)
+    return passages
+
+
+class PackableTopic(Protocol):
+    subject: str
+    content: str
+    distance: float
+
+
+@dataclass
+class PackedContext:
+    # One text per topic that made it into the context, most relevant first
+    topics: List[str] = field(default_factory=list)
+    tokens: int = 0
+    # Estimated tokens of the whole topics, before packing
+    original_tokens: int = 0
+    trimmed_topics: int = 0
+    dropped_topics: int = 0
+
+
+@dataclass
+class _Passage:
+    topic: int
+    position: int
+    text: str
+    tokens: int
+    score: float
+
+
+class ContextPacker:
+    """
+    Fits retrieved topics into a token budget for the generation prompt.
+
+    Topics are cut into passages, each scored by the topic's relevance and by how many
+    of the query's words it contains. Passages are taken greedily, best first, while
+    they fit the budget; a topic's subject always precedes its passages, which keep
+    their document order. A budget of 0 disables packing.
+    """
+
+    def __init__(self, budget_tokens: int = 3000, max_passage_tokens: int = 150):
+        self.configure(budget_tokens, max_passage_tokens)
+        self.clear()
+
+    def configure(self, budget_tokens: int, max_passage_tokens: int):
+        self.budget_tokens = budget_tokens
+        self.max_passage_tokens = max_passage_tokens
+
+    def pack(self, query: str, topics: Sequence[PackableTopic]) -> PackedContext:
+        """
+        :param query: Text to match passages against, e.g. the question and its rephrasing
+        :param topics: Retrieved topics, most relevant first
+        """
+        whole = [f"{topic.subject} \n {topic.content}" for topic in topics]
+        original_tokens = sum(estimate_tokens(text) for text in whole)
+        if self.budget_tokens <= 0 or original_tokens <= self.budget_tokens:
+            packed = PackedContext(whole, original_tokens, original_tokens)
+            self._record(packed)
+            return packed
+
+        terms = query_terms(query)
+        passages: List[_Passage] = []
+        for index, topic in enumerate(topics):
+            relevance = max(0.0, 1.0 - topic.distance)
+            for position, text in enumerate(split_passages(topic.content, self.max_passage_tokens)):
+                words = query_terms(text)
+                overlap = len(terms & words) / len(terms) if terms else 0.0
+                passages.append(
+                    _Passage(index, position, text, estimate_tokens(text), relevance * (1.0 + overlap))
+                )
+
+        selected: Dict[int, List[_Passage]] = {}
+        tokens = 0
+        # Earlier topics and passages win ties
+        for passage in sorted(passages, key=lambda p: -p.score):
+            cost = passage.tokens
+            if passage.topic not in selected:
+                cost += estimate_tokens(topics[passage.topic].subject) + 1
+            if tokens + cost > self.budget_tokens:
+                continue
+            selected.setdefault(passage.topic, []).append(passage)
+            tokens += cost
+
+        packed = PackedContext(original_tokens=original_tokens, tokens=tokens)
+        for index, topic in enumerate(topics):
+            chosen = sorted(selected.get(index, []), key=lambda p: p.position)
+            if not chosen:
+                packed.dropped_topics += 1
+                continue
+            if len(chosen) < sum(1 for p in passages if p.topic == index):
+                packed.trimmed_topics += 1
+            packed.topics.append(f"{topic.subject} \n " + "\n...\n".join(p.text for p in chosen))
+        self._record(packed)
+        return packed
+
+    def _record(self, packed: PackedContext):
+        self.packs += 1
+        self._tokens += packed.tokens
+        self._original_tokens += packed.original_tokens
+        self.trimmed_topics += packed.trimmed_topics
+        self.dropped_topics += packed.dropped_topics
+
+    def record_prompt(self, tokens: int):
+        """Record the estimated size of a whole generation prompt"""
+        self.prompts += 1
+        self._prompt_tokens += tokens
+        self.max_prompt_tokens = max(self.max_prompt_tokens, tokens)
+
+    def clear(self):
+        self.packs = 0
+        self.trimmed_topics = 0
+        self.dropped_topics = 0
+        self._tokens = 0
+        self._original_tokens = 0
+        self.prompts = 0
+        self._prompt_tokens = 0
+        self.max_prompt_tokens = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "budget_tokens": self.budget_tokens,
+            "packs": self.packs,
+            "average_context_tokens": self._tokens / self.packs if self.packs else 0.0,
+            "average_original_tokens": self._original_tokens / self.packs if self.packs else 0.0,
+            "trimmed_topics": self.trimmed_topics,
+            "dropped_topics": self.dropped_topics,
+            "prompts": self.prompts,
+            "average_prompt_tokens": self._prompt_tokens / self.prompts if self.prompts else 0.0,
+            "max_prompt_tokens": self.max_prompt_tokens,
+        }
+
+
+# Shared by every handler in the process, configured from the settings at startup
+context_packer = ContextPacker()
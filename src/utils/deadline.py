@@ -0,0 +1,167 @@
+import asyncio
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Dict, Iterator, Sequence, TypeVar
+
+from tenacity import RetryCallState
+
+from .context_packer import PackableTopic, estimate_tokens, split_passages
+
+T = TypeVar("T")
+
+# Monotonic time by which the current message must be answered
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the time budget of the current message runs out."""
+
+    pass
+
+
+@contextmanager
+def deadline(seconds: float | None) -> Iterator[None]:
+    """
+    Give the code within the block, and every task it starts, `seconds` to finish.
+    Nested deadlines can only shorten the budget. None or 0 sets no deadline.
+    """
+    if not seconds:
+        yield
+        return
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(at if outer is None else min(outer, at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left in the current budget, None without a deadline"""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def _out_of_time(retry_state: RetryCallState) -> bool:
+    left = remaining()
+    return left is not None and left <= (retry_state.upcoming_sleep or 0.0)
+
+
+def stop_at_deadline(retry_state: RetryCallState) -> bool:
+    """Tenacity stop condition: don't sleep into, or past, the deadline"""
+    if not _out_of_time(retry_state):
+        return False
+    answer_deadline.retries_cut += 1
+    return True
+
+
+def reraise_past_deadline(retry_state: RetryCallState) -> Any:
+    """
+    Tenacity retry_error_callback: re-raise the last error, as `DeadlineExceeded` when
+    the retries stopped because the budget ran out
+    """
+    error = retry_state.outcome.exception() if retry_state.outcome else None
+    if error is None:
+        return retry_state.outcome.result() if retry_state.outcome else None
+    if _out_of_time(retry_state) and not isinstance(error, DeadlineExceeded):
+        raise DeadlineExceeded() from error
+    raise error
+
+
+async def within_deadline(awaitable: Awaitable[T]) -> T:
+    """
+    Await with the time left in the budget
+    :raises DeadlineExceeded: When the budget runs out first
+    """
+    left = remaining()
+    if left is None:
+        return await awaitable
+    if left <= 0:
+        # Don't leave a coroutine that was never awaited behind
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded()
+    try:
+        async with asyncio.timeout(left):
+            return await awaitable
+    except TimeoutError as e:
+        raise DeadlineExceeded() from e
+
+
+class AnswerDeadline:
+    """
+    Time budget for answering one message, from its arrival to the reply.
+
+    `budget()` sets the deadline for everything the message goes through, LLM calls
+    run `within_deadline` and their retries stop before sleeping past it. When the
+    budget runs out the handler degrades instead of going silent: the raw message is
+    searched when rephrasing is out of time, and the best retrieved topic, or
+    `fallback_reply`, is sent when generation is.
+    """
+
+    def __init__(
+        self,
+        seconds: float = 60.0,
+        snippet_intro: str = "I couldn't put an answer together in time, but this from the documentation should help:",
+        fallback_reply: str = "Sorry, I couldn't answer in time. Please try asking again in a moment 🙏",
+        snippet_tokens: int = 200,
+    ):
+        self.configure(seconds, snippet_intro, fallback_reply, snippet_tokens)
+        self.clear()
+
+    def configure(self, seconds: float, snippet_intro: str, fallback_reply: str, snippet_tokens: int):
+        self.seconds = seconds
+        self.snippet_intro = snippet_intro
+        self.fallback_reply = fallback_reply
+        self.snippet_tokens = snippet_tokens
+
+    def budget(self):
+        """Deadline of the message being handled, a no-op with `seconds` 0"""
+        return deadline(self.seconds)
+
+    def record(self, stage: str):
+        """Count a stage that ran out of time and fell back"""
+        self.exceeded[stage] += 1
+
+    def fallback(self, topics: Sequence[PackableTopic]) -> str:
+        """
+        Reply without generation: the start of the most relevant topic
+        :param topics: Retrieved topics, most relevant first
+        """
+        if not topics:
+            self.fallbacks["reply"] += 1
+            return self.fallback_reply
+        self.fallbacks["snippet"] += 1
+        best = topics[0]
+        snippet = []
+        tokens = 0
+        for passage in split_passages(best.content, self.snippet_tokens):
+            tokens += estimate_tokens(passage)
+            if snippet and tokens > self.snippet_tokens:
+                break
+            snippet.append(passage)
+        text = "\n\n".join(snippet)
+        # A single sentence can still be too long, about 4 characters per token
+        if len(text) > self.snippet_tokens * 4:
+            text = text[: self.snippet_tokens * 4].rsplit(" ", 1)[0] + "…"
+        return f"{self.snippet_intro}\n\n{best.subject}\n{text}"
+
+    def clear(self):
+        self.exceeded: Counter[str] = Counter()
+        self.fallbacks: Counter[str] = Counter()
+        self.retries_cut = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "seconds": self.seconds,
+            "exceeded": dict(self.exceeded),
+            "fallbacks": dict(self.fallbacks),
+            "retries_cut": self.retries_cut,
+        }
+
+
+# Shared by every handler in the process, configured from the settings at startup
+answer_deadline = AnswerDeadline()
@@ -0,0 +1,171 @@
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+from voyageai.client_async import AsyncClient
+
+from models import QueryEmbedding
+from .voyage_embed_text import VOYAGE_MODEL, voyage_embed_text
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Case, whitespace and trailing punctuation don't change what a query asks for"""
+    return _WHITESPACE.sub(" ", text.casefold()).strip().rstrip("?!. ")
+
+
+class EmbeddingCache:
+    """
+    LRU cache with TTL of query embeddings, keyed on the embedding model and the
+    normalised query text. Optionally backed by the `queryembedding` table, so the
+    common questions don't need a Voyage round trip after a restart either.
+    """
+
+    # Stale persisted entries are deleted every this many writes
+    prune_every = 1000
+
+    def __init__(
+        self,
+        max_size: int = 2048,
+        ttl: float = 7 * 24 * 3600,
+        persist: bool = False,
+        model: str = VOYAGE_MODEL,
+    ):
+        self.configure(max_size, ttl, persist)
+        self.model = model
+        self._entries: OrderedDict[str, Tuple[float, List[float]]] = OrderedDict()
+        self._persisted_writes = 0
+
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self._embed_seconds = 0.0
+        self._db_hit_seconds = 0.0
+
+    def configure(self, max_size: int, ttl: float, persist: bool):
+        assert max_size > 0, "max_size must be positive"
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist = persist
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\n{normalize_query(text)}".encode()).hexdigest()
+
+    async def embed(
+        self, embedding_client: AsyncClient, text: str, session: AsyncSession | None = None
+    ) -> List[float]:
+        """
+        Embed a search query, from the cache when it was embedded recently
+        :param embedding_client: Voyage client, used on a cache miss
+        :param text: The query text
+        :param session: Session used to read and write the persisted cache [Optional]
+        :return: The query embedding
+        """
+        key = self.key(text)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, embedding = entry
+            if expires_at > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return embedding
+            del self._entries[key]
+
+        if self.persist and session is not None:
+            started = time.monotonic()
+            embedding = await self._load(session, key)
+            if embedding is not None:
+                self.db_hits += 1
+                self._db_hit_seconds += time.monotonic() - started
+                self._remember(key, embedding)
+                return embedding
+
+        started = time.monotonic()
+        embedding = (await voyage_embed_text(embedding_client, [text]))[0]
+        self.misses += 1
+        self._embed_seconds += time.monotonic() - started
+        self._remember(key, embedding)
+
+        if self.persist and session is not None:
+            await self._store(session, key, text, embedding)
+        return embedding
+
+    def _remember(self, key: str, embedding: List[float]):
+        self._entries[key] = (time.monotonic() + self.ttl, embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def _load(self, session: AsyncSession, key: str) -> List[float] | None:
+        try:
+            # A savepoint, so a failure doesn't abort the caller's transaction
+            async with session.begin_nested():
+                row = await session.get(QueryEmbedding, key)
+        except Exception as e:
+            logger.warning(f"Failed reading the query embedding cache: {e}")
+            return None
+        if row is None or row.created_at < datetime.now(timezone.utc) - timedelta(seconds=self.ttl):
+            return None
+        return [float(x) for x in row.embedding]
+
+    async def _store(self, session: AsyncSession, key: str, text: str, embedding: List[float]):
+        now = datetime.now(timezone.utc)
+        stmt = insert(QueryEmbedding).values(
+            key=key, model=self.model, text=text, embedding=embedding, created_at=now
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["key"],
+            set_={"embedding": stmt.excluded.embedding, "created_at": stmt.excluded.created_at},
+        )
+        try:
+            # A savepoint, so a failure doesn't abort the caller's transaction
+            async with session.begin_nested():
+                await session.exec(stmt)
+                self._persisted_writes += 1
+                if self._persisted_writes % self.prune_every == 0:
+                    await session.exec(
+                        delete(QueryEmbedding).where(
+                            QueryEmbedding.created_at < now - timedelta(seconds=self.ttl)
+                        )
+                    )
+        except Exception as e:
+            logger.warning(f"Failed writing the query embedding cache: {e}")
+
+    def clear(self):
+        """Forget every cached embedding and reset the counters"""
+        self._entries.clear()
+        self.hits = self.db_hits = self.misses = 0
+        self._embed_seconds = self._db_hit_seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.db_hits + self.misses
+        average_embed = self._embed_seconds / self.misses if self.misses else 0.0
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "persist": self.persist,
+            "hits": self.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.db_hits) / lookups if lookups else 0.0,
+            "average_embed_seconds": average_embed,
+            # Estimated from the average latency of the Voyage calls we did make
+            "saved_seconds": (
+                self.hits * average_embed
+                + max(self.db_hits * average_embed - self._db_hit_seconds, 0.0)
+            ),
+        }
+
+
+# Shared by every handler in the process, configured from the settings at startup
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,35 @@
+import unicodedata
+
+# Unicode blocks of the scripts our users write in
+_SCRIPT_RANGES = (
+    ("hebrew", 0x0590, 0x05FF),
+    ("arabic", 0x0600, 0x06FF),
+    ("cyrillic", 0x0400, 0x04FF),
+)
+
+
+def dominant_script(text: str) -> str:
+    """
+    Script most of the letters of a text are written in: "latin", "hebrew",
+    "arabic", "cyrillic", "other", or "none" for text without letters
+    """
+    counts: dict[str, int] = {}
+    for char in text:
+        if not char.isalpha():
+            continue
+        code = ord(char)
+        script = "other"
+        if code < 0x0250:
+            script = "latin"
+        else:
+            for name, start, end in _SCRIPT_RANGES:
+                if start <= code <= end:
+                    script = name
+                    break
+            else:
+                if "LATIN" in unicodedata.name(char, ""):
+                    script = "latin"
+        counts[script] = counts.get(script, 0) + 1
+    if not counts:
+        return "none"
+    return max(counts, key=counts.get)
@@ -0,0 +1,181 @@
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterator, List
+
+import logfire
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Stages of the answer pipeline, in the order they run
+STAGES = (
+    "store_message",
+    "admission_wait",
+    "history",
+    "rephrase",
+    "speculative_wait",
+    "embed",
+    "search",
+    "generate",
+    "send",
+    "total",
+)
+
+
+@dataclass
+class RequestTrace:
+    """Structured record of one answered message"""
+
+    message_id: str | None = None
+    chat_jid: str | None = None
+    started_at: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    # Seconds per stage, see STAGES; retrieval adds its sub-stages
+    stages: Dict[str, float] = field(default_factory=dict)
+    # Outcome details, e.g. whether the answer came from the cache
+    fields: Dict[str, Any] = field(default_factory=dict)
+    _started: float = field(default_factory=time.monotonic, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        record = asdict(self)
+        del record["_started"]
+        return record
+
+
+class Histogram:
+    """Count and average of all samples, percentiles of the last `window`"""
+
+    def __init__(self, window: int):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = p95 = p99 = worst = 0.0
+        if self.samples:
+            samples = np.fromiter(self.samples, dtype=np.float64)
+            p50, p95, p99 = (float(p) for p in np.percentile(samples, [50, 95, 99]))
+            worst = float(samples.max())
+        return {
+            "count": self.count,
+            "average": self.total / self.count if self.count else 0.0,
+            "p50": p50,
+            "p95": p95,
+            "p99": p99,
+            "max": worst,
+        }
+
+
+_current: ContextVar[RequestTrace | None] = ContextVar("pipeline_trace", default=None)
+
+
+class PipelineLatency:
+    """
+    Per-stage latency of the answer pipeline.
+
+    Stages are timed with `stage(...)` and collected on the trace of the message being
+    answered, see `trace(...)`. When the trace ends, every stage is added to its
+    histogram (p50/p95/p99 over the last `window` samples, also exported to Logfire
+    as the `answer_pipeline.stage` histogram) and the trace is logged as a structured
+    record; the last `history` records are kept for `/metrics/requests`.
+    """
+
+    def __init__(self, window: int = 2048, history: int = 200):
+        self.configure(window, history)
+        self._metric = logfire.metric_histogram(
+            "answer_pipeline.stage", unit="s", description="Latency of answer pipeline stages"
+        )
+
+    def configure(self, window: int, history: int):
+        self.window = window
+        self._histograms: Dict[str, Histogram] = {}
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=history)
+
+    @staticmethod
+    def current() -> RequestTrace | None:
+        return _current.get()
+
+    def stages(self) -> Dict[str, float]:
+        """Stage timings of the current trace, a throwaway dict outside of one"""
+        trace = _current.get()
+        return trace.stages if trace is not None else {}
+
+    @contextmanager
+    def trace(self, **fields) -> Iterator[RequestTrace]:
+        """Collect the stages timed within the block into one record"""
+        trace = RequestTrace(fields=fields)
+        token = _current.set(trace)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.fields["error"] = type(e).__name__
+            raise
+        finally:
+            _current.reset(token)
+            if trace.message_id is not None:
+                self.finish(trace)
+            else:
+                # Messages that are only stored aren't answers, but their stages count
+                for name, seconds in trace.stages.items():
+                    self.observe(name, seconds)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            seconds = time.monotonic() - started
+            trace = _current.get()
+            if trace is not None:
+                trace.stages[name] = trace.stages.get(name, 0.0) + seconds
+            else:
+                self.observe(name, seconds)
+
+    def observe(self, name: str, seconds: float):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = Histogram(self.window)
+        histogram.record(seconds)
+        self._metric.record(seconds, {"stage": name})
+
+    def finish(self, trace: RequestTrace):
+        trace.stages["total"] = time.monotonic() - trace._started
+        for name, seconds in trace.stages.items():
+            self.observe(name, seconds)
+        record = trace.to_dict()
+        self._recent.append(record)
+        logger.info("Answer pipeline record", extra={"pipeline": record})
+        logfire.info("answer pipeline {message_id}", **record)
+
+    def recent(self, stage: str | None = None, min_seconds: float = 0.0, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Latest records, newest first
+        :param stage: Only records where this stage took at least `min_seconds`
+        """
+        records = []
+        for record in reversed(self._recent):
+            if stage is not None and record["stages"].get(stage, -1.0) < min_seconds:
+                continue
+            records.append(record)
+            if len(records) >= limit:
+                break
+        return records
+
+    def stats(self) -> Dict[str, Any]:
+        known = [s for s in STAGES if s in self._histograms]
+        extra = sorted(set(self._histograms) - set(STAGES))
+        return {name: self._histograms[name].stats() for name in known + extra}
+
+
+# Shared by every handler in the process, configured from the settings at startup
+pipeline_latency = PipelineLatency()
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict
+
+from .latency import Histogram, pipeline_latency
+
+logger = logging.getLogger(__name__)
+
+# Gemini sends its back-off hint in the error body, as a google.rpc.RetryInfo
+_RETRY_DELAY = re.compile(r"""retryDelay['"]?\s*:\s*['"](\d+(?:\.\d+)?)s""")
+
+
+def retry_after(error: BaseException) -> float | None:
+    """
+    Seconds a provider asked to wait before the next request, from a rate limit error
+    of httpx, the Voyage client or pydantic-ai
+    :return: The delay, 0 for a rate limit without a hint, None for any other error
+    """
+    response = getattr(error, "response", None)
+    status = (
+        getattr(error, "status_code", None)
+        or getattr(error, "http_status", None)
+        or getattr(response, "status_code", None)
+    )
+    if status != 429:
+        return None
+    headers = getattr(error, "headers", None) or getattr(response, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                at = parsedate_to_datetime(value)
+                return max(0.0, (at - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    delay = _RETRY_DELAY.search(str(getattr(error, "body", None) or ""))
+    return float(delay.group(1)) if delay else 0.0
+
+
+class RateLimiter:
+    """
+    Shared client-side limit of the requests to one provider.
+
+    Requests and tokens per minute are token buckets, holding up to a minute's worth,
+    and at most `max_concurrent` requests run at once; 0 disables a limit. Callers
+    queue in arrival order instead of failing and retrying on their own. When the
+    provider still answers 429, every caller pauses for its Retry-After (or
+    `default_retry_after` seconds without a hint). Time spent waiting is added to the
+    pipeline stage `rate_limit_<name>`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_concurrent: int = 0,
+        default_retry_after: float = 5.0,
+    ):
+        self.name = name
+        self.configure(requests_per_minute, tokens_per_minute, max_concurrent, default_retry_after)
+        self.clear()
+
+    def configure(
+        self,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        max_concurrent: int,
+        default_retry_after: float = 5.0,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrent = max_concurrent
+        self.default_retry_after = default_retry_after
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._queue = asyncio.Lock()
+        self._slots = asyncio.Semaphore(max_concurrent) if max_concurrent > 0 else None
+        self._in_flight = 0
+
+    @asynccontextmanager
+    async def limit(self, tokens: int = 0) -> AsyncIterator[None]:
+        """
+        Wait for a turn, then hold a concurrency slot for the duration of the block
+        :param tokens: Estimated tokens of the request, see `charge` to correct them
+        :raises: Whatever the block raises, rate limit errors also pause the limiter
+        """
+        started = time.monotonic()
+        if self._slots is not None:
+            await self._slots.acquire()
+        try:
+            await self._take(tokens)
+            self._record_wait(time.monotonic() - started)
+            self._in_flight += 1
+            try:
+                yield
+            except Exception as e:
+                delay = retry_after(e)
+                if delay is not None:
+                    self.pause(delay or self.default_retry_after)
+                raise
+            finally:
+                self._in_flight -= 1
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    async def _take(self, tokens: int):
+        # One caller at a time takes from the buckets, the others queue behind it
+        async with self._queue:
+            # A request larger than the bucket would never fit
+            needed = min(tokens, self.tokens_per_minute)
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._paused_until - now
+                if self.requests_per_minute > 0 and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+                if self.tokens_per_minute > 0 and self._tokens < needed:
+                    wait = max(wait, (needed - self._tokens) * 60 / self.tokens_per_minute)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.requests_per_minute > 0:
+                self._requests -= 1
+            if self.tokens_per_minute > 0:
+                self._tokens -= tokens
+            self.requests += 1
+            self.tokens += tokens
+
+    def _refill(self, now: float):
+        elapsed = now - self._refilled
+        self._refilled = now
+        self._requests = min(
+            float(self.requests_per_minute), self._requests + elapsed * self.requests_per_minute / 60
+        )
+        self._tokens = min(
+            float(self.tokens_per_minute), self._tokens + elapsed * self.tokens_per_minute / 60
+        )
+
+    def charge(self, tokens: int):
+        """Take the difference between a request's actual and estimated tokens, or give it back"""
+        if self.tokens_per_minute > 0:
+            self._refill(time.monotonic())
+            self._tokens = min(float(self.tokens_per_minute), self._tokens - tokens)
+        self.tokens += tokens
+
+    def pause(self, seconds: float):
+        """Hold every request for `seconds`, e.g. after a 429"""
+        self.throttled += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        logger.warning(f"{self.name} rate limited, pausing requests for {seconds:.1f}s")
+
+    def _record_wait(self, seconds: float):
+        self._waits.record(seconds)
+        if seconds > 0.001:
+            self.waited += 1
+            stages = pipeline_latency.stages()
+            key = f"rate_limit_{self.name}"
+            stages[key] = stages.get(key, 0.0) + seconds
+
+    def clear(self):
+        self.requests = 0
+        self.tokens = 0
+        self.waited = 0
+        self.throttled = 0
+        self._waits = Histogram(1024)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "max_concurrent": self.max_concurrent,
+            "requests": self.requests,
+            "in_flight": self._in_flight,
+            "waited": self.waited,
+            "throttled": self.throttled,
+            "paused_seconds": max(0.0, self._paused_until - time.monotonic()),
+            "wait_seconds": self._waits.stats(),
+        }
+
+
+# Shared by every client in the process, configured from the settings at startup
+gemini_limiter = RateLimiter("gemini")
+voyage_limiter = RateLimiter("voyage")
+whatsapp_limiter = RateLimiter("whatsapp")
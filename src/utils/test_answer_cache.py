@@ -0,0 +1,84 @@
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from utils.answer_cache import AnswerCache
+from utils.language import dominant_script
+
+
+def test_near_identical_queries_hit():
+    cache = AnswerCache(max_distance=0.05)
+    cache.store([1.0, 0.0], ["t1", "t2"], "latin", True, "Click New Agent")
+
+    assert cache.lookup([0.99, 0.05], ["t2", "t1"], "latin", True) == "Click New Agent"
+    assert cache.lookup([0.0, 1.0], ["t1", "t2"], "latin", True) is None
+    # Answers follow the user's language
+    assert cache.lookup([1.0, 0.0], ["t1", "t2"], "hebrew", True) is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+
+
+def test_changed_topics_and_kb_version_invalidate():
+    cache = AnswerCache()
+    cache.store([1.0, 0.0], ["t1"], "latin", True, "old answer")
+
+    assert cache.lookup([1.0, 0.0], ["t1", "t3"], "latin", True) is None
+    assert cache.stats()["stale"] == 1
+    assert cache.stats()["size"] == 0
+
+    cache.store([1.0, 0.0], ["t1"], "latin", True, "old answer")
+    cache.bump_kb_version()
+    assert cache.lookup([1.0, 0.0], ["t1"], "latin", True) is None
+
+
+def test_stale_entries_dont_hide_the_next_candidate():
+    cache = AnswerCache(max_distance=0.05)
+    cache.store([0.99, 0.05], ["t1"], "latin", True, "valid answer")
+    cache.store([1.0, 0.0], ["t1"], "latin", True, "expired answer")
+    cache._entries[next(reversed(cache._entries))].expires_at = 0.0
+
+    assert cache.lookup([1.0, 0.0], ["t1"], "latin", True) == "valid answer"
+    stats = cache.stats()
+    assert (stats["hits"], stats["stale"], stats["size"]) == (1, 1, 1)
+
+
+def test_answers_without_relevant_docs_are_kept_apart():
+    cache = AnswerCache()
+    cache.store([1.0, 0.0], ["t1"], "latin", False, "Please contact support")
+
+    assert cache.lookup([1.0, 0.0], ["t1"], "latin", True) is None
+    assert cache.lookup([1.0, 0.0], ["t1"], "latin", False) == "Please contact support"
+
+
+@pytest.mark.asyncio
+async def test_kb_changes_of_other_replicas_invalidate():
+    cache = AnswerCache()
+    loaded = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    session = MagicMock()
+    session.exec = AsyncMock(return_value=MagicMock(one=MagicMock(return_value=(10, loaded))))
+
+    await cache.check_kb_version(session)
+    cache.store([1.0, 0.0], ["t1"], "latin", True, "old answer")
+    await cache.check_kb_version(session)
+    assert cache.lookup([1.0, 0.0], ["t1"], "latin", True) == "old answer"
+
+    # Another replica reloaded the documents
+    session.exec.return_value.one.return_value = (10, datetime(2026, 1, 2, tzinfo=timezone.utc))
+    await cache.check_kb_version(session)
+    assert cache.kb_version == 1
+    assert cache.lookup([1.0, 0.0], ["t1"], "latin", True) is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = AnswerCache(max_size=0)
+    cache.store([1.0], [], "latin", True, "answer")
+    assert cache.lookup([1.0], [], "latin", True) is None
+
+
+def test_dominant_script():
+    assert dominant_script("How do I create an agent?") == "latin"
+    assert dominant_script("איך יוצרים סוכן ב-Jeen?") == "hebrew"
+    assert dominant_script("123 ?!") == "none"
+
@@ -0,0 +1,58 @@
+from utils.chunking import PAGE_BREAK, chunk_document
+from utils.context_packer import estimate_tokens
+
+
+def test_headings_start_new_chunks():
+    content = "\n".join(
+        [
+            "# Workflow guide",
+            "Intro to workflows.",
+            "## What is WORKFLOW?",
+            "Workflow is an advanced component.",
+            "## Creating a WORKFLOW",
+            "Click New Workflow.",
+            "### Sharing",
+            "Share it from the settings.",
+        ]
+    )
+
+    chunks = chunk_document(content, max_tokens=100, overlap_tokens=10)
+
+    assert [c.heading for c in chunks] == [
+        "Workflow guide",
+        "Workflow guide › What is WORKFLOW?",
+        "Workflow guide › Creating a WORKFLOW",
+        "Workflow guide › Creating a WORKFLOW › Sharing",
+    ]
+    assert chunks[2].content == "Click New Workflow."
+    assert [c.index for c in chunks] == [0, 1, 2, 3]
+
+
+def test_long_sections_split_with_overlap():
+    paragraphs = [f"Paragraph {i} " + "word " * 30 for i in range(10)]
+
+    chunks = chunk_document("\n".join(paragraphs), max_tokens=100, overlap_tokens=45)
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(c.content) <= 100 for c in chunks)
+    # Every chunk repeats the last paragraph of the previous one
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.content.split("\n")[0] == previous.content.split("\n")[-1]
+    assert "Paragraph 9" in chunks[-1].content
+
+
+def test_page_numbers_and_oversized_paragraphs():
+    content = "Short first page." + PAGE_BREAK + "A sentence. " * 100
+
+    chunks = chunk_document(content, max_tokens=60, overlap_tokens=0)
+
+    assert chunks[0].page == 1
+    assert chunks[-1].page == 2
+    assert all(estimate_tokens(c.content) <= 60 for c in chunks)
+
+
+def test_document_without_headings_is_one_chunk_when_small():
+    chunks = chunk_document("Just one line.", max_tokens=400)
+
+    assert len(chunks) == 1
+    assert chunks[0].heading is None
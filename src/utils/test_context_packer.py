@@ -0,0 +1,77 @@
+from typing import NamedTuple
+
+from utils.context_packer import ContextPacker, estimate_tokens, split_passages
+
+
+class _Topic(NamedTuple):
+    subject: str
+    content: str
+    distance: float
+
+
+GUIDE = "\n\n".join(
+    [
+        "Jeen is an enterprise AI platform. " * 20,
+        "To create a workflow, open the Workflows page and click New Workflow.",
+        "Billing is handled by your account manager. " * 20,
+        "Workflows can be shared with your team from the workflow settings.",
+    ]
+)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd" * 10) == 10
+    # Hebrew tokenizes denser than English
+    assert estimate_tokens("שלום עולם") > estimate_tokens("hello wrld")
+
+
+def test_split_passages_breaks_long_paragraphs_on_sentences():
+    passages = split_passages("One. Two.\n\n" + "A long sentence here. " * 40, max_tokens=30)
+
+    assert passages[0] == "One. Two."
+    assert len(passages) > 2
+    assert all(estimate_tokens(p) <= 30 for p in passages[1:])
+
+
+def test_small_contexts_are_not_touched():
+    packer = ContextPacker(budget_tokens=1000)
+    packed = packer.pack("create a workflow", [_Topic("Intro", "Short text.", 0.2)])
+
+    assert packed.topics == ["Intro \n Short text."]
+    assert packed.trimmed_topics == packed.dropped_topics == 0
+
+
+def test_topics_that_dont_fit_are_dropped():
+    packer = ContextPacker(budget_tokens=30)
+    # A single sentence, it can't be cut any smaller
+    topics = [_Topic("User guide", GUIDE, 0.3), _Topic("Pricing", "billing " * 200, 0.6)]
+
+    packed = packer.pack("How do I create a workflow?", topics)
+
+    assert [t.split(" \n ")[0] for t in packed.topics] == ["User guide"]
+    assert packed.dropped_topics == 1
+
+
+def test_packs_best_matching_passages_within_budget():
+    packer = ContextPacker(budget_tokens=60)
+    topics = [_Topic("User guide", GUIDE, 0.3), _Topic("Pricing", "Billing. " * 200, 0.6)]
+
+    packed = packer.pack("How do I create a workflow?", topics)
+
+    assert packed.tokens <= 60
+    assert packed.topics[0].startswith("User guide")
+    assert "click New Workflow" in packed.topics[0]
+    assert "shared with your team" in packed.topics[0]
+    assert "account manager" not in packed.topics[0]
+    # The leftover budget goes to the less relevant topic
+    assert packed.topics[1].startswith("Pricing")
+    assert (packed.trimmed_topics, packed.dropped_topics) == (2, 0)
+    assert packer.stats()["average_original_tokens"] > 60
+
+
+def test_zero_budget_disables_packing():
+    packer = ContextPacker(budget_tokens=0)
+    packed = packer.pack("workflow", [_Topic("User guide", GUIDE, 0.3)])
+
+    assert packed.topics == [f"User guide \n {GUIDE}"]
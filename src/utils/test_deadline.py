@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from tenacity import retry, stop_after_attempt, wait_fixed
+
+from utils.deadline import (
+    AnswerDeadline,
+    DeadlineExceeded,
+    answer_deadline,
+    deadline,
+    remaining,
+    reraise_past_deadline,
+    stop_at_deadline,
+    within_deadline,
+)
+
+
+def test_nested_deadlines_only_shorten_the_budget():
+    assert remaining() is None
+    with deadline(10):
+        with deadline(100):
+            assert remaining() <= 10
+        with deadline(1):
+            assert remaining() <= 1
+    assert remaining() is None
+
+    with deadline(0):
+        assert remaining() is None
+
+
+@pytest.mark.asyncio
+async def test_within_deadline_times_out():
+    with deadline(0.05):
+        assert await within_deadline(asyncio.sleep(0, "done")) == "done"
+        with pytest.raises(DeadlineExceeded):
+            await within_deadline(asyncio.sleep(1))
+        # Already out of time, the call isn't even started
+        with pytest.raises(DeadlineExceeded):
+            await within_deadline(asyncio.sleep(0))
+
+
+@pytest.mark.asyncio
+async def test_retries_stop_before_sleeping_past_the_deadline():
+    calls = 0
+
+    @retry(
+        wait=wait_fixed(0.2),
+        stop=stop_after_attempt(6) | stop_at_deadline,
+        retry_error_callback=reraise_past_deadline,
+    )
+    async def flaky():
+        nonlocal calls
+        calls += 1
+        raise ConnectionError("provider down")
+
+    answer_deadline.clear()
+    with deadline(0.3):
+        with pytest.raises(DeadlineExceeded) as raised:
+            await flaky()
+    assert calls == 2
+    assert isinstance(raised.value.__cause__, ConnectionError)
+    assert answer_deadline.retries_cut == 1
+
+    # Without a deadline the attempts run out and the error is kept as is
+    calls = 0
+    flaky.retry.wait = wait_fixed(0)
+    with pytest.raises(ConnectionError):
+        await flaky()
+    assert calls == 6
+
+
+def test_fallback_replies_with_the_best_topic():
+    fallbacks = AnswerDeadline(snippet_intro="Intro", fallback_reply="Sorry", snippet_tokens=20)
+    topics = [
+        SimpleNamespace(subject="Uploading files", content="Open the Files tab.\n\nThen press Upload." + " More." * 50),
+        SimpleNamespace(subject="Other", content="Unrelated"),
+    ]
+
+    reply = fallbacks.fallback(topics)
+    assert reply.startswith("Intro\n\nUploading files\nOpen the Files tab.")
+    assert "Unrelated" not in reply
+    assert len(reply) < 120
+
+    assert fallbacks.fallback([]) == "Sorry"
+    fallbacks.record("generate")
+    assert fallbacks.stats()["fallbacks"] == {"snippet": 1, "reply": 1}
+    assert fallbacks.stats()["exceeded"] == {"generate": 1}
@@ -0,0 +1,86 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from models import QueryEmbedding
+from test_utils.mock_session import AsyncSessionMock, mock_session  # noqa
+from utils.embedding_cache import EmbeddingCache, normalize_query
+
+
+def _client(embedding):
+    client = AsyncMock()
+    client.embed = AsyncMock(
+        return_value=SimpleNamespace(embeddings=[embedding], total_tokens=3)
+    )
+    return client
+
+
+def test_normalize_query():
+    assert normalize_query("  How do I  create an Agent? ") == "how do i create an agent"
+
+
+@pytest.mark.asyncio
+async def test_repeat_questions_skip_voyage():
+    cache = EmbeddingCache(max_size=2)
+    client = _client([0.1, 0.2])
+
+    assert await cache.embed(client, "How do I create an agent?") == [0.1, 0.2]
+    assert await cache.embed(client, "how do I create an agent") == [0.1, 0.2]
+
+    client.embed.assert_awaited_once()
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_entries_expire_and_are_evicted():
+    cache = EmbeddingCache(max_size=1, ttl=0)
+    client = _client([0.1])
+
+    await cache.embed(client, "a")
+    await cache.embed(client, "a")
+    assert client.embed.await_count == 2
+
+    cache.configure(max_size=1, ttl=60, persist=False)
+    await cache.embed(client, "b")
+    assert len(cache._entries) == 1
+
+
+@pytest.mark.asyncio
+async def test_persisted_entries_survive_a_restart(mock_session: AsyncSessionMock):
+    cache = EmbeddingCache(persist=True)
+    client = _client([0.3])
+    stored = QueryEmbedding(
+        key=cache.key("upload documents"),
+        model=cache.model,
+        text="upload documents",
+        embedding=[0.5],
+        created_at=datetime.now(timezone.utc),
+    )
+    mock_session.get = AsyncMock(
+        side_effect=lambda model, key: stored if key == stored.key else None
+    )
+
+    assert await cache.embed(client, "Upload documents?", mock_session) == [0.5]
+    client.embed.assert_not_awaited()
+
+    # Misses are embedded and written back
+    assert await cache.embed(client, "create an agent", mock_session) == [0.3]
+    assert mock_session.exec.await_args.args[0].table.name == "queryembedding"
+    assert cache.stats()["db_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_reads_only_roll_back_their_savepoint(mock_session: AsyncSessionMock):
+    cache = EmbeddingCache(persist=True)
+    client = _client([0.3])
+    mock_session.get = AsyncMock(side_effect=ConnectionError("statement timeout"))
+    mock_session.begin_nested = MagicMock(wraps=mock_session.begin_nested)
+
+    assert await cache.embed(client, "create an agent", mock_session) == [0.3]
+    # One savepoint for the failed read, one for the write back
+    assert mock_session.begin_nested.call_count == 2
+    client.embed.assert_awaited_once()
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from utils.latency import PipelineLatency
+
+
+def test_trace_collects_stages_into_one_record():
+    latency = PipelineLatency()
+
+    with latency.trace() as trace:
+        with latency.stage("history"):
+            pass
+        latency.stages()["rephrase"] = 1.5
+        trace.message_id = "m1"
+        trace.fields["outcome"] = "answered"
+
+    (record,) = latency.recent()
+    assert record["message_id"] == "m1"
+    assert set(record["stages"]) == {"history", "rephrase", "total"}
+    assert record["fields"] == {"outcome": "answered"}
+    assert latency.stats()["rephrase"]["p50"] == 1.5
+
+
+def test_traces_without_an_answer_are_not_recorded():
+    latency = PipelineLatency()
+
+    with latency.trace():
+        with latency.stage("store_message"):
+            pass
+
+    assert latency.recent() == []
+    assert latency.stats()["store_message"]["count"] == 1
+
+
+def test_percentiles_and_slow_request_lookup():
+    latency = PipelineLatency()
+    for i in range(100):
+        with latency.trace() as trace:
+            trace.message_id = f"m{i}"
+            latency.stages()["generate"] = float(i)
+
+    stats = latency.stats()["generate"]
+    assert stats["count"] == 100
+    assert stats["p50"] == pytest.approx(49.5)
+    assert stats["p99"] == pytest.approx(98.01)
+    assert [r["message_id"] for r in latency.recent("generate", min_seconds=97)] == ["m99", "m98", "m97"]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_traces_stay_apart():
+    latency = PipelineLatency()
+
+    async def answer(message_id: str, seconds: float):
+        with latency.trace() as trace:
+            trace.message_id = message_id
+            with latency.stage("generate"):
+                await asyncio.sleep(seconds)
+
+    await asyncio.gather(answer("slow", 0.05), answer("fast", 0.0))
+
+    records = {r["message_id"]: r["stages"]["generate"] for r in latency.recent()}
+    assert records["slow"] > records["fast"]
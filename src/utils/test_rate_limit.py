@@ -0,0 +1,82 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from utils.rate_limit import RateLimiter, retry_after
+
+
+def test_retry_after_of_each_provider():
+    response = httpx.Response(429, headers={"Retry-After": "7"}, request=httpx.Request("POST", "http://x"))
+    assert retry_after(httpx.HTTPStatusError("", request=response.request, response=response)) == 7.0
+    # Voyage
+    assert retry_after(SimpleNamespace(http_status=429, headers={"retry-after": "3"})) == 3.0
+    # Gemini, through pydantic-ai
+    body = {"error": {"details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "12s"}]}}
+    assert retry_after(SimpleNamespace(status_code=429, body=body)) == 12.0
+    assert retry_after(SimpleNamespace(status_code=429, body=None)) == 0.0
+    assert retry_after(SimpleNamespace(status_code=500, body=None)) is None
+    assert retry_after(ValueError()) is None
+
+
+@pytest.mark.asyncio
+async def test_requests_beyond_the_bucket_queue():
+    # A burst of 2, then one request every 50 ms
+    limiter = RateLimiter("test", requests_per_minute=1200)
+    limiter._requests = 2.0
+
+    started = time.monotonic()
+    for _ in range(4):
+        async with limiter.limit():
+            pass
+    assert time.monotonic() - started >= 0.09
+    stats = limiter.stats()
+    assert stats["requests"] == 4
+    assert stats["waited"] == 2
+    assert stats["wait_seconds"]["max"] >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_tokens_and_concurrency():
+    limiter = RateLimiter("test", tokens_per_minute=60_000, max_concurrent=1)
+    async with limiter.limit(tokens=60_000):
+        assert limiter.stats()["in_flight"] == 1
+    # The actual usage was lower, the difference is given back
+    limiter.charge(-59_000)
+    assert limiter.tokens == 1000
+
+    started = time.monotonic()
+    async with limiter.limit(tokens=1000):
+        pass
+    assert time.monotonic() - started < 0.05
+
+    running = 0
+
+    async def call():
+        nonlocal running
+        async with limiter.limit():
+            running += 1
+            assert running == 1
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(call(), call(), call())
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_errors_pause_every_caller():
+    limiter = RateLimiter("test", default_retry_after=0.05)
+
+    with pytest.raises(RuntimeError):
+        async with limiter.limit():
+            error = RuntimeError("429")
+            error.status_code = 429
+            raise error
+    assert limiter.stats()["throttled"] == 1
+
+    started = time.monotonic()
+    async with limiter.limit():
+        pass
+    assert time.monotonic() - started >= 0.04
@@ -2,19 +2,26 @@ from typing import List
 
 from voyageai.client_async import AsyncClient
 
+from .context_packer import estimate_tokens
+from .rate_limit import voyage_limiter
+
+VOYAGE_MODEL = "voyage-3"
+
 
 async def voyage_embed_text(
     embedding_client: AsyncClient, input: List[str]
 ) -> List[List[float]]:
-    model_name = "voyage-3"
+    model_name = VOYAGE_MODEL
     batch_size = 128
     embeddings = []
     total_tokens = 0
 
     for i in range(0, len(input), batch_size):
-        res = await embedding_client.embed(
-            input[i : i + batch_size], model=model_name, input_type="document"
-        )
+        batch = input[i : i + batch_size]
+        estimate = sum(estimate_tokens(text) for text in batch)
+        async with voyage_limiter.limit(estimate):
+            res = await embedding_client.embed(batch, model=model_name, input_type="document")
+        voyage_limiter.charge(res.total_tokens - estimate)
         embeddings += res.embeddings
         total_tokens += res.total_tokens
     return embeddings
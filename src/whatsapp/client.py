@@ -1,5 +1,6 @@
 import base64
-from typing import Any, Dict, Optional
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Any, Dict, Optional
 from urllib.parse import urlparse
 
 import httpx
@@ -32,6 +33,9 @@ from .models import (
     CreateGroupResponse,
 )
 
+if TYPE_CHECKING:
+    from utils.rate_limit import RateLimiter
+
 
 class WhatsAppClient:
     def __init__(
@@ -40,6 +44,7 @@ class WhatsAppClient:
         username: Optional[str] = None,
         password: Optional[str] = None,
         timeout: float = httpx.Timeout(300.0),
+        rate_limiter: Optional["RateLimiter"] = None,
     ):
         """
         Initialize WhatsApp Client
@@ -49,6 +54,7 @@ class WhatsAppClient:
             username: Optional username for basic auth
             password: Optional password for basic auth
             timeout: Request timeout in seconds
+            rate_limiter: Optional limiter every POST (sends, reactions, ...) queues behind
         """
         # Validate and normalize base URL
         parsed_url = urlparse(base_url)
@@ -66,6 +72,8 @@ class WhatsAppClient:
             auth_str = base64.b64encode(f"{username}:{password}".encode()).decode()  # noqa
             headers["Authorization"] = f"Basic {auth_str}"
 
+        self.rate_limiter = rate_limiter
+
         # Initialize httpx client with configuration
         self.client = httpx.AsyncClient(
             base_url=self.base_url,
@@ -145,17 +153,19 @@ class WhatsAppClient:
             headers = {"Content-Type": "application/json"}
             json = None
 
-        response = await self.client.post(
-            path, json=json, data=data, files=files, headers=headers
-        )
-        try:
-            response.raise_for_status()
-        except httpx.HTTPStatusError as exc:
-            if response.content:
-                exc.args = (
-                    f"{exc.args[0]}. Response content: {response.text}",
-                ) + exc.args[1:]
-            raise
+        limit = self.rate_limiter.limit() if self.rate_limiter else nullcontext()
+        async with limit:
+            response = await self.client.post(
+                path, json=json, data=data, files=files, headers=headers
+            )
+            try:
+                response.raise_for_status()
+            except httpx.HTTPStatusError as exc:
+                if response.content:
+                    exc.args = (
+                        f"{exc.args[0]}. Response content: {response.text}",
+                    ) + exc.args[1:]
+                raise
         return response
 
     # App Operations
@@ -113,6 +113,7 @@ GroupServer = "g.us"
 LegacyUserServer = "c.us"
 BroadcastServer = "broadcast"
 HiddenUserServer = "lid"
+NewsletterServer = "newsletter"
 
 # Some JIDs that are contacted often
 EmptyJID = JID(user="")